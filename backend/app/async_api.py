@@ -0,0 +1,135 @@
+import asyncio
+import itertools
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Overloaded(RuntimeError):
+    """Trop de requêtes en cours : le client doit réessayer plus tard (HTTP 429 / WebSocket 1013)"""
+
+
+class AsyncDetector:
+    """
+    Façade asyncio de YOLOv8Detector et DimensionEstimationService : aucun appel bloquant
+    (YOLO, Canny / Hough, attente d'une estimation) n'est fait dans la boucle d'événements.
+    - le travail synchrone passe par un pool de max_workers threads dédié (et non l'exécuteur
+      par défaut, partagé avec le reste du serveur), sous le verrou du modèle YOLO
+    - contre-pression : au plus max_pending appels admis (en cours ou en file) ; au-delà,
+      wait=False lève Overloaded tout de suite, wait=True attend une place
+    - annulation : une coroutine annulée (client déconnecté) retire son appel de la file s'il
+      n'a pas encore démarré ; un appel déjà en cours va au bout mais son résultat est jeté
+    - les estimations de dimensions sont attendues via leur Future (asyncio.wrap_future),
+      sans interroger le service
+    """
+
+    def __init__(self, detector, max_workers=2, max_pending=4, detector_lock=None, estimate_timeout=10.0):
+        self.detector = detector
+        self.dimension_service = detector.dimension_service
+        self.detector_lock = detector_lock or threading.Lock()
+        self.max_pending = max_pending
+        self.estimate_timeout = estimate_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="async-detector")
+        self._slots = None  # asyncio.Semaphore, créé dans la boucle qui l'utilise
+        self._ids = itertools.count()
+
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.failed = 0
+
+    def _semaphore(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        return self._slots
+
+    async def run(self, fn, *args, wait=True):
+        """Exécute fn(*args) dans le pool, avec contre-pression et annulation"""
+        slots = self._semaphore()
+        if not wait and slots.locked():
+            self.rejected += 1
+            raise Overloaded(f"{self.max_pending} appels déjà en cours")
+        await slots.acquire()
+        self.in_flight += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            self.completed += 1
+            return result
+        except asyncio.CancelledError:
+            # run_in_executor annule aussi le Future du pool s'il n'a pas encore démarré
+            self.cancelled += 1
+            raise
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+            slots.release()
+
+    def _locked(self, fn, *args, **kwargs):
+        with self.detector_lock:
+            return fn(*args, **kwargs)
+
+    async def process_frame(self, frame, state=None, draw=False, wait=True):
+        """YOLOv8Detector.process_frame hors de la boucle d'événements"""
+        return await self.run(self._locked, self.detector.process_frame, frame, state, draw, wait=wait)
+
+    async def estimate(self, crop, camera=None):
+        """Dimensions d'un crop BGR (résultat du service, calibration de camera appliquée)"""
+        key = ("async", next(self._ids))
+        future = self.dimension_service.add_task(key, crop, camera)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), self.estimate_timeout)
+        finally:
+            self.dimension_service.ack_result(key)
+
+    async def measure(self, image, camera="upload", wait=False):
+        """
+        Détection + estimation des dimensions de tous les colis d'une image isolée.
+        Retourne (tracks, enregistrements de dimensions) ; lève Overloaded si le pool est saturé.
+        """
+        start = time.perf_counter()
+        # État propre à la requête : ses clés de tâche (stream_id unique) ne croisent jamais celles
+        # d'une autre requête, ni dans le service de dimensions ni dans le cache d'estimations
+        state = self.detector.create_stream_state(camera)
+        try:
+            _, tracks, records = await self.process_frame(image, state, False, wait=wait)
+
+            # Les estimations lancées par la détection : attendues sans bloquer la boucle
+            pending = [asyncio.wrap_future(future) for future in state.pending_estimation.values()]
+            if pending:
+                await asyncio.wait(pending, timeout=self.estimate_timeout)
+            # Fin de flux : les vues encore en collecte (multi-vues) sont soumises et attendues
+            records = records + await self.run(self.detector.drain_pending, state, self.estimate_timeout)
+        finally:
+            self._release(state)
+        logger.debug("Mesure d'une image: %d colis en %.0f ms", len(records),
+                     (time.perf_counter() - start) * 1000.0)
+        return tracks, records
+
+    def _release(self, state):
+        """Estimations encore en cours après la réponse (timeout, annulation) : résultats libérés dès leur arrivée"""
+        for track_id, future in state.pending_estimation.items():
+            key = state.task_key(track_id)
+            future.add_done_callback(lambda _, key=key: self.dimension_service.ack_result(key))
+        state.pending_estimation.clear()
+        state.views.clear()
+
+    def stats(self):
+        return {
+            'max_pending': self.max_pending,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'cancelled': self.cancelled,
+            'failed': self.failed,
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
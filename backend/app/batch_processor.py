@@ -0,0 +1,424 @@
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import queue
+import re
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v')
+
+# Mêmes champs que dimensions_data + provenance et temps de traitement
+FIELDS = ['source', 'frame_index', 'timestamp_s', 'id', 'length_cm', 'width_cm', 'height_cm',
+          'length_px', 'width_px', 'frame_ms', 'latency_ms', 'confidence', 'views']
+
+# Frames après une reprise pendant lesquelles les colis déjà écrits sont reconnus à leur box
+RESUME_MATCH_FRAMES = 5
+
+# Détecteur propre à chaque processus de travail
+_detector = None
+
+
+class RecordWriter:
+    """
+    Écriture tamponnée des enregistrements : CSV en ajout, ou une partie Parquet par vidage.
+    position()/restore() permettent de revenir au dernier point de reprise après une interruption.
+    """
+
+    def __init__(self, prefix, fmt="csv", buffer_size=500, fields=None):
+        self.prefix = prefix
+        self.fmt = fmt
+        self.fields = fields or FIELDS
+        self.buffer_size = buffer_size
+        self.rows = []
+        self.written = 0
+        if fmt == "parquet":
+            try:
+                import pyarrow
+                import pyarrow.parquet
+            except ImportError:
+                raise RuntimeError("La sortie Parquet nécessite le paquet pyarrow")
+            self._pa = pyarrow
+            self._pq = pyarrow.parquet
+
+    @property
+    def csv_path(self):
+        return f"{self.prefix}.csv"
+
+    def _parquet_parts(self):
+        directory, base = os.path.split(self.prefix)
+        pattern = re.compile(re.escape(base) + r"\.part(\d+)\.parquet$")
+        return sorted(os.path.join(directory, n) for n in os.listdir(directory or ".") if pattern.match(n))
+
+    def position(self):
+        """Position courante (octets du CSV ou nombre de parties Parquet)"""
+        if self.fmt == "parquet":
+            return len(self._parquet_parts())
+        return os.path.getsize(self.csv_path) if os.path.exists(self.csv_path) else 0
+
+    def restore(self, position):
+        """Supprime ce qui a été écrit après le dernier point de reprise"""
+        if self.fmt == "parquet":
+            for path in self._parquet_parts()[position:]:
+                os.remove(path)
+        elif os.path.exists(self.csv_path):
+            with open(self.csv_path, 'r+b') as f:
+                f.truncate(position)
+
+    def write(self, record):
+        self.rows.append(record)
+        if len(self.rows) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        if self.fmt == "parquet":
+            columns = {field: [row.get(field) for row in self.rows] for field in self.fields}
+            part = f"{self.prefix}.part{self.position():05d}.parquet"
+            self._pq.write_table(self._pa.table(columns), part)
+        else:
+            new_file = not os.path.exists(self.csv_path) or os.path.getsize(self.csv_path) == 0
+            with open(self.csv_path, 'a', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames=self.fields, extrasaction='ignore')
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(self.rows)
+        self.written += len(self.rows)
+        self.rows = []
+
+
+class Checkpoint:
+    """Point de reprise d'une unité de travail (écriture atomique)"""
+
+    def __init__(self, path):
+        self.path = path
+        self.data = {'done': False, 'frames_done': 0, 'position': 0, 'records': 0}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data.update(json.load(f))
+
+    def save(self, **values):
+        self.data.update(values)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self.data, f)
+        os.replace(tmp_path, self.path)
+
+
+def unit_name(path, suffix=""):
+    return re.sub(r'[^\w.-]+', '_', os.path.abspath(path).strip(os.sep)) + suffix
+
+
+def build_work_units(inputs, chunk_size):
+    """Une unité par vidéo, et des paquets de chunk_size images par dossier"""
+    units = []
+    for path in inputs:
+        if os.path.isdir(path):
+            videos = sorted(os.path.join(path, n) for n in os.listdir(path) if n.lower().endswith(VIDEO_EXTENSIONS))
+            images = sorted(os.path.join(path, n) for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+            units.extend(('video', video, unit_name(video)) for video in videos)
+            for i in range(0, len(images), chunk_size):
+                units.append(('images', images[i:i + chunk_size], unit_name(path, f"_{i // chunk_size:05d}")))
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            units.append(('video', path, unit_name(path)))
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            units.append(('images', [path], unit_name(path)))
+    return units
+
+
+def _init_worker(model_path, tracker_config, torch_threads, multi_view=False):
+    """Charge les modèles une seule fois par processus"""
+    global _detector
+    import torch
+    from yolov8 import YOLOv8Detector
+
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    from debug_writer import DebugImageWriter
+    # Pas d'images de debug des ROI depuis les processus du traitement hors ligne
+    _detector = YOLOv8Detector(model_path, tracker_config, fusion=multi_view,
+                               debug_writer=DebugImageWriter(enabled=False))
+
+
+def _read_video(path, start_frame, frames, stop_event):
+    """Décodage anticipé dans un thread : (index, timestamp_s, frame), puis None"""
+    cap = cv2.VideoCapture(path)
+    if start_frame:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+    index = start_frame
+    try:
+        while not stop_event.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.put((index, cap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0, frame))
+            index += 1
+    finally:
+        cap.release()
+        frames.put(None)
+
+
+def _box_iou(box, boxes):
+    """IoU d'une box (4,) avec des boxes (N, 4), x1, y1, x2, y2"""
+    ix = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    iy = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = ix * iy
+    union = (box[2] - box[0]) * (box[3] - box[1]) + (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]) - inter
+    return inter / np.maximum(union, 1e-6)
+
+
+def _written_boxes(state):
+    """Boxes des colis déjà écrits encore visibles à la dernière détection"""
+    boxes = []
+    for track_id in state.last_tracks[:, 4].astype(np.int64).tolist():
+        slot = state.tracks.slot(track_id)
+        if slot is not None and state.tracks.sent[slot]:
+            boxes.append(state.tracks.bboxes[slot].tolist())
+    return boxes
+
+
+def _match_written(state, boxes, threshold=0.5):
+    """
+    Tracks (nouveaux IDs après la reprise) qui recouvrent la box d'un colis déjà écrit :
+    marqués envoyés, ils ne sont plus estimés ; leurs IDs sont retournés
+    """
+    matched = []
+    for track_id in state.last_tracks[:, 4].astype(np.int64).tolist():
+        slot = state.tracks.slot(track_id)
+        if slot is None or state.tracks.sent[slot]:
+            continue
+        if _box_iou(state.tracks.bboxes[slot].astype(np.float32), boxes).max() >= threshold:
+            state.tracks.sent[slot] = True
+            matched.append(track_id)
+    return matched
+
+
+def process_video(path, name, options):
+    checkpoint = Checkpoint(os.path.join(options['output_dir'], name + ".checkpoint.json"))
+    if checkpoint.data['done']:
+        return {'unit': name, 'skipped': True, 'frames': 0, 'records': 0, 'media_seconds': 0.0}
+
+    writer = RecordWriter(os.path.join(options['output_dir'], name), options['format'], options['buffer_size'])
+    writer.restore(checkpoint.data['position'])
+    start_frame = checkpoint.data['frames_done']
+
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    cap.release()
+    state = _detector.create_stream_state(name, frame_rate=int(round(fps)))
+
+    frames = queue.Queue(maxsize=options['decode_ahead'])
+    stop_event = threading.Event()
+    reader = threading.Thread(target=_read_video, args=(path, start_frame, frames, stop_event), daemon=True)
+    reader.start()
+
+    # ByteTrack repart à vide à la reprise : les colis déjà écrits encore visibles au point de
+    # reprise reviennent avec de nouveaux track IDs. Reconnus à leur box sur les premières frames,
+    # leurs mesures (y compris une estimation déjà lancée) ne sont pas réécrites.
+    written_boxes = np.asarray(checkpoint.data.get('written_boxes', []), dtype=np.float32).reshape(-1, 4)
+    duplicates = set()
+
+    processed = 0
+    records = checkpoint.data['records']
+    last_index = start_frame - 1
+    checkpoint_due = None  # frame à laquelle un point de reprise est attendu
+    try:
+        while True:
+            item = frames.get()
+            if item is None:
+                break
+            index, timestamp_s, frame = item
+
+            start = time.perf_counter()
+            _, _, dimensions = _detector.process_frame(frame, state, draw=False)
+            dimensions += _detector.drain_pending(state)
+            frame_ms = (time.perf_counter() - start) * 1000.0
+            if len(written_boxes) and processed < RESUME_MATCH_FRAMES:
+                duplicates.update(_match_written(state, written_boxes))
+            dimensions = [record for record in dimensions if record['id'] not in duplicates]
+
+            for record in dimensions:
+                writer.write(dict(record, source=path, frame_index=index,
+                                  timestamp_s=round(timestamp_s, 3), frame_ms=round(frame_ms, 2)))
+            records += len(dimensions)
+            processed += 1
+            last_index = index
+
+            # Point de reprise seulement sans estimation en cours : à la reprise, les frames déjà
+            # comptées sont sautées, un colis en attente serait perdu. Si le flux n'est jamais au repos,
+            # les estimations sont attendues (et les vues en collecte soumises) au bout d'une période.
+            if processed % options['checkpoint_every'] == 0:
+                checkpoint_due = processed
+            if checkpoint_due is not None:
+                if state.pending_estimation or state.views:
+                    if processed - checkpoint_due < options['checkpoint_every']:
+                        continue
+                    for record in _detector.drain_pending(state, timeout=options['drain_timeout']):
+                        if record['id'] in duplicates:
+                            continue
+                        writer.write(dict(record, source=path, frame_index=index,
+                                          timestamp_s=round(timestamp_s, 3)))
+                        records += 1
+                    if state.pending_estimation:
+                        continue  # estimation plus longue que drain_timeout : prochaine frame
+                writer.flush()
+                checkpoint.save(frames_done=index + 1, position=writer.position(), records=records,
+                                written_boxes=_written_boxes(state))
+                checkpoint_due = None
+    finally:
+        stop_event.set()
+
+    # Estimations encore en cours à la fin de la vidéo
+    for record in _detector.drain_pending(state, timeout=options['drain_timeout']):
+        if record['id'] in duplicates:
+            continue
+        writer.write(dict(record, source=path, frame_index=last_index))
+        records += 1
+    writer.flush()
+    checkpoint.save(done=True, frames_done=last_index + 1, position=writer.position(), records=records)
+    return {'unit': name, 'skipped': False, 'frames': processed, 'records': records,
+            'media_seconds': processed / fps}
+
+
+def process_images(paths, name, options, batch_size=8):
+    """
+    Un paquet d'images : chaque détection est estimée indépendamment. Le point de reprise n'est
+    écrit qu'une fois le paquet entier traité : un paquet interrompu est repris depuis le début
+    (ses lignes déjà écrites sont retirées par RecordWriter.restore).
+    """
+    checkpoint = Checkpoint(os.path.join(options['output_dir'], name + ".checkpoint.json"))
+    if checkpoint.data['done']:
+        return {'unit': name, 'skipped': True, 'frames': 0, 'records': 0, 'media_seconds': 0.0}
+
+    writer = RecordWriter(os.path.join(options['output_dir'], name), options['format'], options['buffer_size'])
+    writer.restore(checkpoint.data['position'])
+    service = _detector.dimension_service
+    records = 0
+
+    for i in range(0, len(paths), batch_size):
+        batch_paths = paths[i:i + batch_size]
+        images = [cv2.imread(p) for p in batch_paths]
+        loaded = [(p, img) for p, img in zip(batch_paths, images) if img is not None]
+        if not loaded:
+            continue
+
+        start = time.perf_counter()
+        results = _detector.model.predict([img for _, img in loaded], conf=0.5, iou=0.4, verbose=False)
+        frame_ms = (time.perf_counter() - start) * 1000.0 / len(loaded)
+
+        # Chaque détection d'une image est estimée indépendamment (pas de tracking entre images)
+        pending = []
+        for (path, image), result in zip(loaded, results):
+            boxes = result.boxes.xyxy.cpu().numpy()
+            boxes = boxes[result.boxes.conf.cpu().numpy() >= 0.5]
+            for box_index, (x1, y1, x2, y2) in enumerate(_detector.expand_bounding_boxes(boxes, image.shape).tolist()):
+                crop = image[y1:y2, x1:x2]
+                if crop.size == 0:
+                    continue
+                future = service.add_task((name, path, box_index), crop)
+                pending.append((path, box_index, x2 - x1, y2 - y1, future))
+
+        for path, box_index, w, h, future in pending:
+            try:
+                result = future.result(timeout=options['drain_timeout'])
+            except Exception:
+                continue
+            service.ack_result((name, path, box_index))
+            record = _detector.dimensions_record(box_index, result, w, h)
+            if record is not None:
+                writer.write(dict(record, source=path, frame_index=0, timestamp_s=0.0, frame_ms=round(frame_ms, 2)))
+                records += 1
+
+    writer.flush()
+    checkpoint.save(done=True, frames_done=len(paths), position=writer.position(), records=records)
+    return {'unit': name, 'skipped': False, 'frames': len(paths), 'records': records, 'media_seconds': 0.0}
+
+
+def run_unit(unit, options):
+    kind, target, name = unit
+    start = time.perf_counter()
+    if kind == 'video':
+        summary = process_video(target, name, options)
+    else:
+        summary = process_images(target, name, options)
+    summary['elapsed'] = time.perf_counter() - start
+    return summary
+
+
+def _run_unit_star(args):
+    return run_unit(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Traitement hors ligne de vidéos / dossiers d'images vers un jeu de données de dimensions")
+    parser.add_argument("inputs", nargs="+", help="Fichiers vidéo, images ou dossiers")
+    parser.add_argument("--output-dir", required=True, help="Dossier de sortie (fichiers par unité + points de reprise)")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--model", default=os.path.join(os.path.dirname(__file__), "../models/best.pt"))
+    parser.add_argument("--tracker", default=os.path.join(os.path.dirname(__file__), "bytetrack.yaml"))
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--torch-threads", type=int, default=0,
+                        help="Threads PyTorch par processus (0 = cœurs / workers)")
+    parser.add_argument("--decode-ahead", type=int, default=32, help="Frames décodées à l'avance par vidéo")
+    parser.add_argument("--chunk-size", type=int, default=500,
+                        help="Images par unité de travail (point de reprise une fois l'unité entière traitée)")
+    parser.add_argument("--buffer-size", type=int, default=500, help="Enregistrements tamponnés avant écriture")
+    parser.add_argument("--checkpoint-every", type=int, default=300, help="Frames entre deux points de reprise")
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    parser.add_argument("--multi-view", action="store_true",
+                        help="Fusion des meilleures vues de chaque colis au lieu d'un seul crop (vidéos)")
+    args = parser.parse_args()
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    units = build_work_units(args.inputs, args.chunk_size)
+    if not units:
+        print("Aucune vidéo ni image trouvée")
+        return
+
+    torch_threads = args.torch_threads or max(1, (os.cpu_count() or 1) // args.workers)
+    options = {
+        'output_dir': args.output_dir,
+        'format': args.format,
+        'buffer_size': args.buffer_size,
+        'decode_ahead': args.decode_ahead,
+        'checkpoint_every': args.checkpoint_every,
+        'drain_timeout': args.drain_timeout,
+    }
+
+    print(f"{len(units)} unités de travail, {args.workers} processus x {torch_threads} threads")
+    start = time.perf_counter()
+    frames = records = 0
+    media_seconds = 0.0
+
+    context = mp.get_context("spawn")
+    with context.Pool(args.workers, initializer=_init_worker,
+                      initargs=(args.model, args.tracker, torch_threads, args.multi_view)) as pool:
+        for summary in pool.imap_unordered(_run_unit_star, [(unit, options) for unit in units]):
+            if summary['skipped']:
+                print(f"[déjà traité] {summary['unit']}")
+                continue
+            frames += summary['frames']
+            records += summary['records']
+            media_seconds += summary['media_seconds']
+            print(f"[ok] {summary['unit']}: {summary['frames']} frames, {summary['records']} colis, "
+                  f"{summary['frames'] / summary['elapsed']:.1f} frames/s")
+
+    elapsed = time.perf_counter() - start
+    print(f"Terminé: {frames} frames, {records} colis en {elapsed:.1f} s ({frames / elapsed:.1f} frames/s)")
+    if media_seconds:
+        print(f"Facteur temps réel (vidéos): x{media_seconds / elapsed:.2f}")
+
+
+if __name__ == "__main__":
+    main()
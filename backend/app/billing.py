@@ -0,0 +1,442 @@
+import csv
+import glob
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from instrumentation import BILLING_RECORDS, RateLimitedLog
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+hot_log = RateLimitedLog(logger)
+
+# Poids volumétrique (kg) = L × l × h (cm) / 5000
+VOLUMETRIC_DIVISOR = 5000.0
+
+FIELDS = ('parcel_id', 'stream_id', 'camera', 'track_id', 'seq', 'measured_at',
+          'length_cm', 'width_cm', 'height_cm', 'volumetric_weight_kg', 'actual_weight_kg',
+          'billable_weight_kg', 'confidence', 'views', 'calibration_version')
+
+def volumetric_weight(length_cm, width_cm, height_cm, divisor=VOLUMETRIC_DIVISOR):
+    """Poids volumétrique en kg"""
+    return length_cm * width_cm * height_cm / divisor
+
+def billable_weight(volumetric_kg, actual_kg=None):
+    """Poids facturé : le maximum du poids réel (s'il est connu) et du poids volumétrique"""
+    if actual_kg is None:
+        return volumetric_kg
+    return max(volumetric_kg, actual_kg)
+
+def billing_row(camera, stream_id, record, actual_weight_kg=None, divisor=VOLUMETRIC_DIVISOR):
+    """Ligne de facturation à partir d'un enregistrement de dimensions du détecteur"""
+    volumetric = volumetric_weight(record['length_cm'], record['width_cm'], record['height_cm'], divisor)
+    return {
+        'parcel_id': f"{stream_id}:{record['id']}",
+        'stream_id': stream_id,
+        'camera': camera,
+        'track_id': int(record['id']),
+        'seq': record.get('seq'),
+        'measured_at': time.time(),
+        'length_cm': record['length_cm'],
+        'width_cm': record['width_cm'],
+        'height_cm': record['height_cm'],
+        'volumetric_weight_kg': round(volumetric, 3),
+        'actual_weight_kg': actual_weight_kg,
+        'billable_weight_kg': round(billable_weight(volumetric, actual_weight_kg), 3),
+        'confidence': record.get('confidence'),
+        'views': record.get('views'),
+        'calibration_version': record.get('calibration_version'),
+    }
+
+def _matches(row, camera, since, until):
+    return ((camera is None or row['camera'] == camera)
+            and (since is None or row['measured_at'] >= since)
+            and (until is None or row['measured_at'] < until))
+
+class SQLiteBillingWriter:
+    """
+    Base SQLite en mode WAL : les lectures (API de facturation) ne bloquent pas l'écriture.
+    Un colis = une ligne (parcel_id unique), une nouvelle mesure du même colis la remplace.
+    """
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Connexion d'écriture réservée au thread d'écriture du BillingSink
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parcels ("
+            "parcel_id TEXT PRIMARY KEY, stream_id TEXT, camera TEXT, track_id INTEGER, seq INTEGER, "
+            "measured_at REAL, length_cm REAL, width_cm REAL, height_cm REAL, volumetric_weight_kg REAL, "
+            "actual_weight_kg REAL, billable_weight_kg REAL, confidence REAL, views INTEGER, "
+            "calibration_version INTEGER)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS parcels_measured_at ON parcels (measured_at)")
+        self._conn.commit()
+        updates = ", ".join(f"{field}=excluded.{field}" for field in FIELDS[1:])
+        self._upsert = (f"INSERT INTO parcels ({', '.join(FIELDS)}) VALUES ({', '.join('?' * len(FIELDS))}) "
+                        f"ON CONFLICT(parcel_id) DO UPDATE SET {updates}")
+
+    def write(self, rows):
+        with self._conn:
+            self._conn.executemany(self._upsert, [tuple(row[field] for field in FIELDS) for row in rows])
+
+    def _reader(self):
+        conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    @staticmethod
+    def _where(camera, since, until):
+        clauses, params = [], []
+        for clause, value in (("camera = ?", camera), ("measured_at >= ?", since), ("measured_at < ?", until)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def query(self, camera=None, since=None, until=None, limit=100, offset=0):
+        where, params = self._where(camera, since, until)
+        conn = self._reader()
+        try:
+            rows = conn.execute(f"SELECT * FROM parcels{where} ORDER BY measured_at DESC LIMIT ? OFFSET ?",
+                                params + [limit, offset]).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+    def summary(self, camera=None, since=None, until=None):
+        where, params = self._where(camera, since, until)
+        conn = self._reader()
+        try:
+            count, volumetric, billable = conn.execute(
+                f"SELECT COUNT(*), SUM(volumetric_weight_kg), SUM(billable_weight_kg) FROM parcels{where}",
+                params).fetchone()
+        finally:
+            conn.close()
+        return {'parcels': count, 'volumetric_weight_kg': round(volumetric or 0.0, 3),
+                'billable_weight_kg': round(billable or 0.0, 3)}
+
+    def close(self):
+        self._conn.close()
+
+class _FileBillingWriter(ABC):
+    """
+    Fichiers par jour de mesure ({prefix}-AAAAMMJJ...), en ajout seul. Une nouvelle mesure d'un colis
+    déjà écrit est ajoutée à la suite : la lecture garde la dernière ligne de chaque colis.
+    Une requête bornée (since / until) ne lit que les fichiers des jours concernés.
+    """
+    extension = None
+
+    def __init__(self, directory, prefix="billing"):
+        self.directory = os.path.abspath(directory)
+        self.prefix = prefix
+        os.makedirs(self.directory, exist_ok=True)
+        # Lectures (threads de l'API) et réécritures de fichiers (thread d'écriture) exclusives
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _day(timestamp):
+        return datetime.fromtimestamp(timestamp).strftime("%Y%m%d")
+
+    def _by_day(self, rows):
+        """Lignes regroupées par jour de mesure : le nom du fichier suffit à filtrer une période"""
+        days = OrderedDict()
+        for row in rows:
+            days.setdefault(self._day(row['measured_at']), []).append(row)
+        return days
+
+    def _files(self, since=None, until=None):
+        """Fichiers des jours [since, until] (tous sans borne), dans l'ordre d'écriture"""
+        first = self._day(since) if since is not None else None
+        last = self._day(until) if until is not None else None
+        files = []
+        for path in sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.{self.extension}"))):
+            day = os.path.basename(path)[len(self.prefix) + 1:len(self.prefix) + 9]
+            if (first is None or day >= first) and (last is None or day <= last):
+                files.append(path)
+        return files
+
+    @abstractmethod
+    def write(self, rows):
+        """Ajoute un lot de lignes"""
+
+    @abstractmethod
+    def _read(self, path):
+        """Lignes d'un fichier, dans l'ordre d'écriture"""
+
+    def _latest(self, camera, since, until):
+        latest = OrderedDict()
+        with self._lock:
+            for path in self._files(since, until):
+                for row in self._read(path):
+                    latest.pop(row['parcel_id'], None)
+                    latest[row['parcel_id']] = row
+        return [row for row in latest.values() if _matches(row, camera, since, until)]
+
+    def query(self, camera=None, since=None, until=None, limit=100, offset=0):
+        rows = sorted(self._latest(camera, since, until), key=lambda row: row['measured_at'], reverse=True)
+        return rows[offset:offset + limit]
+
+    def summary(self, camera=None, since=None, until=None):
+        rows = self._latest(camera, since, until)
+        return {'parcels': len(rows),
+                'volumetric_weight_kg': round(sum(row['volumetric_weight_kg'] for row in rows), 3),
+                'billable_weight_kg': round(sum(row['billable_weight_kg'] for row in rows), 3)}
+
+    def close(self):
+        pass
+
+class CSVBillingWriter(_FileBillingWriter):
+    """CSV par jour, en ajout (fsync à chaque lot) ; un nouveau fichier du jour au-delà de max_bytes"""
+    extension = "csv"
+    NUMERIC = {'track_id': int, 'seq': int, 'views': int, 'calibration_version': int, 'measured_at': float,
+               'length_cm': float, 'width_cm': float, 'height_cm': float, 'volumetric_weight_kg': float,
+               'actual_weight_kg': float, 'billable_weight_kg': float, 'confidence': float}
+
+    def __init__(self, directory, prefix="billing", max_bytes=64 * 1024 * 1024):
+        super().__init__(directory, prefix)
+        self.max_bytes = max_bytes
+
+    def _current_file(self, day):
+        index = 0
+        while True:
+            path = os.path.join(self.directory, f"{self.prefix}-{day}-{index:03d}.csv")
+            if not os.path.exists(path) or os.path.getsize(path) < self.max_bytes:
+                return path
+            index += 1
+
+    def write(self, rows):
+        # Sous le verrou des lectures : query() / summary() ne voient jamais une ligne à moitié écrite
+        with self._lock:
+            for day, day_rows in self._by_day(rows).items():
+                path = self._current_file(day)
+                new_file = not os.path.exists(path)
+                with open(path, mode='a', newline='') as csv_file:
+                    writer = csv.DictWriter(csv_file, fieldnames=FIELDS)
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerows(day_rows)
+                    csv_file.flush()
+                    os.fsync(csv_file.fileno())
+
+    def _read(self, path):
+        with open(path, newline='') as csv_file:
+            for row in csv.DictReader(csv_file):
+                yield {field: (self.NUMERIC[field](value) if field in self.NUMERIC and value != ''
+                               else (None if value == '' else value))
+                       for field, value in row.items()}
+
+class ParquetBillingWriter(_FileBillingWriter):
+    """
+    Parquet par jour ; nécessite pyarrow. Le format ne permet pas l'ajout : chaque lot est écrit
+    dans une partie ({prefix}-AAAAMMJJ-pNNNNNN), fusionnée dans le fichier du jour ({prefix}-AAAAMMJJ)
+    dès que le jour compte compact_parts parties, et au premier lot d'un jour suivant. Le nombre
+    de fichiers reste ainsi d'un par jour (plus au plus compact_parts parties pour le jour en cours).
+    """
+    extension = "parquet"
+
+    def __init__(self, directory, prefix="billing", compact_parts=32):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Le format parquet nécessite pyarrow (pip install pyarrow)")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        super().__init__(directory, prefix)
+        self.compact_parts = compact_parts
+        self.compactions = 0
+
+    def _write_table(self, rows, path):
+        """Écriture atomique (fichier temporaire caché puis renommage)"""
+        tmp = os.path.join(self.directory, "." + os.path.basename(path) + ".tmp")
+        self._pq.write_table(self._pa.Table.from_pylist(rows), tmp)
+        os.replace(tmp, path)
+
+    def _parts(self, day):
+        return sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-{day}-p*.parquet")))
+
+    def write(self, rows):
+        # Parties et fusions sous le verrou des lectures (RLock : compact() le reprend)
+        with self._lock:
+            for day, day_rows in self._by_day(rows).items():
+                part = os.path.join(self.directory, f"{self.prefix}-{day}-p{time.time_ns():020d}.parquet")
+                self._write_table(day_rows, part)
+            today = self._day(time.time())
+            days = {os.path.basename(path)[len(self.prefix) + 1:len(self.prefix) + 9]
+                    for path in glob.glob(os.path.join(self.directory, f"{self.prefix}-*-p*.parquet"))}
+            for day in sorted(days):
+                if day < today or len(self._parts(day)) >= self.compact_parts:
+                    self.compact(day)
+
+    def compact(self, day):
+        """Fusionne le fichier d'un jour et ses parties (dernière ligne de chaque colis) en un seul fichier"""
+        with self._lock:
+            path = os.path.join(self.directory, f"{self.prefix}-{day}.parquet")
+            parts = self._parts(day)
+            latest = OrderedDict()
+            for source in ([path] if os.path.exists(path) else []) + parts:
+                for row in self._read(source):
+                    latest.pop(row['parcel_id'], None)
+                    latest[row['parcel_id']] = row
+            self._write_table(list(latest.values()), path)
+            # Une partie restée après une interruption ici est relue en double : sans effet (dédoublonnage)
+            for part in parts:
+                os.remove(part)
+            self.compactions += 1
+
+    def _read(self, path):
+        return self._pq.read_table(path).to_pylist()
+
+WRITERS = {
+    'sqlite': SQLiteBillingWriter,
+    'csv': CSVBillingWriter,
+    'parquet': ParquetBillingWriter,
+}
+
+class BillingSink:
+    """
+    Enregistrement durable des mesures pour la facturation, hors du chemin d'inférence :
+    - record() calcule poids volumétrique et poids facturé, met la ligne en attente et rend la main
+    - les lignes en attente sont dédoublonnées par colis (flux + track_id) : seule la dernière mesure
+      d'un track est gardée
+    - un thread écrit les lignes par lots (toutes les flush_interval secondes ou dès batch_size lignes),
+      en SQLite (WAL) ou en fichiers CSV / Parquet tournants ; un lot en échec est réessayé
+    - query() / summary() lisent le stockage, jamais le pipeline
+    Le parcel_id inclut l'identifiant du flux (StreamState.stream_id) : les track IDs repartant de 1
+    à chaque démarrage d'une caméra, les colis d'un redémarrage n'écrasent pas les précédents.
+    """
+
+    def __init__(self, path, backend="sqlite", flush_interval=1.0, batch_size=256,
+                 divisor=VOLUMETRIC_DIVISOR, **writer_options):
+        if backend not in WRITERS:
+            raise ValueError(f"Backend de facturation inconnu: {backend} (choix: {', '.join(WRITERS)})")
+        self.backend = backend
+        self.writer = WRITERS[backend](path, **writer_options)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.divisor = divisor
+
+        self._pending = OrderedDict()  # parcel_id -> ligne
+        self._cond = threading.Condition()
+        self._closed = False
+        self._flushing = False
+
+        self.recorded = 0
+        self.deduplicated = 0
+        self.written = 0
+        self.failed_batches = 0
+        self.last_flush_ms = 0.0
+
+        self._thread = threading.Thread(target=self._write_loop, name="billing-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, camera, stream_id, record, actual_weight_kg=None):
+        """Met en attente la mesure d'un colis (enregistrement de dimensions du détecteur)"""
+        row = billing_row(camera, stream_id, record, actual_weight_kg, self.divisor)
+        with self._cond:
+            if row['parcel_id'] in self._pending:
+                self.deduplicated += 1
+                del self._pending[row['parcel_id']]
+            self._pending[row['parcel_id']] = row
+            self.recorded += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+        BILLING_RECORDS.labels("queued").inc()
+        return row
+
+    def _take(self):
+        with self._cond:
+            rows = list(self._pending.values())
+            self._pending.clear()
+            self._flushing = bool(rows)
+            return rows
+
+    def _write(self, rows):
+        start = time.perf_counter()
+        try:
+            self.writer.write(rows)
+        except Exception as e:
+            self.failed_batches += 1
+            BILLING_RECORDS.labels("failed").inc(len(rows))
+            hot_log.error("billing-write", "Écriture de %d lignes de facturation impossible: %s", len(rows), e)
+            with self._cond:
+                # Remises en tête, sans écraser une mesure plus récente arrivée entre-temps
+                for row in reversed(rows):
+                    if row['parcel_id'] not in self._pending:
+                        self._pending[row['parcel_id']] = row
+                        self._pending.move_to_end(row['parcel_id'], last=False)
+                self._flushing = False
+                self._cond.notify_all()
+            return False
+        self.last_flush_ms = (time.perf_counter() - start) * 1000.0
+        self.written += len(rows)
+        BILLING_RECORDS.labels("written").inc(len(rows))
+        with self._cond:
+            self._flushing = False
+            self._cond.notify_all()
+        return True
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                if not self._closed and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                closed = self._closed
+            rows = self._take()
+            if rows and not self._write(rows) and not closed:
+                time.sleep(self.flush_interval)
+            if closed:
+                return
+
+    def flush(self, timeout=5.0):
+        """Attend que les lignes en attente soient écrites (True si tout est écrit à temps)"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._cond.notify()
+            while self._pending or self._flushing:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, 0.1))
+                self._cond.notify()
+        return True
+
+    def query(self, camera=None, since=None, until=None, limit=100, offset=0):
+        """Colis mesurés (les plus récents d'abord), since / until en secondes epoch"""
+        return self.writer.query(camera, since, until, limit, offset)
+
+    def summary(self, camera=None, since=None, until=None):
+        """Nombre de colis et poids cumulés sur une période"""
+        return self.writer.summary(camera, since, until)
+
+    def close(self):
+        """Écrit les dernières lignes en attente et ferme le stockage"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join(timeout=10.0)
+        self.writer.close()
+
+    def stats(self):
+        with self._cond:
+            pending = len(self._pending)
+        return {
+            'backend': self.backend,
+            'pending': pending,
+            'recorded': self.recorded,
+            'deduplicated': self.deduplicated,
+            'written': self.written,
+            'failed_batches': self.failed_batches,
+            'last_flush_ms': round(self.last_flush_ms, 2),
+        }
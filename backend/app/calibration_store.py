@@ -0,0 +1,203 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from types import MappingProxyType
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CAMERA = "default"
+DEFAULT_FACTORS = {
+    'length': 0.45,  # Facteurs initiaux basés sur votre observation
+    'width': 0.45,
+    'height': 1.0
+}
+AXES = ('length', 'width', 'height')
+
+
+class CalibrationSnapshot:
+    """
+    État de calibration immuable : profils par caméra + numéro de version global.
+    Les lecteurs prennent une référence au snapshot courant et n'ont jamais besoin de verrou.
+    """
+
+    def __init__(self, profiles, version, history):
+        self.profiles = MappingProxyType({name: MappingProxyType(dict(p)) for name, p in profiles.items()})
+        self.version = version
+        self.history = tuple(history)
+
+    def factors(self, camera=None):
+        """Facteurs (length, width, height) d'une caméra, ou du profil par défaut"""
+        profile = self.profiles.get(camera) if camera is not None else None
+        if profile is None:
+            profile = self.profiles.get(DEFAULT_CAMERA, DEFAULT_FACTORS)
+        return profile
+
+    def to_json(self):
+        return {
+            'version': self.version,
+            'profiles': {name: dict(profile) for name, profile in self.profiles.items()},
+            'history': list(self.history),
+        }
+
+
+class CalibrationStore:
+    """
+    Facteurs de correction versionnés, par caméra, rechargés à chaud :
+    - chaque mise à jour construit un nouveau snapshot et l'échange d'un coup (copy-on-write)
+    - l'écriture du fichier (atomique : fichier temporaire + os.replace) est faite par un thread
+      dédié, la mise à jour ne bloque donc jamais l'inférence
+    - un thread surveille la date de modification du fichier et recharge les changements externes
+    - l'historique garde les history_size dernières versions de chaque profil
+    """
+
+    def __init__(self, path, legacy_path=None, watch_interval=2.0, history_size=50):
+        self.path = os.path.abspath(path)
+        self.history_size = history_size
+        self.watch_interval = watch_interval
+        self._lock = threading.Lock()
+        self._dirty = threading.Event()
+        self._stop_event = threading.Event()
+        self._written_mtime = None
+        self.reloads = 0
+
+        self.snapshot = self._read(self.path) or self._read(legacy_path) or \
+            CalibrationSnapshot({DEFAULT_CAMERA: DEFAULT_FACTORS}, 0, [])
+        self._mtime = self._current_mtime()
+        self._saved_version = self.snapshot.version if self._mtime is not None else None
+
+        self._writer = threading.Thread(target=self._write_loop, name="calibration-writer", daemon=True)
+        self._writer.start()
+        self._watcher = None
+        if watch_interval:
+            self._watcher = threading.Thread(target=self._watch_loop, name="calibration-watch", daemon=True)
+            self._watcher.start()
+
+    def _read(self, path):
+        """Snapshot lu depuis un fichier (format versionné, ou ancien format à plat) ; None si absent"""
+        if not path or not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Erreur lors du chargement de la calibration: {e}")
+            return None
+        if 'profiles' not in data:
+            # Ancien calibration_factors.json : un seul jeu de facteurs
+            return CalibrationSnapshot({DEFAULT_CAMERA: data}, 1, [])
+        return CalibrationSnapshot(data['profiles'], data.get('version', 0), data.get('history', []))
+
+    def _current_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def factors(self, camera=None):
+        return self.snapshot.factors(camera)
+
+    def update(self, factors, camera=None, source="manual", **details):
+        """
+        Remplace (partiellement) les facteurs d'une caméra ; retourne la nouvelle version.
+        Le snapshot est échangé immédiatement, le fichier est écrit en arrière-plan.
+        """
+        camera = camera or DEFAULT_CAMERA
+        with self._lock:
+            current = self.snapshot
+            profiles = {name: dict(profile) for name, profile in current.profiles.items()}
+            profile = dict(profiles.get(camera) or current.factors(camera))
+            profile.update({axis: float(factors[axis]) for axis in AXES if axis in factors})
+            version = current.version + 1
+            profile['version'] = version
+            profile['updated_at'] = time.time()
+            profiles[camera] = profile
+
+            entry = dict(details, camera=camera, version=version, source=source, updated_at=profile['updated_at'],
+                         factors={axis: profile[axis] for axis in AXES})
+            history = [h for h in current.history if h['camera'] != camera]
+            own = [h for h in current.history if h['camera'] == camera][-(self.history_size - 1):]
+            self.snapshot = CalibrationSnapshot(profiles, version, history + own + [entry])
+        self._dirty.set()
+        logger.info(f"Calibration {camera} v{version} ({source}): {entry['factors']}")
+        return version
+
+    def history(self, camera=None):
+        """Versions successives d'un profil (toutes caméras si camera est None)"""
+        return [copy.deepcopy(h) for h in self.snapshot.history if camera is None or h['camera'] == camera]
+
+    def rollback(self, version, camera=None):
+        """Revient aux facteurs d'une version précédente (enregistrée comme nouvelle version)"""
+        camera = camera or DEFAULT_CAMERA
+        for entry in self.snapshot.history:
+            if entry['camera'] == camera and entry['version'] == version:
+                return self.update(entry['factors'], camera, source="rollback", restored_version=version)
+        raise KeyError(f"Version {version} inconnue pour la caméra {camera}")
+
+    def flush(self):
+        """Écrit immédiatement le snapshot courant s'il n'est pas encore sur disque"""
+        snapshot = self.snapshot
+        if snapshot.version != self._saved_version:
+            self._write(snapshot)
+
+    def close(self):
+        """Arrête les threads et écrit les dernières modifications"""
+        self._stop_event.set()
+        self._dirty.set()
+        self._writer.join(timeout=5.0)
+        self.flush()
+
+    def _write(self, snapshot):
+        tmp_path = f"{self.path}.tmp"
+        with self._lock:
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(tmp_path, 'w') as f:
+                    json.dump(snapshot.to_json(), f, indent=4)
+                os.replace(tmp_path, self.path)
+                self._saved_version = snapshot.version
+                self._mtime = self._written_mtime = self._current_mtime()
+                logger.info(f"Calibration sauvegardée (v{snapshot.version})")
+            except Exception as e:
+                logger.error(f"Erreur lors de la sauvegarde de la calibration: {e}")
+
+    def _write_loop(self):
+        while not self._stop_event.is_set():
+            self._dirty.wait()
+            self._dirty.clear()
+            if self._stop_event.is_set():
+                break
+            self._write(self.snapshot)
+
+    def _watch_loop(self):
+        while not self._stop_event.wait(self.watch_interval):
+            self.check_reload()
+
+    def check_reload(self):
+        """Recharge le fichier s'il a été modifié par un autre processus / un opérateur"""
+        mtime = self._current_mtime()
+        if mtime is None or mtime == self._mtime or mtime == self._written_mtime:
+            return False
+        snapshot = self._read(self.path)
+        self._mtime = mtime
+        if snapshot is None:
+            return False
+        with self._lock:
+            self.snapshot = snapshot
+            self._saved_version = snapshot.version
+        self.reloads += 1
+        logger.info(f"Calibration rechargée depuis {self.path} (v{snapshot.version})")
+        return True
+
+    def stats(self):
+        snapshot = self.snapshot
+        return {
+            'version': snapshot.version,
+            'cameras': sorted(snapshot.profiles),
+            'reloads': self.reloads,
+            'path': self.path,
+        }
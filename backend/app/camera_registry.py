@@ -0,0 +1,254 @@
+import asyncio
+import threading
+import time
+import logging
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from pipeline import FramePipeline
+from multistream import MultiStreamEngine
+from pacing import AdaptivePacer
+from instrumentation import WS_BYTES
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """
+    Abonné WebSocket d'une caméra partagée.
+    Chaque abonné choisit sa qualité JPEG, sa cadence maximale, son protocole et, en binaire,
+    la largeur maximale des frames ; seule la frame la plus récente est conservée si le client
+    est plus lent que la caméra.
+    - protocol "json" : frames JPEG dessinées par le serveur + dimensions en texte JSON
+    - protocol "binary" : frames brutes + tracks + dimensions dans un seul message (stream_protocol)
+    """
+
+    PROTOCOLS = ("json", "binary")
+    MIN_WIDTH, MAX_WIDTH = 160, 3840
+
+    def __init__(self, loop, jpeg_quality=70, max_fps=None, protocol="json", max_width=None):
+        if protocol not in self.PROTOCOLS:
+            raise ValueError(f"Protocole inconnu: {protocol}")
+        self.loop = loop
+        self.protocol = protocol
+        self.jpeg_quality = int(min(max(jpeg_quality, 10), 100))
+        self.max_fps = max_fps
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        # Le client binaire dessine lui-même les tracks ; le client JSON reçoit des frames dessinées
+        self.annotate = protocol == "json"
+        self.max_width = int(min(max(max_width, self.MIN_WIDTH), self.MAX_WIDTH)) if max_width else None
+        self.frames = asyncio.Queue(maxsize=1)
+        self.dimensions = asyncio.Queue()
+        # Levé à chaque frame, mesure ou fermeture : /ws attend dessus au lieu d'interroger les files
+        self.updated = asyncio.Event()
+        self.dropped = 0
+        self.closed = False
+        self._last_frame_at = 0.0
+
+        # Métriques par client
+        self.connected_at = time.perf_counter()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.encode_ms_total = 0.0
+        self.send_ms_total = 0.0
+
+    def negotiated(self):
+        """Paramètres retenus pour ce client (envoyés au client binaire à la connexion)"""
+        return {
+            'type': 'hello',
+            'protocol': self.protocol,
+            'version': 1,
+            'quality': self.jpeg_quality,
+            'max_width': self.max_width,
+            'max_fps': self.max_fps,
+        }
+
+    def record_sent(self, nbytes, packet, send_s):
+        """Appelé par /ws après chaque envoi (frame et / ou dimensions)"""
+        self.bytes_sent += nbytes
+        self.send_ms_total += send_s * 1000.0
+        WS_BYTES.labels(self.protocol).inc(nbytes)
+        if packet is not None:
+            self.frames_sent += 1
+            self.encode_ms_total += packet.encode_s * 1000.0
+
+    def stats(self):
+        elapsed = max(time.perf_counter() - self.connected_at, 1e-6)
+        frames = max(self.frames_sent, 1)
+        return {
+            'protocol': self.protocol,
+            'quality': self.jpeg_quality,
+            'max_width': self.max_width,
+            'frames_sent': self.frames_sent,
+            'fps': round(self.frames_sent / elapsed, 2),
+            'mbps': round(self.bytes_sent * 8 / elapsed / 1e6, 3),
+            'bytes_per_frame': round(self.bytes_sent / frames),
+            'encode_ms': round(self.encode_ms_total / frames, 2),
+            'send_ms': round(self.send_ms_total / frames, 2),
+            'dropped': self.dropped,
+        }
+
+    def wants_frame(self, now):
+        return not self.closed and now - self._last_frame_at >= self.min_interval
+
+    def push_frame(self, packet):
+        """Appelé depuis le thread d'encodage"""
+        self._last_frame_at = time.perf_counter()
+        self._call_soon(self._put_latest, packet)
+
+    def push_dimensions(self, dimensions_data):
+        """Appelé depuis le thread de détection"""
+        self._call_soon(self._put_dimensions, dimensions_data)
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            # Réveille le consommateur bloqué sur next_frame()
+            self._call_soon(self._put_latest, None)
+
+    def _call_soon(self, callback, *args):
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # Boucle asyncio déjà fermée (client parti)
+            self.closed = True
+
+    def _put_latest(self, packet):
+        if self.frames.full():
+            self.frames.get_nowait()
+            self.dropped += 1
+        self.frames.put_nowait(packet)
+        self.updated.set()
+
+    def _put_dimensions(self, dimensions_data):
+        self.dimensions.put_nowait(dimensions_data)
+        self.updated.set()
+
+    def drain_dimensions(self):
+        items = []
+        while not self.dimensions.empty():
+            items.append(self.dimensions.get_nowait())
+        return items
+
+    async def next_update(self, timeout=0.5):
+        """
+        Attend la prochaine frame ou mesure (ou la fermeture) ; retourne (frame ou None, dimensions).
+        Une mesure est donc envoyée dès qu'elle arrive, sans attendre la frame suivante.
+        """
+        if self.frames.empty() and self.dimensions.empty() and not self.closed:
+            try:
+                await asyncio.wait_for(self.updated.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self.updated.clear()
+        packet = self.frames.get_nowait() if not self.frames.empty() else None
+        return packet, self.drain_dimensions()
+
+    async def next_frame(self, timeout=0.5):
+        """Prochaine frame encodée (None si timeout ou flux terminé)"""
+        try:
+            return await asyncio.wait_for(self.frames.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class CameraSource:
+    """Une source physique : une capture, une boucle de détection, N abonnés"""
+
+    def __init__(self, name, source, detector, detector_lock, engine=None, pacing=None, billing=None):
+        self.name = name
+        self.source = source
+        self.engine = engine
+        self.state = detector.create_stream_state(name)
+        self.pipeline = FramePipeline(detector, source=source, state=self.state,
+                                      detector_lock=detector_lock,
+                                      detect_in_thread=engine is None,
+                                      on_frame=engine.notify_frame if engine else None,
+                                      pacer=AdaptivePacer(**pacing) if pacing is not None else None,
+                                      billing=billing)
+
+    def start(self):
+        if self.engine is not None:
+            self.engine.add_pipeline(self.pipeline)
+        self.pipeline.start()
+
+    def stop(self):
+        if self.engine is not None:
+            self.engine.remove_pipeline(self.pipeline)
+        self.pipeline.stop()
+
+    @property
+    def running(self):
+        return self.pipeline.running
+
+
+class CameraRegistry:
+    """
+    Registre des caméras partagées : la première connexion démarre la source,
+    la dernière déconnexion l'arrête. Le coût d'inférence ne dépend pas du nombre de clients.
+    En mode batched, les frames de toutes les caméras passent dans YOLO par lots.
+    """
+
+    def __init__(self, detector, sources, batched=False, max_batch=8, pacing=None, billing=None):
+        self.detector = detector
+        # BillingSink partagé par toutes les caméras (None : pas d'enregistrement)
+        self.billing = billing
+        # Paramètres d'AdaptivePacer (target_fps, latency_budget_ms, max_skip) ; None : pas de cadence
+        self.pacing = pacing
+        self.sources = dict(sources)  # nom -> index ou URL cv2.VideoCapture
+        self._cameras = {}
+        self._lock = threading.Lock()
+        # Le modèle YOLO est partagé entre toutes les sources
+        self._detector_lock = threading.Lock()
+        self.engine = MultiStreamEngine(detector, max_batch=max_batch,
+                                        detector_lock=self._detector_lock) if batched else None
+
+    @property
+    def detector_lock(self):
+        """Verrou du modèle YOLO partagé (à prendre pour toute détection hors des pipelines)"""
+        return self._detector_lock
+
+    def subscribe(self, name, subscriber):
+        """Abonne un client à une caméra (démarre la capture si nécessaire)"""
+        if name not in self.sources:
+            raise KeyError(f"Caméra inconnue: {name}")
+
+        with self._lock:
+            camera = self._cameras.get(name)
+            if camera is None or not camera.running:
+                camera = CameraSource(name, self.sources[name], self.detector,
+                                      self._detector_lock, engine=self.engine, pacing=self.pacing,
+                                      billing=self.billing)
+                camera.pipeline.add_sink(subscriber)
+                camera.start()
+                self._cameras[name] = camera
+            else:
+                camera.pipeline.add_sink(subscriber)
+            logger.info(f"Abonné ajouté à la caméra {name} ({len(camera.pipeline.sinks())} abonnés)")
+            return camera
+
+    def unsubscribe(self, name, subscriber):
+        """Désabonne un client et arrête la caméra s'il était le dernier"""
+        with self._lock:
+            camera = self._cameras.get(name)
+            if camera is None:
+                return
+            camera.pipeline.remove_sink(subscriber)
+            if camera.pipeline.sinks():
+                return
+            del self._cameras[name]
+        camera.stop()
+        logger.info(f"Caméra {name} arrêtée (plus d'abonnés)")
+
+    def get_stats(self):
+        with self._lock:
+            cameras = dict(self._cameras)
+        stats = {name: camera.pipeline.get_stats() for name, camera in cameras.items()}
+        if self.engine is not None:
+            stats['_multistream'] = self.engine.get_stats()
+        if self.billing is not None:
+            stats['_billing'] = self.billing.stats()
+        return stats
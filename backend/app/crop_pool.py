@@ -0,0 +1,87 @@
+import os
+import sys
+import threading
+from collections import deque
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from preprocessing import resize_crop
+
+
+class PooledCrop:
+    """Crop redimensionné dans un tampon du pool ; release() rend le tampon (idempotent)"""
+
+    __slots__ = ('array', '_pool', '_index')
+
+    def __init__(self, array, pool, index):
+        self.array = array
+        self._pool = pool
+        self._index = index
+
+    def release(self):
+        if self._pool is not None:
+            self._pool.release(self._index)
+            self._pool = None
+
+
+class CropPool:
+    """
+    Tampons (capacity, H, W, 3) uint8 préalloués pour les crops envoyés au régresseur.
+    Le détecteur passe des vues de la frame (aucune copie) ; put() les redimensionne une seule
+    fois dans un tampon libre, qui est rendu après le prétraitement du lot.
+    Si le pool est vide, put() n'attend pas : un tampon est alloué hors pool (compté).
+    """
+
+    def __init__(self, size=(224, 224), capacity=64):
+        width, height = size
+        self.capacity = capacity
+        self.buffers = np.empty((capacity, height, width, 3), dtype=np.uint8)
+        self._free = deque(range(capacity))
+        self._lock = threading.Lock()
+        # Tampon brut réutilisé par thread : cv2 redimensionne plus vite un bloc contigu qu'une vue
+        # à pas de frame, et la copie (memcpy) n'alloue rien
+        self._scratch = threading.local()
+        self.acquired = 0
+        self.overflows = 0
+        self.high_water = 0
+
+    def put(self, image):
+        """Copie (redimensionne) un crop BGR dans un tampon ; retourne un PooledCrop"""
+        with self._lock:
+            index = self._free.popleft() if self._free else None
+            self.acquired += 1
+            self.high_water = max(self.high_water, self.capacity - len(self._free))
+            if index is None:
+                self.overflows += 1
+        if index is None:
+            buffer = np.empty(self.buffers.shape[1:], dtype=np.uint8)
+        else:
+            buffer = self.buffers[index]
+        resize_crop(self._contiguous(image), buffer)
+        return PooledCrop(buffer, self if index is not None else None, index)
+
+    def _contiguous(self, image):
+        if image.flags.c_contiguous:
+            return image
+        scratch = getattr(self._scratch, 'buffer', None)
+        if scratch is None or scratch.size < image.size:
+            scratch = self._scratch.buffer = np.empty(image.size, dtype=np.uint8)
+        view = scratch[:image.size].reshape(image.shape)
+        np.copyto(view, image)
+        return view
+
+    def release(self, index):
+        with self._lock:
+            self._free.append(index)
+
+    def stats(self):
+        with self._lock:
+            in_use = self.capacity - len(self._free)
+        return {
+            'capacity': self.capacity,
+            'in_use': in_use,
+            'high_water': self.high_water,
+            'acquired': self.acquired,
+            'overflows': self.overflows,
+        }
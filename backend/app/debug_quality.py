@@ -1,61 +1,61 @@
 import cv2
-import numpy as np
 import os
+import sys
 import argparse
 
-def analyze_image(image_path):
-    """Analyse une image et calcule les scores de qualité"""
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from quality import analyze
+
+
+def analyze_image(image_path, show=False, output_path=None):
+    """
+    Analyse une image et calcule les scores de qualité (mêmes paramètres que le détecteur).
+    Retourne les caractéristiques (None si l'image est illisible ou trop petite).
+    """
     if not os.path.exists(image_path):
         print(f"Fichier non trouvé: {image_path}")
-        return
-    
+        return None
+
     image = cv2.imread(image_path)
     if image is None:
         print(f"Impossible de charger l'image: {image_path}")
-        return
-    
+        return None
+
     print(f"\n=== Analyse de {os.path.basename(image_path)} ===")
-    
-    # 1. Taille et ratio d'aspect
-    height, width = image.shape[:2]
-    aspect_ratio = width / height if height > 0 else 0
-    print(f"Taille: {width}x{height}, Ratio: {aspect_ratio:.2f}")
-    
-    # 2. Remplissage (non noir)
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    _, binary = cv2.threshold(gray, 10, 255, cv2.THRESH_BINARY)  # Seuil bas pour éviter le noir
-    fill_ratio = np.sum(binary > 0) / binary.size
-    print(f"Remplissage: {fill_ratio:.3f}")
-    
-    # 3. Contours
-    edges = cv2.Canny(gray, 50, 150)
-    edge_ratio = np.sum(edges > 0) / edges.size
-    print(f"Ratio de contours: {edge_ratio:.3f}")
-    
-    # 4. Lignes détectées
-    lines = cv2.HoughLinesP(edges, 1, np.pi/180, threshold=30, minLineLength=20, maxLineGap=10)
-    line_count = len(lines) if lines is not None else 0
-    print(f"Lignes détectées: {line_count}")
-    
-    # 5. Score composite
-    quality_score = min((fill_ratio * 0.4 + edge_ratio * 0.3 + (min(line_count, 10) / 10.0) * 0.3) * 1.5, 1.0)
-    print(f"Score de qualité: {quality_score:.3f}")
-    
-    # 6. Visualisation
-    debug_img = image.copy()
-    if lines is not None:
-        for line in lines:
-            x1, y1, x2, y2 = line[0]
+    features = analyze(image, keep_lines=show or output_path is not None)
+    if features is None:
+        print(f"Image trop petite: {image.shape[1]}x{image.shape[0]}")
+        return None
+
+    print(f"Taille: {features['width']}x{features['height']}, Ratio: {features['aspect_ratio']:.2f}")
+    print(f"Remplissage: {features['fill_ratio']:.3f}")
+    print(f"Ratio de contours: {features['edge_ratio']:.3f}")
+    print(f"Lignes détectées: {features['line_count']}")
+    print(f"Score de qualité: {features['quality_score']:.3f}")
+
+    # Visualisation des lignes détectées (fenêtre et/ou fichier)
+    if 'lines' in features:
+        debug_img = image.copy()
+        for x1, y1, x2, y2 in features.pop('lines').tolist():
             cv2.line(debug_img, (x1, y1), (x2, y2), (0, 255, 0), 2)
-    
-    # Afficher l'image avec les lignes détectées
-    cv2.imshow("Image analysée", debug_img)
-    cv2.waitKey(0)
-    cv2.destroyAllWindows()
+        if output_path:
+            cv2.imwrite(output_path, debug_img)
+        if show:
+            cv2.imshow("Image analysée", debug_img)
+            cv2.waitKey(0)
+            cv2.destroyAllWindows()
+    return features
+
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Analyse la qualité d'une image de colis")
-    parser.add_argument("image_path", help="Chemin vers l'image à analyser")
+    parser = argparse.ArgumentParser(description="Analyse la qualité d'images de colis (voir quality_report.py pour un dossier)")
+    parser.add_argument("image_paths", nargs="+", help="Chemin(s) vers les images à analyser")
+    parser.add_argument("--show", action="store_true", help="Affiche les lignes détectées (fenêtre OpenCV)")
+    parser.add_argument("--output-dir", help="Enregistre les images annotées dans ce dossier")
     args = parser.parse_args()
-    
-    analyze_image(args.image_path)
\ No newline at end of file
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    for image_path in args.image_paths:
+        output_path = os.path.join(args.output_dir, os.path.basename(image_path)) if args.output_dir else None
+        analyze_image(image_path, show=args.show, output_path=output_path)
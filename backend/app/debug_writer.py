@@ -0,0 +1,91 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+import cv2
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class DebugImageWriter:
+    """
+    Écriture des images de debug (ROI) hors de la boucle de détection :
+    - échantillonnage : une frame sur sample_every, et au plus max_per_second images
+    - file bornée : si le disque ne suit pas, les images en trop sont abandonnées (comptées)
+    - un thread dédié fait l'encodage + cv2.imwrite
+    """
+
+    def __init__(self, output_dir="/tmp/debug_frames", sample_every=30, max_per_second=5.0, max_queue=32,
+                 enabled=True):
+        self.output_dir = output_dir
+        self.sample_every = sample_every
+        self.max_per_second = max_per_second
+        self.enabled = enabled
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._last_write = 0.0
+        self._thread = None
+        if enabled:
+            os.makedirs(output_dir, exist_ok=True)
+            self._thread = threading.Thread(target=self._write_loop, name="debug-writer", daemon=True)
+            self._thread.start()
+
+    def sampled(self, frame_index):
+        """Vrai si une image de debug doit être écrite pour cette frame"""
+        if not self.enabled or frame_index % self.sample_every:
+            return False
+        if self.max_per_second:
+            now = time.monotonic()
+            if now - self._last_write < 1.0 / self.max_per_second:
+                return False
+            self._last_write = now
+        return True
+
+    def submit(self, name, image):
+        """
+        Met une copie de l'image en file d'écriture ; retourne le chemin prévu,
+        ou None si la file est pleine.
+        """
+        path = os.path.join(self.output_dir, name)
+        try:
+            # Copie : la frame source peut être réutilisée avant l'écriture
+            self._queue.put_nowait((path, image.copy()))
+        except queue.Full:
+            self.dropped += 1
+            return None
+        return path
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            path, image = item
+            try:
+                if cv2.imwrite(path, image):
+                    self.written += 1
+                else:
+                    self.failed += 1
+            except cv2.error as e:
+                self.failed += 1
+                logger.warning(f"Écriture debug impossible ({path}): {e}")
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout=5.0)
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'queued': self._queue.qsize(),
+            'written': self.written,
+            'dropped': self.dropped,
+            'failed': self.failed,
+        }
@@ -1,20 +1,36 @@
 import torch
 import torch.nn as nn
 import timm
-import cv2
 import numpy as np
-from PIL import Image
-from torchvision import transforms
 import threading
 import queue
 import time
+from collections import deque
+from concurrent.futures import Future
 import logging
-import json
 import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from preprocessing import BatchPreprocessor
+from inference_backends import artifact_ready, create_backend
+from result_store import ResultStore
+from regression_pool import RegressionProcessPool
+from calibration_store import AXES, CalibrationStore
+from crop_pool import CropPool
+from estimation_cache import CropSignature, EstimationCache
+from instrumentation import (CROP_POOL_IN_USE, DIMENSION_QUEUE_DEPTH, ESTIMATIONS, RESULT_STORE_SIZE,
+                             RateLimitedLog, observe_stage, stage_timer)
 
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+# Logs des chemins chauds : au plus un message par clé toutes les 5 s
+hot_log = RateLimitedLog(logger)
+
+# Facteurs de correction versionnés, à côté des modèles (et non plus relatifs au répertoire courant)
+CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../models/calibration_factors.json")
+LEGACY_CALIBRATION_FILE = "calibration_factors.json"
 
 class ConvNeXtV2Regressor(nn.Module):
     def __init__(self, dropout_p=0.3):
@@ -32,188 +48,461 @@ class ConvNeXtV2Regressor(nn.Module):
         x = self.fc(x)
         return x
 
+def load_backend(model_path, device, backend="eager", batch_size=4, channels_last=False,
+                 calibration_batches=None, model=None):
+    """
+    Construit le backend d'inférence du régresseur. Le ConvNeXtV2 (timm) et ses poids ne sont
+    chargés que si aucun artefact sérialisé à jour (TorchScript / ONNX) n'existe à côté des poids.
+    Retourne (backend, modèle eager ou None, durées en s de 'weights' et 'backend').
+    """
+    timings = {}
+    start = time.perf_counter()
+    if model is None and not artifact_ready(backend, model_path, device, channels_last):
+        model = ConvNeXtV2Regressor()
+        model.load_state_dict(torch.load(model_path, map_location=device))
+    if model is not None:
+        model.to(device)
+        model.eval()
+    timings['weights'] = time.perf_counter() - start
+    
+    # Backend d'inférence : eager, torchscript, compile, int8-dynamic, onnx, onnx-int8-static
+    start = time.perf_counter()
+    backend = create_backend(backend, model, device, model_path=model_path, batch_size=batch_size,
+                             channels_last=channels_last, calibration_batches=calibration_batches)
+    timings['backend'] = time.perf_counter() - start
+    return backend, model, timings
+
+def percentile(values, q):
+    """Percentile q (0-100) d'une liste de valeurs (plus proche rang)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100.0 * (len(ordered) - 1)))))
+    return ordered[index]
+
+class BatcherMetrics:
+    """Métriques du micro-batcher : profondeur de file, remplissage des lots, temps d'attente"""
+    def __init__(self, batch_size, window=1000):
+        self.batch_size = batch_size
+        self.wait_times = deque(maxlen=window)
+        self.fill_ratios = deque(maxlen=window)
+        self.batches = 0
+        self.tasks = 0
+        self._lock = threading.Lock()
+
+    def record_batch(self, wait_times):
+        with self._lock:
+            self.batches += 1
+            self.tasks += len(wait_times)
+            self.fill_ratios.append(len(wait_times) / self.batch_size)
+            self.wait_times.extend(wait_times)
+
+    def snapshot(self, queue_depth):
+        with self._lock:
+            wait_ms = [w * 1000.0 for w in self.wait_times]
+            fill_ratios = list(self.fill_ratios)
+            batches, tasks = self.batches, self.tasks
+        return {
+            'queue_depth': queue_depth,
+            'batches': batches,
+            'tasks': tasks,
+            'batch_fill_ratio': round(sum(fill_ratios) / len(fill_ratios), 3) if fill_ratios else 0.0,
+            'wait_p50_ms': round(percentile(wait_ms, 50), 2),
+            'wait_p99_ms': round(percentile(wait_ms, 99), 2),
+        }
+
 class DimensionEstimationService:
-    def __init__(self, model_path, batch_size=4, processing_interval=0.5):
+    def __init__(self, model_path, batch_size=4, max_wait=0.05, backend="eager", channels_last=False,
+                 calibration_batches=None, max_results=1024, result_ttl=300.0, model=None, workers=0,
+                 calibration_path=CALIBRATION_PATH, calibration=None, warmup=True, crop_pool_size=None,
+                 estimation_cache=None):
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        logger.info(f"Using device: {self.device}")
-        
-        # Charger le modèle
-        self.model = ConvNeXtV2Regressor()
-        try:
-            self.model.load_state_dict(torch.load(model_path, map_location=self.device))
-            self.model.to(self.device)
-            self.model.eval()
-            logger.info("Modèle de dimensions chargé avec succès")
-            
-            # Test du modèle avec une entrée factice
-            self.test_model_with_dummy_input()
-            
-        except Exception as e:
-            logger.error(f"Erreur lors du chargement du modèle: {e}")
-            raise
+        self.pool = None
+        self.batch_size = batch_size
+        # Durées de démarrage (s) : poids, backend, préchauffage
+        self.startup_times = {}
+        if workers:
+            # Régression dans des processus séparés (CPU) : le modèle n'est chargé que dans ces processus
+            self.device = torch.device("cpu")
+            self.model = model
+            self.backend = None
+            self.preprocessor = None
+            self.pool = RegressionProcessPool(model_path, workers=workers, backend=backend, batch_size=batch_size,
+                                              channels_last=channels_last, calibration_batches=calibration_batches,
+                                              model=model)
+        else:
+            self._load_model(model_path, model, backend, batch_size, channels_last, calibration_batches)
+            if warmup:
+                self.warmup()
         
-        # Transformation des images - CORRIGÉ: même taille qu'à l'entraînement (224x224)
-        self.transform = transforms.Compose([
-            transforms.Resize((224, 224)),  # ← CHANGÉ: de (480, 480) à (224, 224)
-            transforms.ToTensor(),
-            transforms.Normalize(mean=[0.485, 0.456, 0.406], 
-                               std=[0.229, 0.224, 0.225]),
-        ])
+        # Facteurs de correction par caméra - à ajuster expérimentalement, rechargés à chaud
+        self.calibration = calibration or CalibrationStore(calibration_path, legacy_path=LEGACY_CALIBRATION_FILE)
         
-        # Facteurs de correction - à ajuster expérimentalement
-        self.correction_factors = self.load_calibration()
+        # Crops en attente : redimensionnés une fois dans des tampons préalloués, rendus après le lot
+        self.crop_pool = CropPool(size=(224, 224), capacity=crop_pool_size or max(64, batch_size * 8))
+        # Estimations réutilisées pour un crop quasi identique d'un autre track (EstimationCache,
+        # dict de paramètres ou True pour les réglages par défaut ; None : toujours un forward)
+        if estimation_cache is True:
+            estimation_cache = EstimationCache()
+        elif isinstance(estimation_cache, dict):
+            estimation_cache = EstimationCache(**estimation_cache)
+        self.estimation_cache = estimation_cache
         
         # File d'attente pour le traitement
         self.task_queue = queue.Queue()
-        self.results = {}
-        self.batch_size = batch_size
-        self.processing_interval = processing_interval
+        # Résultats bornés (taille + TTL, LRU), partagés entre le thread de lot et le détecteur
+        self.results = ResultStore(max_size=max_results, ttl=result_ttl)
+        # Future de la dernière tâche par track_id : écrit par les threads caméra / asyncio,
+        # vidé par le thread de lot (toujours sous _futures_lock)
+        self.futures = {}
+        self._futures_lock = threading.Lock()
+        # Un lot part dès qu'il est plein ou que la plus ancienne tâche a attendu max_wait secondes
+        self.max_wait = max_wait
+        self.metrics = BatcherMetrics(batch_size)
+        # Jauges /metrics lues à la demande (aucun coût dans la boucle de traitement)
+        DIMENSION_QUEUE_DEPTH.set_function(self.task_queue.qsize)
+        RESULT_STORE_SIZE.set_function(lambda: len(self.results))
+        CROP_POOL_IN_USE.set_function(lambda: self.crop_pool.stats()['in_use'])
         
         # Démarrer le thread de traitement
         self.processing_thread = threading.Thread(target=self._process_queue, daemon=True)
         self.processing_thread.start()
         logger.info("Service d'estimation des dimensions démarré")
     
+    def _load_model(self, model_path, model, backend, batch_size, channels_last, calibration_batches):
+        """Charge le régresseur et son backend d'inférence dans ce processus"""
+        logger.info(f"Using device: {self.device}")
+        
+        # Charger le modèle (artefact sérialisé, modèle injecté déjà chargé, ou timm + poids)
+        try:
+            self.backend, self.model, timings = load_backend(model_path, self.device, backend, batch_size,
+                                                             channels_last, calibration_batches, model)
+            self.startup_times.update(timings)
+            logger.info(f"Modèle de dimensions chargé avec succès (backend {self.backend.name}, "
+                        f"poids {timings['weights']:.2f}s, backend {timings['backend']:.2f}s)")
+        except Exception as e:
+            logger.error(f"Erreur lors du chargement du modèle: {e}")
+            raise
+        
+        # Prétraitement vectorisé des crops BGR - même taille qu'à l'entraînement (224x224)
+        self.preprocessor = BatchPreprocessor(size=(224, 224), max_batch=batch_size, device=self.backend.device)
+        # Les tampons du préprocesseur (et le lot qui en sort) sont partagés : le thread de lot et
+        # predict() (calibration, préchauffage, autres threads) les utilisent l'un après l'autre
+        self._inference_lock = threading.Lock()
+    
     def test_model_with_dummy_input(self):
         """Teste le modèle avec une entrée factice pour vérifier son fonctionnement"""
-        dummy_input = torch.randn(1, 3, 224, 224).to(self.device)
-        with torch.no_grad():
-            output = self.model(dummy_input)
-        logger.info(f"Test modèle - Sortie factice: {output.cpu().numpy()}")
+        dummy_input = torch.randn(1, 3, 224, 224)
+        output = self.backend(dummy_input)
+        logger.info(f"Test modèle - Sortie factice: {output}")
         return output
     
+    def warmup(self, batch_sizes=None, crop_shape=(240, 320, 3)):
+        """
+        Préchauffe prétraitement + backend aux tailles de lot réelles du micro-batcher
+        (par défaut 1 et batch_size) : allocations, choix des noyaux, compilation.
+        """
+        start = time.perf_counter()
+        crop = np.zeros(crop_shape, dtype=np.uint8)
+        for size in sorted(set(batch_sizes or (1, self.batch_size))):
+            output = self.predict([crop] * size)
+        self.startup_times['warmup'] = time.perf_counter() - start
+        logger.info(f"Préchauffage du régresseur: {self.startup_times['warmup']:.2f}s - Sortie factice: {output[0]}")
+    
+    @property
+    def correction_factors(self):
+        """Facteurs de correction du profil par défaut (lecture seule)"""
+        factors = self.calibration.factors()
+        return {axis: factors[axis] for axis in AXES}
+    
     def load_calibration(self):
-        """Charge les facteurs de calibration depuis un fichier"""
-        calibration_file = "calibration_factors.json"
-        default_factors = {
-            'length': 0.45,  # Facteurs initiaux basés sur votre observation
-            'width': 0.45,
-            'height': 1.0
-        }
-        
-        try:
-            if os.path.exists(calibration_file):
-                with open(calibration_file, 'r') as f:
-                    return json.load(f)
-        except Exception as e:
-            logger.warning(f"Erreur lors du chargement de la calibration: {e}")
-        
-        return default_factors
+        """Recharge les facteurs de calibration si le fichier a changé"""
+        self.calibration.check_reload()
+        return self.correction_factors
     
     def save_calibration(self):
-        """Sauvegarde les facteurs de calibration dans un fichier"""
-        calibration_file = "calibration_factors.json"
-        try:
-            with open(calibration_file, 'w') as f:
-                json.dump(self.correction_factors, f, indent=4)
-            logger.info(f"Calibration sauvegardée: {self.correction_factors}")
-        except Exception as e:
-            logger.error(f"Erreur lors de la sauvegarde de la calibration: {e}")
+        """Écrit immédiatement les facteurs de calibration (normalement fait en arrière-plan)"""
+        self.calibration.flush()
+    
+    def fit_calibration(self, reference_images, known_dimensions, camera=None, min_samples=1):
+        """
+        Ajuste les facteurs d'une caméra sur plusieurs colis de référence, en un passage par lots.
+        known_dimensions: liste de {'length_cm': ..., 'width_cm': ..., 'height_cm': ...}
+        Facteur par axe = moindres carrés de connu ≈ facteur * prédit. Retourne (version, rapport).
+        """
+        if len(reference_images) != len(known_dimensions):
+            raise ValueError("Une mesure de référence par image est nécessaire")
+        if len(reference_images) < min_samples:
+            raise ValueError(f"Au moins {min_samples} images de référence sont nécessaires")
+        
+        # Prédiction (prétraitement BGR compris) par lots de batch_size
+        predicted = np.concatenate([
+            np.asarray(self.predict(reference_images[i:i + self.batch_size]), dtype=np.float64).reshape(-1, 3)
+            for i in range(0, len(reference_images), self.batch_size)
+        ])
+        known = np.array([[d['length_cm'], d['width_cm'], d['height_cm']] for d in known_dimensions],
+                         dtype=np.float64)
+        
+        denominator = (predicted * predicted).sum(axis=0)
+        if np.any(denominator <= 0):
+            raise ValueError("Prédictions nulles : calibration impossible")
+        factors = (known * predicted).sum(axis=0) / denominator
+        relative_errors = np.abs(predicted * factors - known) / np.maximum(known, 1e-6)
+        report = {
+            'samples': len(reference_images),
+            'mean_rel_error': {axis: round(float(e), 4) for axis, e in zip(AXES, relative_errors.mean(axis=0))},
+            'max_rel_error': {axis: round(float(e), 4) for axis, e in zip(AXES, relative_errors.max(axis=0))},
+        }
+        version = self.calibration.update(dict(zip(AXES, factors.tolist())), camera, source="fit", **report)
+        logger.info(f"Calibration effectuée ({camera or 'default'} v{version}): {report}")
+        return version, report
     
-    def calibrate_with_reference(self, reference_image, known_dimensions):
+    def calibrate_with_reference(self, reference_image, known_dimensions, camera=None):
         """
         Calibre le modèle avec une image de référence de dimensions connues
         known_dimensions: {'length_cm': ..., 'width_cm': ..., 'height_cm': ...}
         """
         try:
-            # Convertir l'image
-            image_rgb = cv2.cvtColor(reference_image, cv2.COLOR_BGR2RGB)
-            pil_image = Image.fromarray(image_rgb)
-            input_tensor = self.transform(pil_image).unsqueeze(0).to(self.device)
-            
-            # Prédiction
-            with torch.no_grad():
-                predicted = self.model(input_tensor).cpu().numpy()[0]
-            
-            # Calculer les facteurs de correction
-            self.correction_factors = {
-                'length': known_dimensions['length_cm'] / predicted[0],
-                'width': known_dimensions['width_cm'] / predicted[1],
-                'height': known_dimensions['height_cm'] / predicted[2]
-            }
-            
-            self.save_calibration()
-            logger.info(f"Calibration effectuée: {self.correction_factors}")
-            
+            return self.fit_calibration([reference_image], [known_dimensions], camera)
         except Exception as e:
             logger.error(f"Erreur lors de la calibration: {e}")
     
-    def add_task(self, track_id, image):
-        """Ajoute une image à traiter pour un track_id donné"""
+    def add_task(self, track_id, image, camera=None, owner=None):
+        """
+        Ajoute une image à traiter pour un track_id donné (camera : profil de calibration à appliquer).
+        Retourne un Future résolu avec le dictionnaire de dimensions
+        (asyncio.wrap_future() pour l'attendre depuis une coroutine).
+        owner : track auquel appartient le crop (track_id par défaut) ; le cache d'estimations
+        ne lui resservira jamais ses propres résultats.
+        """
+        future = Future()
         if image.size == 0:
             logger.warning(f"Image vide pour track_id {track_id}")
-            return
+            future.set_exception(ValueError(f"Image vide pour track_id {track_id}"))
+            return future
+        
+        # Le crop (vue de la frame) est copié une seule fois, redimensionné dans un tampon du pool ;
+        # il reste en BGR : la conversion RGB est faite par le prétraitement du lot
+        with self._futures_lock:
+            self.futures[track_id] = future
+        enqueued_at = time.perf_counter()
+        crop = self.crop_pool.put(image)
+        signature = None
+        if self.estimation_cache is not None:
+            owner = track_id if owner is None else owner
+            signature = (CropSignature.of(crop.array, image.shape), owner)
+            raw = self.estimation_cache.lookup(signature[0], owner)
+            if raw is not None:
+                # Crop déjà estimé (colis ré-identifié) : résultat immédiat, sans passer par le modèle
+                crop.release()
+                ESTIMATIONS.labels("cached").inc()
+                self._complete_batch([track_id], [raw], None, [future], [enqueued_at], [camera])
+                return future
+        self.task_queue.put((track_id, crop, future, enqueued_at, camera, signature))
+        ESTIMATIONS.labels("submitted").inc()
+        logger.debug("Tâche ajoutée pour track_id %s", track_id)
+        return future
+    
+    def add_views(self, track_id, images, camera=None):
+        """
+        Soumet plusieurs vues d'un même track d'un seul coup (un seul lot si len(images) <= batch_size).
+        Retourne un Future résolu avec la liste des résultats par vue (None pour une vue en échec).
+        """
+        combined = Future()
+        keys = [(track_id, i) for i in range(len(images))]
+        futures = [self.add_task(key, image, camera, owner=track_id) for key, image in zip(keys, images)]
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def on_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            for key in keys:
+                self.ack_result(key)
+            results = [None if f.exception() else f.result() for f in futures]
+            if any(result is not None for result in results):
+                combined.set_result(results)
+            else:
+                combined.set_exception(futures[0].exception())
+
+        if not futures:
+            combined.set_exception(ValueError(f"Aucune vue pour track_id {track_id}"))
+        for future in futures:
+            future.add_done_callback(on_done)
+        return combined
+
+    def get_future(self, track_id):
+        """Future de la dernière tâche soumise pour un track_id (None si inconnu)"""
+        with self._futures_lock:
+            return self.futures.get(track_id)
+
+    def _forget_future(self, track_id, future):
+        """Retire le Future terminé d'un track, sauf si une tâche plus récente l'a remplacé"""
+        with self._futures_lock:
+            if self.futures.get(track_id) is future:
+                del self.futures[track_id]
+    
+    def _next_batch(self):
+        """Attend une première tâche puis remplit le lot jusqu'à batch_size ou l'échéance"""
+        tasks = [self.task_queue.get()]
+        deadline = tasks[0][3] + self.max_wait
         
-        # Convertir BGR to RGB
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        self.task_queue.put((track_id, image_rgb))
-        logger.info(f"Tâche ajoutée pour track_id {track_id}")
+        while len(tasks) < self.batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                tasks.append(self.task_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return tasks
     
     def _process_queue(self):
         """Thread de traitement qui traite les images par lots"""
         while True:
             try:
-                # Attendre un peu avant de traiter le lot suivant
-                time.sleep(self.processing_interval)
-                
-                # Récupérer un lot d'images à traiter
-                batch = []
-                track_ids = []
-                
-                while not self.task_queue.empty() and len(batch) < self.batch_size:
-                    track_id, image = self.task_queue.get()
-                    batch.append(image)
-                    track_ids.append(track_id)
+                tasks = self._next_batch()
                 
-                if not batch:
-                    continue
+                now = time.perf_counter()
+                self.metrics.record_batch([now - task[3] for task in tasks])
                 
                 # Traiter le lot
-                self._process_batch(track_ids, batch)
+                track_ids = [task[0] for task in tasks]
+                batch = [task[1] for task in tasks]
+                futures = [task[2] for task in tasks]
+                enqueued_at = [task[3] for task in tasks]
+                cameras = [task[4] for task in tasks]
+                signatures = [task[5] for task in tasks]
+                self._process_batch(track_ids, batch, futures, enqueued_at, cameras, signatures)
                 
             except Exception as e:
                 logger.error(f"Erreur dans le thread de traitement: {e}")
     
-    def _process_batch(self, track_ids, images):
-        """Traite un lot d'images"""
-        try:
-            # Préparer les tenseurs d'entrée
-            input_tensors = []
-            for image in images:
-                pil_image = Image.fromarray(image)
-                input_tensor = self.transform(pil_image).unsqueeze(0).to(self.device)
-                input_tensors.append(input_tensor)
+    def get_metrics(self):
+        """Métriques du micro-batcher (profondeur de file, remplissage, p50/p99 d'attente) et des résultats"""
+        metrics = self.metrics.snapshot(self.task_queue.qsize())
+        metrics['results'] = self.results.stats()
+        metrics['crop_pool'] = self.crop_pool.stats()
+        if self.estimation_cache is not None:
+            metrics['estimation_cache'] = self.estimation_cache.stats()
+        metrics['calibration'] = self.calibration.stats()
+        metrics['startup_s'] = {name: round(t, 3) for name, t in self.startup_times.items()}
+        if self.pool is not None:
+            metrics['workers'] = self.pool.stats()
+        return metrics
+    
+    def predict(self, images, timeout=60.0):
+        """Dimensions brutes (N, 3) d'une liste de crops BGR, de façon synchrone"""
+        if self.pool is None:
+            with self._inference_lock:
+                return self.backend(self.preprocessor(images))
+        
+        # Par lots de batch_size : un lot ne peut pas dépasser les slots partagés du pool
+        futures = []
+        for i in range(0, len(images), self.batch_size):
+            future = Future()
             
-            # Concaténer les tenseurs
-            batch_tensor = torch.cat(input_tensors, dim=0)
+            def on_done(outputs, error, future=future):
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(outputs)
+            
+            self.pool.submit(images[i:i + self.batch_size], on_done)
+            futures.append(future)
+        if not futures:
+            return np.empty((0, 3), dtype=np.float32)
+        return np.concatenate([np.asarray(future.result(timeout=timeout)).reshape(-1, 3) for future in futures])
+    
+    def _process_batch(self, track_ids, crops, futures=None, enqueued_at=None, cameras=None, signatures=None):
+        """
+        Traite un lot de crops du pool (dans ce processus, ou envoyé au pool de régression).
+        Les tampons sont rendus dès que le lot est copié dans l'entrée du modèle.
+        """
+        futures = futures or [None] * len(track_ids)
+        if self.pool is not None:
+            # Le résultat arrive par le thread de collecte du pool : le lot suivant peut partir
+            submitted_at = time.perf_counter()
+            
+            def on_done(outputs, error):
+                observe_stage("regress", time.perf_counter() - submitted_at)
+                self._complete_batch(track_ids, outputs, error, futures, enqueued_at, cameras, signatures)
+            
+            try:
+                self.pool.submit([crop.array for crop in crops], on_done)
+            except Exception as e:
+                self._complete_batch(track_ids, None, e, futures, enqueued_at, cameras, signatures)
+            finally:
+                for crop in crops:
+                    crop.release()
+            return
+        
+        try:
+            # Crops déjà redimensionnés : BGR->RGB + normalisation vectorisés, puis prédiction
+            with self._inference_lock:
+                with stage_timer("preprocess"):
+                    batch = self.preprocessor.normalize_crops([crop.array for crop in crops])
+                with stage_timer("regress"):
+                    outputs, error = self.backend(batch), None
+        except Exception as e:
+            outputs, error = None, e
+        finally:
+            for crop in crops:
+                crop.release()
+        self._complete_batch(track_ids, outputs, error, futures, enqueued_at, cameras, signatures)
+    
+    def _complete_batch(self, track_ids, outputs, error, futures, enqueued_at=None, cameras=None, signatures=None):
+        """Applique la correction, stocke les résultats (et les sorties brutes en cache) et résout les Futures"""
+        try:
+            if error is not None:
+                raise error
             
-            # Prédiction
-            with torch.no_grad():
-                outputs = self.model(batch_tensor)
+            # Un seul snapshot de calibration pour tout le lot (échangé atomiquement, sans verrou)
+            calibration = self.calibration.snapshot
             
             # Stocker les résultats avec correction
             for i, track_id in enumerate(track_ids):
-                dimensions = outputs[i].cpu().numpy()
+                dimensions = outputs[i]
+                factors = calibration.factors(cameras[i] if cameras else None)
+                if signatures and signatures[i] is not None:
+                    self.estimation_cache.put(signatures[i][0], dimensions, owner=signatures[i][1])
                 
                 # Appliquer les facteurs de correction
-                corrected_length = float(dimensions[0]) * self.correction_factors['length']
-                corrected_width = float(dimensions[1]) * self.correction_factors['width']
-                corrected_height = float(dimensions[2]) * self.correction_factors['height']
+                corrected_length = float(dimensions[0]) * factors['length']
+                corrected_width = float(dimensions[1]) * factors['width']
+                corrected_height = float(dimensions[2]) * factors['height']
                 
                 # Log des valeurs brutes et corrigées pour debug
-                logger.info(f"Track {track_id} - Brut: {dimensions}, Corrigé: L={corrected_length:.2f}, W={corrected_width:.2f}, H={corrected_height:.2f}")
+                logger.debug("Track %s - Brut: %s, Corrigé: L=%.2f, W=%.2f, H=%.2f", track_id, dimensions,
+                             corrected_length, corrected_width, corrected_height)
                 
-                self.results[track_id] = {
+                result = {
                     'length_cm': corrected_length,
                     'width_cm': corrected_width,
                     'height_cm': corrected_height,
                     'raw_length': float(dimensions[0]),  # Pour debug
                     'raw_width': float(dimensions[1]),   # Pour debug
-                    'raw_height': float(dimensions[2])   # Pour debug
+                    'raw_height': float(dimensions[2]),  # Pour debug
+                    'calibration_version': factors.get('version', 0)
                 }
+                if enqueued_at is not None:
+                    # Temps entre add_task() et le résultat (attente + inférence)
+                    result['latency_ms'] = (time.perf_counter() - enqueued_at[i]) * 1000.0
+                self.results.put(track_id, result)
+                if futures[i] is not None:
+                    futures[i].set_result(result)
+                    self._forget_future(track_id, futures[i])
+            ESTIMATIONS.labels("completed").inc(len(track_ids))
                 
         except Exception as e:
-            logger.error(f"Erreur lors du traitement du lot: {e}")
+            ESTIMATIONS.labels("failed").inc(len(track_ids))
+            hot_log.error("batch-error", "Erreur lors du traitement du lot: %s", e)
+            for track_id, future in zip(track_ids, futures):
+                if future is not None and not future.done():
+                    future.set_exception(e)
+                    self._forget_future(track_id, future)
     
     def get_result(self, track_id):
         """Récupère le résultat pour un track_id donné"""
@@ -223,20 +512,20 @@ class DimensionEstimationService:
         """Vérifie si un résultat est disponible pour un track_id"""
         return track_id in self.results
     
+    def ack_result(self, track_id):
+        """Signale que le résultat d'un track_id a été livré (il est libéré)"""
+        return self.results.ack(track_id)
+    
     def cleanup_old_results(self, max_age_seconds=300):
         """Nettoie les résultats anciens"""
-        current_time = time.time()
-        keys_to_remove = []
-        
-        for track_id, result in self.results.items():
-            if 'timestamp' in result and current_time - result['timestamp'] > max_age_seconds:
-                keys_to_remove.append(track_id)
-        
-        for track_id in keys_to_remove:
-            del self.results[track_id]
-    
-    def update_correction_factors(self, new_factors):
-        """Met à jour les facteurs de correction"""
-        self.correction_factors.update(new_factors)
-        self.save_calibration()
-        logger.info(f"Facteurs de correction mis à jour: {self.correction_factors}")
\ No newline at end of file
+        return self.results.cleanup(max_age_seconds)
+    
+    def update_correction_factors(self, new_factors, camera=None):
+        """Met à jour les facteurs de correction (nouvelle version, écrite en arrière-plan)"""
+        return self.calibration.update(new_factors, camera)
+    
+    def close(self):
+        """Arrête les processus de régression (mode workers), libère la mémoire partagée et écrit la calibration"""
+        if self.pool is not None:
+            self.pool.close()
+        self.calibration.close()
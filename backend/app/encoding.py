@@ -0,0 +1,53 @@
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from overlay import draw_tracks
+
+
+class JpegEncoder:
+    """Encodeur JPEG : PyTurboJPEG s'il est installé (plus rapide), cv2.imencode sinon"""
+
+    def __init__(self, prefer_turbo=True):
+        self.name = "cv2"
+        self._turbo = None
+        if prefer_turbo:
+            try:
+                from turbojpeg import TurboJPEG
+                self._turbo = TurboJPEG()
+                self.name = "turbojpeg"
+            except (ImportError, OSError, RuntimeError):
+                # Paquet ou bibliothèque libturbojpeg absents
+                pass
+
+    def encode(self, image, quality):
+        """Image BGR -> octets JPEG (None en cas d'échec)"""
+        if self._turbo is not None:
+            return self._turbo.encode(image, quality=quality)
+        ok, buffer = cv2.imencode('.jpg', image, [int(cv2.IMWRITE_JPEG_QUALITY), quality])
+        return buffer.tobytes() if ok else None
+
+
+def render_view(frame, tracked_objects, annotate=True, max_width=None):
+    """
+    Image à encoder pour un groupe de clients : dessin des tracks (clients qui ne dessinent pas
+    eux-mêmes) puis réduction à max_width. Retourne (image, échelle appliquée).
+    """
+    image = draw_tracks(frame.copy(), tracked_objects) if annotate and tracked_objects else frame
+    height, width = frame.shape[:2]
+    if max_width and width > max_width:
+        scale = max_width / width
+        image = cv2.resize(image, (max_width, max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+        return image, scale
+    return image, 1.0
+
+
+def encode_view(encoder, frame, tracked_objects, annotate, quality, max_width):
+    """render_view + encodage ; retourne (jpeg, échelle, (largeur, hauteur), durée en s)"""
+    start = time.perf_counter()
+    image, scale = render_view(frame, tracked_objects, annotate, max_width)
+    jpeg = encoder.encode(image, quality)
+    return jpeg, scale, (image.shape[1], image.shape[0]), time.perf_counter() - start
@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+
+def perceptual_hash(crop, hash_size=8):
+    """
+    Hash perceptuel (pHash, 64 bits pour hash_size=8) d'un crop BGR déjà redimensionné :
+    signe des basses fréquences de la DCT de l'image en niveaux de gris par rapport à leur médiane.
+    Insensible au bruit, à la compression et aux petites variations d'éclairage.
+    """
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    small = cv2.resize(gray, (hash_size * 4, hash_size * 4), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small.astype(np.float32))[:hash_size, :hash_size].ravel()[1:]  # sans la composante continue
+    bits = low > np.median(low)
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class CropSignature:
+    """
+    Hash perceptuel du crop prétraité, couleur moyenne (BGR, que le pHash ignore : deux cartons
+    de même disposition mais de couleurs différentes ont le même hash) et taille (pixels)
+    de la box d'origine
+    """
+    __slots__ = ('phash', 'color', 'width', 'height')
+
+    def __init__(self, phash, color, width, height):
+        self.phash = phash
+        self.color = color
+        self.width = width
+        self.height = height
+
+    @classmethod
+    def of(cls, crop, source_shape):
+        color = np.array(cv2.mean(crop)[:3], dtype=np.float32)
+        return cls(perceptual_hash(crop), color, source_shape[1], source_shape[0])
+
+    def distance(self, other):
+        return (self.phash ^ other.phash).bit_count()
+
+    def same_color(self, other, tolerance):
+        return tolerance is None or float(np.abs(self.color - other.color).max()) <= tolerance
+
+    def same_geometry(self, other, tolerance):
+        if tolerance is None:
+            return True
+        return (abs(self.width - other.width) <= tolerance * max(self.width, other.width)
+                and abs(self.height - other.height) <= tolerance * max(self.height, other.height))
+
+
+class EstimationCache:
+    """
+    Cache des sorties brutes du régresseur, adressé par le contenu du crop :
+    un colis ré-identifié par ByteTrack (nouvel ID après une occlusion) ou re-scanné plus loin
+    sur la ligne réutilise l'estimation d'un crop quasi identique au lieu d'un nouveau forward.
+    - correspondance : distance de Hamming des pHash <= max_distance, couleur moyenne à
+      color_tolerance niveaux près et largeur / hauteur de la box à size_tolerance près
+      (None : pas de contrainte de couleur / de taille)
+    - une entrée n'est jamais servie au track qui l'a produite (vues multiples d'un même colis)
+    - borné en taille (LRU) et en durée (ttl secondes)
+    Les sorties brutes sont mises en cache : la calibration de la caméra est appliquée ensuite.
+    """
+
+    def __init__(self, max_size=256, ttl=120.0, max_distance=6, color_tolerance=12.0, size_tolerance=0.15,
+                 clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self.color_tolerance = color_tolerance
+        self.size_tolerance = size_tolerance
+        self._clock = clock
+        self._entries = OrderedDict()  # clé -> (timestamp, owner, signature, sortie brute)
+        self._lock = threading.Lock()
+        self._next_key = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def lookup(self, signature, owner=None):
+        """Sortie brute du crop le plus proche (None si aucun ne correspond)"""
+        now = self._clock()
+        best, best_distance = None, self.max_distance
+        with self._lock:
+            expired = []
+            for key, (timestamp, entry_owner, entry_signature, raw) in self._entries.items():
+                if now - timestamp > self.ttl:
+                    expired.append(key)
+                    continue
+                if owner is not None and entry_owner == owner:
+                    continue
+                distance = signature.distance(entry_signature)
+                # À distance égale, l'entrée la plus récente (parcours du plus ancien au plus récent)
+                if (distance <= best_distance and signature.same_color(entry_signature, self.color_tolerance)
+                        and signature.same_geometry(entry_signature, self.size_tolerance)):
+                    best, best_distance = key, distance
+            for key in expired:
+                del self._entries[key]
+            self.expirations += len(expired)
+
+            if best is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best)
+            self.hits += 1
+            return self._entries[best][3]
+
+    def put(self, signature, raw, owner=None):
+        """Enregistre la sortie brute (3,) du régresseur pour un crop"""
+        with self._lock:
+            self._entries[self._next_key] = (self._clock(), owner, signature, np.array(raw, dtype=np.float32))
+            self._next_key += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
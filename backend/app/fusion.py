@@ -0,0 +1,133 @@
+import heapq
+import itertools
+
+import numpy as np
+
+DIMENSION_KEYS = ('length_cm', 'width_cm', 'height_cm')
+
+
+def fuse_estimates(estimates, weights=None, method="median"):
+    """
+    Fusionne des estimations (N, 3) d'un même colis.
+    method : "median" (robuste aux vues aberrantes) ou "weighted" (moyenne pondérée par la qualité).
+    Retourne (dimensions (3,), confiance dans [0, 1]) ; la confiance baisse avec la dispersion
+    relative (écart absolu médian / médiane) de la dimension la moins cohérente.
+    """
+    estimates = np.asarray(estimates, dtype=np.float64).reshape(-1, 3)
+    median = np.median(estimates, axis=0)
+    if method == "weighted" and weights is not None:
+        weights = np.maximum(np.asarray(weights, dtype=np.float64), 1e-6)
+        fused = (estimates * weights[:, None]).sum(axis=0) / weights.sum()
+    else:
+        fused = median
+
+    if len(estimates) < 2:
+        return fused, 0.0
+    mad = np.median(np.abs(estimates - median), axis=0) * 1.4826
+    spread = np.max(mad / np.maximum(np.abs(median), 1e-6))
+    return fused, float(np.clip(1.0 - spread, 0.0, 1.0))
+
+
+class TrackViews:
+    """
+    Vues d'un track pour l'estimation multi-vues :
+    - tas borné des top_k crops par score de qualité, renouvelé à chaque tour
+    - estimations déjà obtenues (et leur qualité) sur lesquelles porte la fusion
+    Les crops sont copiés dans top_k tampons réutilisés (agrandis si besoin) : un crop évincé
+    du tas libère son tampon pour le suivant, sans allocation en régime établi.
+    """
+
+    def __init__(self, top_k):
+        self.top_k = top_k
+        self._buffers = [None] * top_k
+        self._crops = [None] * top_k
+        self._heap = []  # (qualité, ordre, index du tampon) : le plus mauvais crop est en tête
+        self._order = itertools.count()
+        self.offered = 0
+        self.submitted = 0
+        self.estimates = []
+        self.weights = []
+        self._submitted_weights = []
+
+    def offer(self, quality, crop):
+        """Garde le crop (vue de la frame) s'il fait partie des top_k meilleurs du tour en cours"""
+        self.offered += 1
+        if len(self._heap) < self.top_k:
+            index = len(self._heap)
+            self._store(index, crop)
+            heapq.heappush(self._heap, (quality, next(self._order), index))
+        elif quality > self._heap[0][0]:
+            index = self._heap[0][2]
+            self._store(index, crop)
+            heapq.heapreplace(self._heap, (quality, next(self._order), index))
+
+    def _store(self, index, crop):
+        """Copie le crop dans le tampon index (réalloué seulement si le crop est plus grand)"""
+        buffer = self._buffers[index]
+        if buffer is None or buffer.size < crop.size:
+            buffer = self._buffers[index] = np.empty(crop.size, dtype=crop.dtype)
+        self._crops[index] = buffer[:crop.size].reshape(crop.shape)
+        np.copyto(self._crops[index], crop)
+
+    def buffered(self):
+        return len(self._heap)
+
+    def take(self):
+        """
+        Retire les crops du tour (meilleur d'abord) et mémorise leur qualité pour la fusion.
+        Les crops retournés sont des vues des tampons du track : à soumettre avant le prochain offer().
+        """
+        views = sorted(self._heap, reverse=True)
+        self._heap = []
+        self.offered = 0
+        self.submitted += len(views)
+        self._submitted_weights = [quality for quality, _, _ in views]
+        return [self._crops[index] for _, _, index in views]
+
+    def add_results(self, results):
+        """Ajoute les résultats du service (un dictionnaire par vue soumise)"""
+        for weight, result in zip(self._submitted_weights, results):
+            if result is not None:
+                self.estimates.append([result[key] for key in DIMENSION_KEYS])
+                self.weights.append(weight)
+        self._submitted_weights = []
+
+
+class MultiViewFusion:
+    """
+    Politique d'estimation multi-vues par track : chaque tour soumet les top_k meilleurs crops
+    parmi collect_frames frames en un seul lot, puis fusionne toutes les estimations du track.
+    On s'arrête dès que la confiance atteint min_confidence ou après max_views vues :
+    le calcul n'est dépensé en plus que pour les colis dont l'estimation reste incertaine.
+    """
+
+    def __init__(self, top_k=3, collect_frames=8, max_views=9, min_confidence=0.9, method="median"):
+        self.top_k = top_k
+        self.collect_frames = collect_frames
+        self.max_views = max_views
+        self.min_confidence = min_confidence
+        self.method = method
+
+    def new_track(self):
+        return TrackViews(self.top_k)
+
+    def ready(self, views):
+        """Un tour est prêt quand la fenêtre de collecte est écoulée"""
+        return views.buffered() > 0 and views.offered >= self.collect_frames
+
+    def fuse(self, views):
+        """Résultat fusionné au format du service de dimensions (None sans estimation)"""
+        if not views.estimates:
+            return None
+        fused, confidence = fuse_estimates(views.estimates, views.weights, self.method)
+        result = {key: float(value) for key, value in zip(DIMENSION_KEYS, fused)}
+        result['confidence'] = confidence
+        result['views'] = len(views.estimates)
+        return result
+
+    def done(self, views, result):
+        """Estimation terminée : assez confiante, ou plus de vues à dépenser"""
+        if views.submitted >= self.max_views:
+            return True
+        return (result is not None and len(views.estimates) >= min(self.top_k, self.max_views) and
+                result['confidence'] >= self.min_confidence)
@@ -0,0 +1,228 @@
+import os
+import logging
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INPUT_SIZE = 224
+
+
+class EagerBackend:
+    """PyTorch eager fp32 (référence), optionnellement en channels_last"""
+    name = "eager"
+
+    def __init__(self, model, device, channels_last=False):
+        self.device = device
+        self.channels_last = channels_last
+        self.model = model.to(device).eval()
+        if channels_last:
+            self.model = self.model.to(memory_format=torch.channels_last)
+
+    def _prepare(self, batch):
+        batch = batch.to(self.device)
+        if self.channels_last:
+            batch = batch.contiguous(memory_format=torch.channels_last)
+        return batch
+
+    def __call__(self, batch):
+        """batch: tenseur (N, 3, 224, 224) normalisé -> np.ndarray (N, 3) en cm"""
+        with torch.inference_mode():
+            return self.model(self._prepare(batch)).float().cpu().numpy()
+
+
+def _is_fresh(artifact_path, source_path=None):
+    """Vrai si l'artefact existe et n'est pas plus ancien que le fichier dont il dérive"""
+    if not os.path.exists(artifact_path):
+        return False
+    return source_path is None or not os.path.exists(source_path) or \
+        os.path.getmtime(source_path) <= os.path.getmtime(artifact_path)
+
+
+class TorchScriptBackend(EagerBackend):
+    """
+    Modèle tracé avec torch.jit puis figé pour l'inférence. Le graphe figé est mis en cache
+    dans artifact_path : les démarrages suivants le rechargent sans timm ni traçage.
+    """
+    name = "torchscript"
+
+    def __init__(self, model, device, channels_last=False, batch_size=4, artifact_path=None, model_path=None):
+        if artifact_path and _is_fresh(artifact_path, model_path):
+            self.device = device
+            self.channels_last = channels_last
+            frozen = torch.jit.load(artifact_path, map_location=device)
+            logger.info(f"Modèle TorchScript rechargé depuis {artifact_path}")
+        else:
+            super().__init__(model, device, channels_last)
+            example = self._prepare(torch.randn(batch_size, 3, INPUT_SIZE, INPUT_SIZE))
+            with torch.inference_mode():
+                traced = torch.jit.trace(self.model, example)
+            frozen = torch.jit.freeze(traced.eval())
+            if artifact_path:
+                try:
+                    torch.jit.save(frozen, artifact_path)
+                    logger.info(f"Modèle TorchScript mis en cache: {artifact_path}")
+                except (OSError, RuntimeError) as e:
+                    logger.warning(f"Impossible de mettre en cache le modèle TorchScript: {e}")
+        self.model = torch.jit.optimize_for_inference(frozen)
+
+
+class CompileBackend(EagerBackend):
+    """Modèle compilé avec torch.compile (PyTorch >= 2.0)"""
+    name = "compile"
+
+    def __init__(self, model, device, channels_last=False):
+        super().__init__(model, device, channels_last)
+        self.model = torch.compile(self.model, dynamic=True)
+
+
+class DynamicQuantBackend(EagerBackend):
+    """
+    Quantification INT8 dynamique des couches Linear (CPU uniquement).
+    Dans ConvNeXtV2 les MLP des blocs sont des nn.Linear : c'est l'essentiel du calcul.
+    """
+    name = "int8-dynamic"
+
+    def __init__(self, model, device, channels_last=False):
+        super().__init__(model, torch.device("cpu"), channels_last)
+        self.model = torch.ao.quantization.quantize_dynamic(self.model, {nn.Linear}, dtype=torch.qint8)
+
+
+class OnnxBackend:
+    """Export ONNX du régresseur exécuté avec ONNX Runtime (CPU)"""
+    name = "onnx"
+    device = torch.device("cpu")
+
+    def __init__(self, model, onnx_path, model_path=None, threads=None):
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError("Le backend ONNX nécessite le paquet onnxruntime")
+
+        self.onnx_path = onnx_path
+        if self._needs_export(model_path):
+            export_onnx(model, onnx_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(self._session_path(), options,
+                                            providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def _session_path(self):
+        return self.onnx_path
+
+    def _needs_export(self, model_path):
+        # Réexporter si les poids sont plus récents que l'export
+        return not _is_fresh(self.onnx_path, model_path)
+
+    def __call__(self, batch):
+        inputs = batch.detach().cpu().numpy().astype(np.float32, copy=False)
+        return self.session.run(None, {self.input_name: inputs})[0]
+
+
+class OnnxStaticQuantBackend(OnnxBackend):
+    """
+    Quantification INT8 statique avec ONNX Runtime, calibrée sur des lots représentatifs
+    (calibration_batches : liste de tenseurs (N, 3, 224, 224) déjà prétraités).
+    """
+    name = "onnx-int8-static"
+
+    def __init__(self, model, onnx_path, model_path=None, threads=None, calibration_batches=None):
+        self.quantized_path = onnx_path.replace(".onnx", ".int8.onnx")
+        self.calibration_batches = calibration_batches
+        super().__init__(model, onnx_path, model_path, threads)
+
+    def _session_path(self):
+        if not _is_fresh(self.quantized_path, self.onnx_path):
+            self._quantize()
+        return self.quantized_path
+
+    def _quantize(self):
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+        if not self.calibration_batches:
+            raise RuntimeError("La quantification statique nécessite des lots de calibration")
+
+        class _Reader(CalibrationDataReader):
+            def __init__(self, batches):
+                self._batches = iter([{"input": b.detach().cpu().numpy().astype(np.float32)} for b in batches])
+
+            def get_next(self):
+                return next(self._batches, None)
+
+        quantize_static(self.onnx_path, self.quantized_path, _Reader(self.calibration_batches),
+                        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8, per_channel=True)
+        logger.info(f"Modèle ONNX INT8 statique écrit dans {self.quantized_path}")
+
+
+def export_onnx(model, onnx_path, opset=17):
+    """Exporte le régresseur en ONNX avec une dimension de lot dynamique"""
+    model = model.to("cpu").eval()
+    dummy_input = torch.randn(1, 3, INPUT_SIZE, INPUT_SIZE)
+    with torch.inference_mode():
+        torch.onnx.export(model, dummy_input, onnx_path, input_names=["input"], output_names=["dimensions"],
+                          dynamic_axes={"input": {0: "batch"}, "dimensions": {0: "batch"}},
+                          opset_version=opset)
+    logger.info(f"Modèle exporté en ONNX: {onnx_path}")
+
+
+BACKENDS = ("eager", "torchscript", "compile", "int8-dynamic", "onnx", "onnx-int8-static")
+
+
+def _onnx_path(model_path):
+    return os.path.splitext(model_path)[0] + ".onnx" if model_path else "model_dimensions.onnx"
+
+
+def torchscript_path(model_path, device, channels_last=False):
+    """Artefact TorchScript à côté des poids (un par type de device et format mémoire)"""
+    suffix = "-cl" if channels_last else ""
+    return f"{os.path.splitext(model_path)[0]}.{torch.device(device).type}{suffix}.ts"
+
+
+def artifact_ready(name, model_path, device, channels_last=False):
+    """
+    Vrai si le backend peut être construit depuis un artefact sérialisé à jour,
+    sans instancier le modèle eager (timm) ni charger les poids.
+    """
+    if not model_path:
+        return False
+    if name == "torchscript":
+        return _is_fresh(torchscript_path(model_path, device, channels_last), model_path)
+    onnx_path = _onnx_path(model_path)
+    if name == "onnx":
+        return _is_fresh(onnx_path, model_path)
+    if name == "onnx-int8-static":
+        return _is_fresh(onnx_path, model_path) and _is_fresh(onnx_path.replace(".onnx", ".int8.onnx"), onnx_path)
+    return False
+
+
+def create_backend(name, model, device, model_path=None, batch_size=4, channels_last=False,
+                   calibration_batches=None):
+    """
+    Construit le backend d'inférence demandé pour le régresseur de dimensions.
+    model peut être None si artifact_ready() : le backend est rechargé depuis son artefact.
+    """
+    onnx_path = _onnx_path(model_path)
+
+    if name == "eager":
+        return EagerBackend(model, device, channels_last)
+    if name == "torchscript":
+        artifact_path = torchscript_path(model_path, device, channels_last) if model_path else None
+        return TorchScriptBackend(model, device, channels_last, batch_size, artifact_path, model_path)
+    if name == "compile":
+        return CompileBackend(model, device, channels_last)
+    if name == "int8-dynamic":
+        return DynamicQuantBackend(model, device, channels_last)
+    if name == "onnx":
+        return OnnxBackend(model, onnx_path, model_path)
+    if name == "onnx-int8-static":
+        return OnnxStaticQuantBackend(model, onnx_path, model_path, calibration_batches=calibration_batches)
+    raise ValueError(f"Backend d'inférence inconnu: {name} (disponibles: {', '.join(BACKENDS)})")
@@ -0,0 +1,151 @@
+import cv2
+import numpy as np
+
+
+class InferenceScaler:
+    """
+    Entrée de YOLO pour les caméras haute résolution (4K) : le modèle voit une copie réduite
+    et / ou découpée en tuiles de l'image, les boxes sont ramenées en coordonnées natives.
+    - max_side : plus grand côté de l'image vue par YOLO (réduction INTER_AREA, une seule fois
+      par frame) ; None : résolution native. Sans effet sur les images déjà plus petites.
+    - tiles : (colonnes, lignes) de tuiles de cette image, qui se chevauchent de overlap
+      (fraction de la tuile) et passent dans YOLO comme les images d'un même lot : après le
+      letterbox du modèle, un petit colis garde plus de pixels qu'avec l'image entière.
+      Les morceaux d'un colis coupé par une frontière de tuile sont fusionnés.
+    Seule la détection change de résolution : les crops envoyés au régresseur sont pris dans
+    la frame native, et la qualité est évaluée à l'échelle vue par YOLO (scale).
+    """
+
+    def __init__(self, max_side=None, tiles=None, overlap=0.2, merge_threshold=0.5, edge_margin=2):
+        self.max_side = max_side
+        self.tiles = tuple(tiles) if tiles else (1, 1)
+        self.overlap = overlap
+        self.merge_threshold = merge_threshold
+        self.edge_margin = edge_margin
+        self._shape = None
+        self._geometry = None
+
+        self.frames = 0
+        self.images = 0
+        self.merged = 0
+
+    def geometry(self, shape):
+        """(échelle, taille (l, h) de l'image vue par YOLO, fenêtres (K, 4) x, y, l, h) pour une taille d'image"""
+        if shape[:2] != self._shape:
+            height, width = shape[:2]
+            scale = 1.0
+            if self.max_side and max(width, height) > self.max_side:
+                scale = self.max_side / max(width, height)
+            view_w, view_h = max(1, round(width * scale)), max(1, round(height * scale))
+            columns, rows = self.tiles
+            xs, tile_w = self._axis(view_w, columns)
+            ys, tile_h = self._axis(view_h, rows)
+            windows = np.array([(x, y, tile_w, tile_h) for y in ys for x in xs], dtype=np.int64)
+            self._shape = shape[:2]
+            self._geometry = (scale, (view_w, view_h), windows)
+        return self._geometry
+
+    def _axis(self, length, count):
+        """Positions et taille des tuiles le long d'un axe (la dernière tuile touche le bord)"""
+        if count <= 1:
+            return [0], length
+        size = int(np.ceil(length / (count - (count - 1) * self.overlap)))
+        size = min(size, length)
+        step = (length - size) / (count - 1)
+        return [int(round(i * step)) for i in range(count)], size
+
+    @property
+    def scale(self):
+        """Échelle de la dernière image découpée (1.0 : résolution native)"""
+        return self._geometry[0] if self._geometry is not None else 1.0
+
+    def split(self, image):
+        """Images à passer à YOLO pour une image native (vues sans copie dans la copie réduite)"""
+        scale, size, windows = self.geometry(image.shape)
+        view = image if scale == 1.0 else cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        self.frames += 1
+        self.images += len(windows)
+        if len(windows) == 1:
+            return [view]
+        return [view[y:y + h, x:x + w] for x, y, w, h in windows.tolist()]
+
+    def to_native(self, parts, shape):
+        """
+        Détections (N, 6) x1, y1, x2, y2, score, classe de chaque image de split(), dans le repère
+        de l'image native de taille shape ; les doublons et morceaux des tuiles sont fusionnés.
+        """
+        scale, (view_w, view_h), windows = self.geometry(shape)
+        if len(windows) == 1:
+            data = np.array(parts[0], dtype=np.float32).reshape(-1, 6)
+            data[:, :4] /= scale
+        else:
+            data, clipped = self._from_tiles(parts, windows, view_w, view_h)
+            if len(data) > 1:
+                data = self._merge(data, clipped)
+            data[:, :4] /= scale
+        data[:, [0, 2]] = np.clip(data[:, [0, 2]], 0, shape[1])
+        data[:, [1, 3]] = np.clip(data[:, [1, 3]], 0, shape[0])
+        return data
+
+    def _from_tiles(self, parts, windows, view_w, view_h):
+        """Boxes dans le repère de l'image réduite + boxes coupées par une frontière intérieure (x, y)"""
+        rows, clipped = [], []
+        margin = self.edge_margin
+        for (x, y, w, h), boxes in zip(windows.tolist(), parts):
+            boxes = np.array(boxes, dtype=np.float32).reshape(-1, 6)
+            if not len(boxes):
+                continue
+            clip_x = ((x > 0) & (boxes[:, 0] <= margin)) | ((x + w < view_w) & (boxes[:, 2] >= w - margin))
+            clip_y = ((y > 0) & (boxes[:, 1] <= margin)) | ((y + h < view_h) & (boxes[:, 3] >= h - margin))
+            boxes[:, :4] += (x, y, x, y)
+            rows.append(boxes)
+            clipped.append(np.stack([clip_x, clip_y], axis=1))
+        if not rows:
+            return np.empty((0, 6), dtype=np.float32), np.empty((0, 2), dtype=bool)
+        return np.concatenate(rows), np.concatenate(clipped)
+
+    def _merge(self, data, clipped):
+        """
+        Fusion gloutonne par score décroissant : une box rejoint un groupe de même classe
+        si leur intersection couvre merge_threshold de la plus petite, ou si l'une est coupée
+        par une frontière de tuile et qu'elles se recouvrent sur merge_threshold de l'autre axe
+        (deux morceaux d'un même colis). La box du groupe est l'union, son score le maximum.
+        """
+        threshold = self.merge_threshold
+        groups = []  # [box (4,), score, classe, coupée en x, coupée en y]
+        for i in np.argsort(-data[:, 4], kind="stable").tolist():
+            box = data[i, :4].copy()
+            clip_x, clip_y = bool(clipped[i, 0]), bool(clipped[i, 1])
+            for group in groups:
+                other = group[0]
+                if group[2] != data[i, 5]:
+                    continue
+                ix = min(box[2], other[2]) - max(box[0], other[0])
+                iy = min(box[3], other[3]) - max(box[1], other[1])
+                if ix <= 0 or iy <= 0:
+                    continue
+                w, h = min(box[2] - box[0], other[2] - other[0]), min(box[3] - box[1], other[3] - other[1])
+                same = (ix * iy >= threshold * w * h
+                        or ((clip_x or group[3]) and iy >= threshold * h)
+                        or ((clip_y or group[4]) and ix >= threshold * w))
+                if same:
+                    other[:2] = np.minimum(other[:2], box[:2])
+                    other[2:] = np.maximum(other[2:], box[2:])
+                    group[3] |= clip_x
+                    group[4] |= clip_y
+                    self.merged += 1
+                    break
+            else:
+                groups.append([box, float(data[i, 4]), float(data[i, 5]), clip_x, clip_y])
+        return np.array([[*box, score, cls] for box, score, cls, _, _ in groups], dtype=np.float32)
+
+    def stats(self):
+        scale, (view_w, view_h), windows = self._geometry if self._geometry is not None else (1.0, (0, 0), [])
+        return {
+            'scale': round(scale, 4),
+            'view': [view_w, view_h],
+            'tiles': len(windows),
+            'frames': self.frames,
+            'yolo_images': self.images,
+            'merged_boxes': self.merged,
+        }
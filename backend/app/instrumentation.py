@@ -0,0 +1,363 @@
+import bisect
+import logging
+import threading
+import time
+from collections import deque
+
+# Métriques au format texte Prometheus (sans dépendance), traces par frame optionnelles
+# et logs limités en débit pour les chemins chauds.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+    suffix = ""  # les compteurs sont exposés sous le nom <name>_total
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._new_child()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Série pour un jeu de valeurs d'étiquettes (mise en cache : à garder dans le code appelant)"""
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _series(self):
+        if not self.labelnames:
+            return [((), self._default)]
+        with self._lock:
+            return list(self._children.items())
+
+    def render(self):
+        family = self.name + self.suffix
+        lines = [f"# HELP {family} {self.documentation}", f"# TYPE {family} {self.kind}"]
+        for values, child in self._series():
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class _Value:
+    __slots__ = ('value', '_lock', 'function')
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+        self.function = None
+
+    def inc(self, amount=1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1.0):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = float(value)
+
+    def set_function(self, function):
+        """Valeur calculée à chaque lecture de /metrics (profondeur de file, taille d'un cache...)"""
+        self.function = function
+
+    def get(self):
+        if self.function is not None:
+            try:
+                return float(self.function())
+            except Exception:
+                return float("nan")
+        return self.value
+
+
+class Counter(_Metric):
+    kind = "counter"
+    suffix = "_total"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self._default.set(value)
+
+    def inc(self, amount=1.0):
+        self._default.inc(amount)
+
+    def dec(self, amount=1.0):
+        self._default.dec(amount)
+
+    def set_function(self, function):
+        self._default.set_function(function)
+
+    def remove(self, *values):
+        with self._lock:
+            self._children.pop(tuple(str(v) for v in values), None)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.get())}"]
+
+
+class _HistogramValue:
+    __slots__ = ('bounds', 'counts', 'sum', '_lock')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        return _Timer(self)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.bounds)
+
+    def observe(self, value):
+        self._default.observe(value)
+
+    def time(self):
+        return _Timer(self._default)
+
+    def _render_child(self, values, child):
+        with child._lock:
+            counts, total = list(child.counts), child.sum
+        lines, cumulative = [], 0
+        for bound, count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, values, ("le", _format_value(bound)))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, values)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        """Exposition texte Prometheus (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# Traces par frame : désactivées par défaut, une frame sur sample_every quand elles sont actives
+
+class FrameTrace:
+    __slots__ = ('camera', 'seq', 'started_at', 'spans')
+
+    def __init__(self, camera, seq):
+        self.camera = camera
+        self.seq = seq
+        self.started_at = time.perf_counter()
+        self.spans = []  # (étape, début relatif ms, durée ms)
+
+    def add(self, name, start, duration):
+        self.spans.append((name, round((start - self.started_at) * 1000.0, 3), round(duration * 1000.0, 3)))
+
+    def to_dict(self):
+        return {'camera': self.camera, 'seq': self.seq,
+                'spans': [{'name': n, 'start_ms': s, 'duration_ms': d} for n, s, d in self.spans]}
+
+
+class Tracer:
+    """
+    Traces par frame : begin() rattache une trace au thread courant, chaque étape chronométrée
+    (stage_timer) y ajoute un span, end() la range dans un tampon circulaire (/traces).
+    """
+
+    def __init__(self, enabled=False, sample_every=1, max_traces=256):
+        self.enabled = enabled
+        self.sample_every = max(1, sample_every)
+        self._traces = deque(maxlen=max_traces)
+        self._local = threading.local()
+        self._count = 0
+
+    def begin(self, camera, seq):
+        if not self.enabled:
+            return None
+        self._count += 1
+        if self._count % self.sample_every:
+            return None
+        trace = FrameTrace(camera, seq)
+        self._local.trace = trace
+        return trace
+
+    def current(self):
+        return getattr(self._local, 'trace', None)
+
+    def end(self, trace):
+        if trace is None:
+            return
+        self._local.trace = None
+        self._traces.append(trace)
+
+    def recent(self, limit=50):
+        return [trace.to_dict() for trace in list(self._traces)[-limit:]]
+
+
+TRACER = Tracer()
+
+
+class _Timer:
+    """Chronomètre une étape : observation dans l'histogramme + span de la trace courante"""
+    __slots__ = ('_histogram', '_name', '_start')
+
+    def __init__(self, histogram, name=None):
+        self._histogram = histogram
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        self._histogram.observe(elapsed)
+        if self._name is not None:
+            trace = TRACER.current()
+            if trace is not None:
+                trace.add(self._name, self._start, elapsed)
+        return False
+
+
+# Métriques du pipeline
+
+STAGE_SECONDS = Histogram("baridvision_stage_seconds",
+                          "Durée des étapes du pipeline (detect, track, quality, preprocess, regress, encode, send)",
+                          ["stage"])
+FRAMES = Counter("baridvision_frames", "Frames traitées par caméra (detected : YOLO, propagated : sans détection, gated : zone immobile)",
+                 ["camera", "kind"])
+ACTIVE_TRACKS = Gauge("baridvision_active_tracks", "Tracks suivis dans la dernière frame détectée", ["camera"])
+ESTIMATIONS = Counter("baridvision_estimations", "Estimations de dimensions (submitted, cached, completed, failed)",
+                      ["outcome"])
+DIMENSIONS = Counter("baridvision_dimensions", "Dimensions validées ou rejetées par le détecteur", ["result"])
+DIMENSION_QUEUE_DEPTH = Gauge("baridvision_dimension_queue_depth", "Crops en attente du micro-batcher")
+RESULT_STORE_SIZE = Gauge("baridvision_result_store_size", "Résultats de dimensions conservés (ResultStore)")
+CROP_POOL_IN_USE = Gauge("baridvision_crop_pool_in_use", "Tampons de crops occupés")
+WS_CLIENTS = Gauge("baridvision_ws_clients", "Clients WebSocket connectés", ["protocol"])
+WS_BYTES = Counter("baridvision_ws_sent_bytes", "Octets envoyés aux clients WebSocket", ["protocol"])
+BILLING_RECORDS = Counter("baridvision_billing_records", "Lignes de facturation (queued, written, failed)",
+                          ["outcome"])
+
+_STAGE_CHILDREN = {}
+
+
+def stage_timer(stage):
+    """with stage_timer("detect"): ... — histogramme baridvision_stage_seconds + span de trace"""
+    child = _STAGE_CHILDREN.get(stage)
+    if child is None:
+        child = _STAGE_CHILDREN[stage] = STAGE_SECONDS.labels(stage)
+    return _Timer(child, stage)
+
+
+def observe_stage(stage, seconds):
+    """Durée d'une étape mesurée ailleurs (encodage, envoi)"""
+    child = _STAGE_CHILDREN.get(stage)
+    if child is None:
+        child = _STAGE_CHILDREN[stage] = STAGE_SECONDS.labels(stage)
+    child.observe(seconds)
+
+
+class RateLimitedLog:
+    """
+    Logs des chemins chauds : formatage paresseux (%-style, fait seulement si le message part)
+    et au plus un message par clé et par intervalle ; les messages supprimés sont comptés
+    et signalés dans le message suivant.
+    """
+
+    def __init__(self, logger, interval=5.0):
+        self.logger = logger
+        self.interval = interval
+        self._last = {}
+        self._suppressed = {}
+        self._lock = threading.Lock()
+
+    def log(self, level, key, message, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, -self.interval) < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            message = f"{message} (+%d messages similaires)"
+            args = args + (suppressed,)
+        self.logger.log(level, message, *args)
+
+    def info(self, key, message, *args):
+        self.log(logging.INFO, key, message, *args)
+
+    def warning(self, key, message, *args):
+        self.log(logging.WARNING, key, message, *args)
+
+    def error(self, key, message, *args):
+        self.log(logging.ERROR, key, message, *args)
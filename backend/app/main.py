@@ -2,12 +2,22 @@ import cv2
 import asyncio
 import os
 import json
+import sys
+import time
 import numpy as np
-import torch
-from fastapi import FastAPI, WebSocket
-from app.yolov8 import YOLOv8Detector
+from fastapi import FastAPI, File, UploadFile, WebSocket
+from fastapi.responses import JSONResponse, Response
+from app.camera_registry import Subscriber
+from app.startup import BackgroundInitializer
+from app.stream_protocol import pack_message
+from app.billing import BillingSink
+from app.async_api import AsyncDetector, Overloaded
 import logging
 
+# Même instance du module que le pipeline (importé sans préfixe app.) : un seul registre de métriques
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from instrumentation import CONTENT_TYPE, REGISTRY, TRACER, WS_CLIENTS
+
 # Configuration du logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -17,39 +27,297 @@ app = FastAPI()
 # Configuration modèle + tracker
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "../models/best.pt")
 TRACKER_CONFIG = os.path.join(os.path.dirname(__file__), "bytetrack.yaml")
+DIMENSION_MODEL_PATH = os.path.join(os.path.dirname(__file__), "../models/model_dimensions.pt")
+STATS_LOG_INTERVAL = 10.0  # secondes entre deux logs de latence du pipeline
+
+# Caméras disponibles : nom -> index webcam ou URL (cv2.VideoCapture)
+CAMERA_SOURCES = {
+    "default": 0,
+}
+# Regrouper les frames de toutes les caméras dans une seule passe YOLO
+BATCHED_INFERENCE = True
+# Estimer chaque colis sur ses meilleures vues fusionnées plutôt que sur un seul crop
+MULTI_VIEW_ESTIMATION = False
+# Cadence adaptative : FPS visé, budget de latence de la détection (ms, None = 1 / FPS)
+# et nombre max de frames entre deux détections complètes
+TARGET_FPS = 30.0
+LATENCY_BUDGET_MS = None
+MAX_DETECTION_SKIP = 4
+# Processus dédiés à la régression des dimensions (0 : thread dans le processus du serveur)
+DIMENSION_WORKERS = 0
+# Backend du régresseur (eager par défaut). "torchscript" : le graphe figé est mis en cache à côté
+# des poids (model_dimensions.<device>.ts) et rechargé aux démarrages suivants sans timm ; à valider
+# avec benchmarks/validate_backends.py avant de l'activer en production
+DIMENSION_BACKEND = "eager"
+DIMENSION_BATCH_SIZE = 4
+# Colis ré-identifié (nouvel ID ByteTrack) ou re-scanné : réutiliser l'estimation d'un crop quasi identique
+# (distance de Hamming des pHash sur 64 bits, tolérance sur la taille de la box ; None : désactivé)
+ESTIMATION_CACHE = {'max_size': 256, 'ttl': 120.0, 'max_distance': 6, 'size_tolerance': 0.15}
+MAX_BATCH = 8
+# Zone du tapis envoyée à YOLO, par caméra : (x1, y1, x2, y2) en pixels ou en fractions de la frame
+INSPECTION_ZONES = {}
+# Pas de YOLO sur les frames où la zone n'a pas bougé depuis la dernière détection
+# (paramètres de MotionGate, None : désactivé)
+MOTION_GATE = {'pixel_threshold': 25, 'min_changed': 0.002, 'max_idle_frames': 60}
+# Résolution de détection pour les caméras haute résolution : YOLO voit une copie réduite (plus grand côté
+# max_side) et / ou découpée en tuiles (tiles=(colonnes, lignes)) ; les crops du régresseur restent natifs.
+# Sans effet sur les frames plus petites que max_side (None : frame native)
+INFERENCE_SCALING = {'max_side': 1920, 'tiles': None}
+# Taille de frame utilisée pour préchauffer YOLO
+WARMUP_FRAME_SHAPE = (720, 1280, 3)
+# Images de debug des ROI (écrites en arrière-plan) : une frame sur N, au plus X images / s
+DEBUG_ROI_DUMPS = True
+DEBUG_ROI_SAMPLE_EVERY = 30
+DEBUG_ROI_MAX_PER_SECOND = 5.0
+# Traces par frame (spans detect / track / quality) exposées sur /traces : une frame sur N
+TRACE_FRAMES = False
+TRACE_SAMPLE_EVERY = 10
+TRACER.enabled = TRACE_FRAMES
+TRACER.sample_every = TRACE_SAMPLE_EVERY
+# Facturation : chaque colis mesuré est enregistré en arrière-plan (sqlite, csv ou parquet ;
+# pour csv / parquet, BILLING_PATH est un dossier de fichiers tournants). None : désactivé
+BILLING_BACKEND = "sqlite"
+BILLING_PATH = os.path.join(os.path.dirname(__file__), "../data/billing.sqlite")
+BILLING_FLUSH_INTERVAL = 1.0
+# /measure (image isolée) : threads dédiés et requêtes admises en même temps (au-delà : 429)
+MEASURE_WORKERS = 2
+MEASURE_MAX_PENDING = 4
+# Attente max (s) des modèles pour une connexion /ws arrivée pendant le démarrage
+WS_READY_TIMEOUT = 30.0
+
+# Modèles chargés en arrière-plan : le serveur répond dès l'import (voir /ready)
+detector = None
+dimension_service = None
+camera_registry = None
+billing = None
+async_detector = None
+
+def build_services(step):
+    """Imports lourds, chargement des poids et préchauffage aux tailles de lot réelles"""
+    global detector, dimension_service, camera_registry, async_detector
+    with step("imports"):
+        from app.yolov8 import YOLOv8Detector
+        from app.dimension_service import DimensionEstimationService
+        from app.camera_registry import CameraRegistry
+        from app.debug_writer import DebugImageWriter
+
+    with step("dimension_weights"):
+        service = DimensionEstimationService(DIMENSION_MODEL_PATH, batch_size=DIMENSION_BATCH_SIZE,
+                                             backend=DIMENSION_BACKEND, workers=DIMENSION_WORKERS, warmup=False,
+                                             estimation_cache=ESTIMATION_CACHE)
+    with step("dimension_warmup"):
+        if not DIMENSION_WORKERS:
+            service.warmup()
+
+    with step("yolo_weights"):
+        # Instanciation du détecteur avec estimation des dimensions
+        debug_writer = DebugImageWriter("/tmp/debug_frames", sample_every=DEBUG_ROI_SAMPLE_EVERY,
+                                        max_per_second=DEBUG_ROI_MAX_PER_SECOND, enabled=DEBUG_ROI_DUMPS)
+        yolo = YOLOv8Detector(MODEL_PATH, TRACKER_CONFIG, dimension_service=service, fusion=MULTI_VIEW_ESTIMATION,
+                              debug_writer=debug_writer, inspection_zones=INSPECTION_ZONES,
+                              motion_gate=MOTION_GATE, inference_scaling=INFERENCE_SCALING)
+    with step("yolo_warmup"):
+        batch_sizes = {1, min(len(CAMERA_SOURCES), MAX_BATCH)} if BATCHED_INFERENCE else {1}
+        yolo.warmup(WARMUP_FRAME_SHAPE, batch_sizes)
+
+    # Une capture + une boucle de détection par caméra, partagées entre les clients
+    registry = CameraRegistry(yolo, CAMERA_SOURCES, batched=BATCHED_INFERENCE, max_batch=MAX_BATCH,
+                              pacing={'target_fps': TARGET_FPS, 'latency_budget_ms': LATENCY_BUDGET_MS,
+                                      'max_skip': MAX_DETECTION_SKIP},
+                              billing=billing)
+    # Détection à la demande (/measure) hors de la boucle d'événements, sous le même verrou YOLO
+    measure = AsyncDetector(yolo, max_workers=MEASURE_WORKERS, max_pending=MEASURE_MAX_PENDING,
+                            detector_lock=registry.detector_lock)
+    dimension_service, detector, camera_registry, async_detector = service, yolo, registry, measure
+
+startup = BackgroundInitializer(build_services)
 
-# Instanciation du détecteur avec estimation des dimensions
-detector = YOLOv8Detector(MODEL_PATH, TRACKER_CONFIG)
+@app.on_event("startup")
+def start_models():
+    """Lance le chargement des modèles sans bloquer le démarrage du serveur"""
+    global billing
+    if BILLING_BACKEND is not None:
+        # Ouvert avant les modèles : l'historique de facturation est consultable pendant le démarrage
+        billing = BillingSink(BILLING_PATH, backend=BILLING_BACKEND, flush_interval=BILLING_FLUSH_INTERVAL)
+    startup.start()
+
+@app.on_event("shutdown")
+def shutdown():
+    """Arrête les processus de régression et libère leur mémoire partagée"""
+    if async_detector is not None:
+        async_detector.close()
+    if dimension_service is not None:
+        dimension_service.close()
+    if billing is not None:
+        billing.close()
+
+@app.get("/health")
+async def health():
+    """Vivacité : le processus répond, modèles chargés ou non"""
+    return {'status': 'ok'}
+
+@app.get("/ready")
+async def ready():
+    """Disponibilité : 200 quand les modèles sont chargés et préchauffés, 503 sinon"""
+    return JSONResponse(startup.stats(), status_code=200 if startup.ready else 503)
+
+@app.get("/metrics")
+async def metrics():
+    """Histogrammes, jauges et compteurs du pipeline au format texte Prometheus"""
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/traces")
+async def traces(limit: int = 50):
+    """Dernières traces par frame (TRACE_FRAMES doit être activé)"""
+    return {'enabled': TRACER.enabled, 'traces': TRACER.recent(limit)}
+
+@app.get("/billing/parcels")
+async def billing_parcels(camera: str = None, since: float = None, until: float = None,
+                          limit: int = 100, offset: int = 0):
+    """Colis mesurés, les plus récents d'abord (since / until : secondes epoch), lus dans le stockage"""
+    if billing is None:
+        return JSONResponse({'error': 'facturation désactivée'}, status_code=503)
+    loop = asyncio.get_running_loop()
+    # Limite bornée dans [0, 1000] : une limite négative vaudrait « tout » pour SQLite
+    return await loop.run_in_executor(None, billing.query, camera, since, until, max(0, min(limit, 1000)),
+                                      max(0, offset))
+
+@app.get("/billing/summary")
+async def billing_summary(camera: str = None, since: float = None, until: float = None):
+    """Nombre de colis et poids volumétrique / facturé cumulés sur une période"""
+    if billing is None:
+        return JSONResponse({'error': 'facturation désactivée'}, status_code=503)
+    loop = asyncio.get_running_loop()
+    summary = await loop.run_in_executor(None, billing.summary, camera, since, until)
+    summary['sink'] = billing.stats()
+    return summary
+
+@app.post("/measure")
+async def measure(image: UploadFile = File(...), camera: str = "upload"):
+    """Dimensions des colis d'une image envoyée (JPEG / PNG), sans bloquer les flux en cours"""
+    if not startup.ready:
+        return JSONResponse(startup.stats(), status_code=503)
+    # Le nom de caméra sert de label Prometheus et de profil de calibration : seuls les noms
+    # configurés sont acceptés (cardinalité des labels bornée)
+    profiles = detector.dimension_service.calibration.snapshot.profiles
+    if camera != "upload" and camera not in CAMERA_SOURCES and camera not in profiles:
+        return JSONResponse({'error': f"caméra inconnue: {camera}"}, status_code=400)
+    frame = cv2.imdecode(np.frombuffer(await image.read(), dtype=np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return JSONResponse({'error': 'image illisible'}, status_code=400)
+    try:
+        tracks, records = await async_detector.measure(frame, camera)
+    except Overloaded as e:
+        return JSONResponse({'error': str(e)}, status_code=429, headers={'Retry-After': '1'})
+    return {
+        'tracks': [{'id': obj.track_id, 'bbox': list(obj.to_tlwh())} for obj in tracks],
+        'dimensions': records,
+    }
+
+@app.get("/stats")
+async def pipeline_stats():
+    """Latence par étape des caméras actives + métriques du micro-batcher de dimensions"""
+    if not startup.ready:
+        return {'_startup': startup.stats()}
+    stats = camera_registry.get_stats()
+    stats['_dimension_service'] = detector.dimension_service.get_metrics()
+    stats['_debug_writer'] = detector.debug_writer.stats()
+    stats['_measure'] = async_detector.stats()
+    stats['_startup'] = startup.stats()
+    return stats
 
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    cap = cv2.VideoCapture(0)  # webcam par défaut
+    loop = asyncio.get_running_loop()
+
+    # Paramètres propres au client : ?camera=default&quality=70&fps=15
+    # Protocole binaire (frame brute + tracks + dimensions) : &protocol=binary&width=640
+    params = websocket.query_params
+    camera_name = params.get("camera", "default")
+    try:
+        jpeg_quality = int(params.get("quality", 70))
+        max_fps = float(params["fps"]) if "fps" in params else None
+        max_width = int(params["width"]) if "width" in params else None
+        subscriber = Subscriber(loop, jpeg_quality=jpeg_quality, max_fps=max_fps,
+                                protocol=params.get("protocol", "json"), max_width=max_width)
+    except ValueError:
+        await websocket.close(code=1003)
+        return
+
+    # Connexion pendant le démarrage : attendre les modèles, sinon « réessayer plus tard »
+    if not await loop.run_in_executor(None, startup.wait, WS_READY_TIMEOUT):
+        await websocket.close(code=1013)
+        return
 
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+        camera = await loop.run_in_executor(None, camera_registry.subscribe, camera_name, subscriber)
+    except KeyError as e:
+        logger.error(f"[ERROR] WebSocket: {e}")
+        await websocket.close(code=1008)
+        return
+
+    last_stats_log = time.perf_counter()
+    clients = WS_CLIENTS.labels(subscriber.protocol)
+    clients.inc()
+
+    async def watch_disconnect():
+        # Sans lecture, une déconnexion ne se voit qu'au prochain envoi raté
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+        subscriber.close()
 
-            # Détection + tracking + estimation dimensions avec le modèle entraîné
-            processed_frame, tracks, dimensions_data = detector.process_frame(frame)
+    disconnect = asyncio.create_task(watch_disconnect())
+
+    try:
+        if subscriber.protocol == "binary":
+            # Négociation : le client reçoit les paramètres effectivement retenus
+            await websocket.send_text(json.dumps(subscriber.negotiated()))
+
+        while not subscriber.closed:
+            # Réveillé par une frame, une mesure ou la déconnexion (pas d'attente de la frame suivante)
+            packet, dimensions = await subscriber.next_update(timeout=0.5)
+
+            now = time.perf_counter()
+            if now - last_stats_log > STATS_LOG_INTERVAL:
+                logger.info(f"Latences pipeline {camera_name}: {camera.pipeline.get_stats()}")
+                last_stats_log = now
+
+            if subscriber.protocol == "binary":
+                if packet is None and not dimensions:
+                    continue
+                # Frame, tracks et dimensions dans un seul message, reliés par le numéro de frame
+                send_started = time.perf_counter()
+                message = pack_message(packet, dimensions, send_started)
+                await websocket.send_bytes(message)
+                subscriber.record_sent(len(message), packet, time.perf_counter() - send_started)
+                if packet is not None:
+                    camera.pipeline.record_sent(packet, send_started)
+                continue
 
             # Envoyer UNIQUEMENT les dimensions estimées par le modèle (pas de fallback MiDaS)
-            if dimensions_data:
+            for dimensions_data in dimensions:
                 try:
-                    await websocket.send_text(json.dumps(dimensions_data))
-                    logger.info(f"Dimensions estimées envoyées: {dimensions_data}")
+                    message = json.dumps(dimensions_data)
+                    await websocket.send_text(message)
+                    subscriber.record_sent(len(message), None, 0.0)
+                    logger.debug("Dimensions estimées envoyées: %s", dimensions_data)
                 except Exception as e:
                     logger.error(f"[WebSocket error] send dimensions: {e}")
 
-            # Envoi frame encodée (pour affichage)
-            _, buffer = cv2.imencode('.jpg', processed_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
-            await websocket.send_bytes(buffer.tobytes())
+            if packet is None:
+                continue
 
-            await asyncio.sleep(0.033)  # ~30 FPS
+            # Envoi frame encodée (pour affichage)
+            send_started = time.perf_counter()
+            await websocket.send_bytes(packet.jpeg_bytes)
+            subscriber.record_sent(len(packet.jpeg_bytes), packet, time.perf_counter() - send_started)
+            camera.pipeline.record_sent(packet, send_started)
 
     except Exception as e:
         logger.error(f"[ERROR] WebSocket: {e}")
     finally:
-        cap.release()
\ No newline at end of file
+        disconnect.cancel()
+        clients.dec()
+        subscriber.closed = True
+        await loop.run_in_executor(None, camera_registry.unsubscribe, camera_name, subscriber)
@@ -0,0 +1,115 @@
+import cv2
+import numpy as np
+
+
+class InspectionZone:
+    """
+    Zone du tapis inspectée par YOLO : (x1, y1, x2, y2) en pixels, ou en fractions de la frame
+    si toutes les valeurs sont <= 1. Seule cette région est envoyée au modèle (qui la met
+    lui-même au format letterbox) ; les boxes détectées sont ramenées dans le repère de la frame.
+    """
+
+    def __init__(self, rect):
+        self.rect = tuple(float(v) for v in rect)
+        self._shape = None
+        self._pixels = None
+
+    def pixels(self, frame_shape):
+        """(x1, y1, x2, y2) en pixels pour une taille de frame (mis en cache)"""
+        if frame_shape[:2] != self._shape:
+            height, width = frame_shape[:2]
+            x1, y1, x2, y2 = self.rect
+            if max(self.rect) <= 1.0:
+                x1, x2 = x1 * width, x2 * width
+                y1, y2 = y1 * height, y2 * height
+            x1, x2 = sorted((int(np.clip(x1, 0, width)), int(np.clip(x2, 0, width))))
+            y1, y2 = sorted((int(np.clip(y1, 0, height)), int(np.clip(y2, 0, height))))
+            if x2 - x1 < 2 or y2 - y1 < 2:
+                raise ValueError(f"Zone d'inspection vide pour une frame {width}x{height}: {self.rect}")
+            self._shape = frame_shape[:2]
+            self._pixels = (x1, y1, x2, y2)
+        return self._pixels
+
+    def crop(self, frame):
+        """Vue de la zone dans la frame (sans copie)"""
+        x1, y1, x2, y2 = self.pixels(frame.shape)
+        return frame[y1:y2, x1:x2]
+
+    def offset(self, frame_shape):
+        x1, y1, _, _ = self.pixels(frame_shape)
+        return x1, y1
+
+
+class MotionGate:
+    """
+    Filtre de mouvement avant la détection, sur une image de la zone réduite en niveaux de gris :
+    la frame est comparée à la référence prise à la dernière détection (et non à la frame
+    précédente : un déplacement lent finit par dépasser le seuil). Si moins de min_changed
+    des pixels ont changé de plus de pixel_threshold niveaux, la frame est « inchangée » et
+    YOLO n'est pas lancé. Une détection est quand même forcée toutes les max_idle_frames frames.
+    """
+
+    def __init__(self, width=160, pixel_threshold=25, min_changed=0.002, blur=5, max_idle_frames=60):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_changed = min_changed
+        self.blur = blur
+        self.max_idle_frames = max_idle_frames
+
+        self._reference = None
+        self._small = None
+        self._diff = None
+        self._idle = 0
+
+        self.frames = 0
+        self.gated = 0
+        self.forced = 0
+        self.last_changed = 0.0
+
+    def _downscale(self, image):
+        h, w = image.shape[:2]
+        size = (self.width, max(1, round(h * self.width / w)))
+        # Sous-échantillonnage par pas avant la moyenne INTER_AREA : 2 fois la taille finale
+        # suffit à lisser le bruit du capteur, pour une fraction du coût sur la frame entière
+        step = max(1, w // (2 * self.width))
+        small = cv2.resize(image[::step, ::step], size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if self.blur:
+            small = cv2.GaussianBlur(small, (self.blur, self.blur), 0)
+        return small
+
+    def should_detect(self, image):
+        """True si la zone a bougé depuis la dernière détection (ou si la détection est forcée)"""
+        self.frames += 1
+        small = self._downscale(image)
+        if self._reference is None or self._reference.shape != small.shape:
+            self._reference = small
+            self._idle = 0
+            return True
+
+        self._diff = cv2.absdiff(small, self._reference, dst=self._diff)
+        self.last_changed = cv2.countNonZero(
+            cv2.threshold(self._diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)[1]) / small.size
+        if self.last_changed >= self.min_changed:
+            self._reference = small
+            self._idle = 0
+            return True
+
+        self._idle += 1
+        if self.max_idle_frames and self._idle >= self.max_idle_frames:
+            self.forced += 1
+            self._reference = small
+            self._idle = 0
+            return True
+        self.gated += 1
+        return False
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'gated': self.gated,
+            'forced': self.forced,
+            'gated_ratio': round(self.gated / self.frames, 3) if self.frames else 0.0,
+            'last_changed': round(self.last_changed, 4),
+        }
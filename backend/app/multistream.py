@@ -0,0 +1,134 @@
+import threading
+import time
+import logging
+import queue
+import os
+import sys
+from collections import deque
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from pipeline import StageStats
+from instrumentation import TRACER, RateLimitedLog
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+hot_log = RateLimitedLog(logger)
+
+
+class MultiStreamEngine:
+    """
+    Boucle de détection unique pour K caméras : la frame la plus récente de chaque
+    source est regroupée dans un même lot et passe dans YOLO en un seul forward.
+    Les résultats sont renvoyés au pipeline (et donc aux abonnés) de chaque source.
+    """
+
+    def __init__(self, detector, max_batch=8, detector_lock=None):
+        self.detector = detector
+        self.max_batch = max_batch
+        self.detector_lock = detector_lock or threading.Lock()
+
+        self._pipelines = []
+        self._pipelines_lock = threading.Lock()
+        self._frame_ready = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        self.batch_stats = StageStats()
+        self.batch_sizes = deque(maxlen=120)
+        self.frames_processed = 0
+
+    def notify_frame(self):
+        """Appelé par le thread de capture d'un pipeline quand une frame arrive"""
+        self._frame_ready.set()
+
+    def add_pipeline(self, pipeline):
+        with self._pipelines_lock:
+            self._pipelines.append(pipeline)
+        self._ensure_started()
+
+    def remove_pipeline(self, pipeline):
+        with self._pipelines_lock:
+            if pipeline in self._pipelines:
+                self._pipelines.remove(pipeline)
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name="multistream-detect", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._frame_ready.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _collect(self):
+        """Prend au plus une frame (la plus ancienne en attente) par source active"""
+        with self._pipelines_lock:
+            pipelines = [p for p in self._pipelines if p.running]
+
+        items = []
+        for pipeline in pipelines:
+            try:
+                items.append((pipeline, pipeline.capture_queue.get(timeout=0)))
+            except queue.Empty:
+                continue
+        return items
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._frame_ready.wait(timeout=0.1)
+            self._frame_ready.clear()
+
+            items = self._collect()
+            for i in range(0, len(items), self.max_batch):
+                self.process_items(items[i:i + self.max_batch])
+
+    def process_items(self, items):
+        """Détection groupée d'un lot [(pipeline, (seq, frame, captured_at)), ...]"""
+        # Les sources en retard sautent la détection pour cette frame (boxes propagées)
+        detect_items = []
+        for pipeline, (seq, frame, captured_at) in items:
+            if pipeline.should_detect():
+                detect_items.append((pipeline, (seq, frame, captured_at)))
+            else:
+                pipeline.propagate(seq, frame, captured_at)
+        items = detect_items
+        if not items:
+            return
+        frames = [frame for _, (_, frame, _) in items]
+        states = [pipeline.state for pipeline, _ in items]
+
+        start = time.perf_counter()
+        # Une trace par lot : les spans detect / track / quality couvrent toutes ses sources
+        trace = TRACER.begin("+".join(pipeline.camera for pipeline, _ in items), items[0][1][0])
+        try:
+            with self.detector_lock:
+                outputs = self.detector.process_batch(frames, states, draw=False)
+        except Exception as e:
+            hot_log.error("detect", "Erreur de détection multi-flux: %s", e)
+            return
+        finally:
+            TRACER.end(trace)
+        elapsed = time.perf_counter() - start
+        self.batch_stats.record(elapsed)
+        self.batch_sizes.append(len(items))
+        self.frames_processed += len(items)
+
+        for (pipeline, (seq, _, captured_at)), (processed_frame, tracks, dimensions_data) in zip(items, outputs):
+            pipeline.stats['detect'].record(elapsed)
+            if pipeline.pacer is not None:
+                pipeline.pacer.record_detection(elapsed)
+            pipeline.publish_detection(seq, processed_frame, dimensions_data, captured_at, tracks)
+
+    def get_stats(self):
+        batch_sizes = list(self.batch_sizes)
+        return {
+            'streams': len(self._pipelines),
+            'frames_processed': self.frames_processed,
+            'batch': self.batch_stats.snapshot(),
+            'mean_batch_size': round(sum(batch_sizes) / len(batch_sizes), 2) if batch_sizes else 0.0,
+        }
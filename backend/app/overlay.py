@@ -0,0 +1,44 @@
+import cv2
+
+# Couleur (BGR) et code binaire de chaque statut de track
+STATUS_COLORS = {
+    "READY": (0, 255, 0),  # VERT
+    "STABLE": (0, 200, 255),  # ORANGE
+    "UNSTABLE": (0, 0, 255),  # ROUGE
+}
+STATUS_CODES = {None: 0, "UNSTABLE": 1, "STABLE": 2, "READY": 3}
+
+
+class TrackedObject:
+    def __init__(self, track_id, xywh, status=None, quality=None, stable_count=None):
+        self.track_id = track_id
+        self._xywh = xywh
+        self.status = status
+        self.quality = quality
+        self.stable_count = stable_count
+
+    def to_tlwh(self):
+        return self._xywh
+
+
+def draw_tracks(frame, tracked_objects):
+    """Dessine boxes, ID / statut et texte de debug (qualité, stabilité) des tracks sur la frame"""
+    for obj in tracked_objects:
+        x1, y1, w, h = obj.to_tlwh()
+        x2, y2 = x1 + w, y1 + h
+        color = STATUS_COLORS.get(obj.status, STATUS_COLORS["UNSTABLE"])
+
+        # Dessin de la bounding box
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 3)
+
+        # Texte d'information
+        info_text = f"ID:{obj.track_id} {obj.status}" if obj.status else f"ID:{obj.track_id}"
+        cv2.putText(frame, info_text, (x1, y1 - 10),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+
+        # Texte de debug (score de qualité)
+        if obj.quality is not None:
+            debug_text = f"Q:{obj.quality:.2f} S:{obj.stable_count}"
+            cv2.putText(frame, debug_text, (x1, y1 - 35),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+    return frame
@@ -0,0 +1,94 @@
+import math
+import threading
+import time
+from collections import deque
+
+
+class AdaptivePacer:
+    """
+    Cadence adaptative d'une source :
+    - la capture ne dort que pour le reste du budget de la frame (1 / target_fps),
+      après le temps déjà passé à lire la frame
+    - la détection complète n'est faite qu'une frame sur detect_interval quand elle dépasse
+      le budget de latence ; les frames intermédiaires se contentent de propager les boxes
+    - detect_interval suit la moyenne glissante du temps de détection, avec hystérésis
+    """
+
+    def __init__(self, target_fps=30.0, latency_budget_ms=None, max_skip=4, smoothing=0.2, window=120):
+        self.target_fps = target_fps
+        self.frame_budget = 1.0 / target_fps if target_fps else 0.0
+        # Par défaut, une détection doit tenir dans le budget d'une frame
+        self.latency_budget = latency_budget_ms / 1000.0 if latency_budget_ms else self.frame_budget
+        self.max_skip = max_skip
+        self.smoothing = smoothing
+
+        self.detect_interval = 1
+        self.detect_time = None  # moyenne glissante (s)
+        self._since_detection = 0
+        self._lock = threading.Lock()
+
+        self.frames_detected = 0
+        self.frames_propagated = 0
+        self.frames_drained = 0
+        self._processed = deque(maxlen=window)
+
+    def pace(self, started_at):
+        """Dort pour le reste du budget de la frame commencée à started_at (perf_counter)"""
+        remaining = self.frame_budget - (time.perf_counter() - started_at)
+        if remaining > 0:
+            time.sleep(remaining)
+
+    def should_detect(self):
+        """True si la frame courante doit passer par la détection complète"""
+        with self._lock:
+            self._since_detection += 1
+            if self._since_detection >= self.detect_interval:
+                self._since_detection = 0
+                return True
+            return False
+
+    def record_detection(self, seconds):
+        with self._lock:
+            self.frames_detected += 1
+            self._processed.append(time.perf_counter())
+            if self.detect_time is None:
+                self.detect_time = seconds
+            else:
+                self.detect_time += self.smoothing * (seconds - self.detect_time)
+            if not self.latency_budget:
+                return
+
+            needed = max(1, min(self.max_skip, math.ceil(self.detect_time / self.latency_budget)))
+            if needed > self.detect_interval:
+                self.detect_interval = needed
+            elif needed < self.detect_interval and \
+                    self.detect_time < 0.8 * (self.detect_interval - 1) * self.latency_budget:
+                # On ne revient à une détection plus fréquente qu'avec de la marge
+                self.detect_interval -= 1
+
+    def record_propagation(self):
+        with self._lock:
+            self.frames_propagated += 1
+            self._processed.append(time.perf_counter())
+
+    def record_drained(self, count):
+        with self._lock:
+            self.frames_drained += count
+
+    def stats(self):
+        """Cibles et valeurs atteintes"""
+        with self._lock:
+            processed = list(self._processed)
+            detect_time = self.detect_time
+            snapshot = {
+                'target_fps': self.target_fps,
+                'latency_budget_ms': round(self.latency_budget * 1000.0, 1),
+                'detect_interval': self.detect_interval,
+                'frames_detected': self.frames_detected,
+                'frames_propagated': self.frames_propagated,
+                'frames_drained': self.frames_drained,
+            }
+        elapsed = processed[-1] - processed[0] if len(processed) > 1 else 0.0
+        snapshot['achieved_fps'] = round((len(processed) - 1) / elapsed, 2) if elapsed > 0 else 0.0
+        snapshot['detect_ms'] = round(detect_time * 1000.0, 2) if detect_time is not None else 0.0
+        return snapshot
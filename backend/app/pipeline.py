@@ -0,0 +1,375 @@
+import cv2
+import threading
+import time
+import logging
+import queue
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from encoding import JpegEncoder, encode_view
+from instrumentation import TRACER, RateLimitedLog, observe_stage
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+# Erreurs répétées à chaque frame : au plus un message par clé toutes les 5 s
+hot_log = RateLimitedLog(logger)
+
+
+class DropOldestQueue:
+    """File bornée thread-safe qui écarte l'élément le plus ancien quand elle est pleine"""
+
+    def __init__(self, maxsize=2):
+        self.maxsize = maxsize
+        self._items = deque()
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        """Ajoute un élément, en jetant le plus ancien si la file est pleine"""
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Récupère l'élément le plus ancien (lève queue.Empty après timeout)"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items, timeout=timeout):
+                raise queue.Empty
+            return self._items.popleft()
+
+    def qsize(self):
+        with self._cond:
+            return len(self._items)
+
+
+class StageStats:
+    """Latences glissantes (ms) d'une étape du pipeline"""
+
+    def __init__(self, window=120):
+        self.latencies = deque(maxlen=window)
+        self.timestamps = deque(maxlen=window)
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def record(self, latency_s):
+        with self._lock:
+            self.latencies.append(latency_s * 1000.0)
+            self.timestamps.append(time.perf_counter())
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            timestamps = list(self.timestamps)
+            count = self.count
+
+        if not latencies:
+            return {'count': count, 'mean_ms': 0.0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'fps': 0.0}
+
+        elapsed = timestamps[-1] - timestamps[0]
+        fps = (len(timestamps) - 1) / elapsed if elapsed > 0 else 0.0
+        return {
+            'count': count,
+            'mean_ms': round(sum(latencies) / len(latencies), 2),
+            'p50_ms': round(latencies[len(latencies) // 2], 2),
+            'p95_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+            'fps': round(fps, 2),
+        }
+
+
+class FramePacket:
+    """Frame encodée prête à être envoyée, avec les tracks de la frame (coordonnées natives)"""
+
+    def __init__(self, seq, jpeg_bytes, captured_at, tracks=(), scale=1.0, size=(0, 0), encode_s=0.0):
+        self.seq = seq
+        self.jpeg_bytes = jpeg_bytes
+        self.captured_at = captured_at
+        self.tracks = tracks
+        self.scale = scale  # échelle de l'image envoyée par rapport à la frame native
+        self.size = size  # (largeur, hauteur) de l'image envoyée
+        self.encode_s = encode_s
+
+
+class FramePipeline:
+    """
+    Pipeline capture -> détection -> encodage, chaque étape dans son propre thread.
+    Les étapes sont reliées par des files bornées qui écartent la frame la plus ancienne,
+    le débit est donc celui de l'étape la plus lente et non la somme des étapes.
+
+    Les frames encodées et les dimensions sont diffusées à des abonnés ("sinks") qui exposent
+    jpeg_quality, wants_frame(now), push_frame(packet), push_dimensions(data) et close(),
+    et éventuellement annotate (dessin des tracks par le serveur) et max_width.
+    La détection ne dessine plus rien : le dessin, la réduction et l'encodage sont faits une
+    seule fois par variante (dessin, qualité, largeur) demandée, en parallèle sur un pool de threads.
+
+    Avec un pacer (AdaptivePacer), la capture est cadencée sur target_fps et la détection
+    complète peut être espacée (propagation des boxes entre deux détections). Pour une source
+    en direct, les frames déjà en attente dans le tampon du pilote sont jetées à chaque lecture.
+    """
+
+    # Un grab() plus rapide que ça vient du tampon du pilote (frame ancienne)
+    BUFFERED_GRAB_S = 0.005
+    MAX_DRAINED_FRAMES = 8
+
+    def __init__(self, detector, source=0, state=None, queue_size=2, detector_lock=None,
+                 detect_in_thread=True, on_frame=None, pacer=None, drain_capture=None, encode_workers=2,
+                 billing=None):
+        self.detector = detector
+        self.source = source
+        self.state = state
+        self.detector_lock = detector_lock or threading.Lock()
+        # En mode multi-flux, la détection est faite par un MultiStreamEngine externe
+        self.detect_in_thread = detect_in_thread
+        self.on_frame = on_frame
+        self.pacer = pacer
+        # BillingSink : chaque mesure de dimensions est aussi enregistrée pour la facturation
+        self.billing = billing
+        if drain_capture is None:
+            # Webcam ou flux réseau : seule la frame la plus récente nous intéresse
+            drain_capture = isinstance(source, int) or str(source).startswith(("rtsp://", "http://", "https://"))
+        self.drain_capture = drain_capture
+
+        self.capture_queue = DropOldestQueue(queue_size)
+        self.detect_queue = DropOldestQueue(queue_size)
+
+        self._sinks = []
+        self._sinks_lock = threading.Lock()
+
+        self.encoder = JpegEncoder()
+        self._encode_pool = ThreadPoolExecutor(max_workers=encode_workers, thread_name_prefix="pipeline-jpeg")
+
+        self.stats = {
+            'capture': StageStats(),
+            'detect': StageStats(),
+            'encode': StageStats(),
+            'send': StageStats(),
+            'end_to_end': StageStats(),
+        }
+
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._cap = None
+        self._seq = 0
+
+    @property
+    def running(self):
+        return not self._stop_event.is_set()
+
+    def add_sink(self, sink):
+        with self._sinks_lock:
+            self._sinks.append(sink)
+
+    def remove_sink(self, sink):
+        with self._sinks_lock:
+            if sink in self._sinks:
+                self._sinks.remove(sink)
+
+    def sinks(self):
+        with self._sinks_lock:
+            return list(self._sinks)
+
+    def start(self):
+        """Ouvre la source vidéo et démarre les threads du pipeline"""
+        self._cap = cv2.VideoCapture(self.source)
+        if not self._cap.isOpened():
+            logger.error(f"Impossible d'ouvrir la source vidéo {self.source}")
+        elif self.drain_capture:
+            self._cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        stages = [('capture', self._capture_loop), ('encode', self._encode_loop)]
+        if self.detect_in_thread:
+            stages.append(('detect', self._detect_loop))
+        for name, target in stages:
+            thread = threading.Thread(target=target, name=f"pipeline-{name}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Pipeline démarré pour la source {self.source} (JPEG: {self.encoder.name})")
+        return self
+
+    def stop(self):
+        """Arrête les threads, libère la caméra et ferme les abonnés"""
+        self._stop_event.set()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=2.0)
+        self._threads = []
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+        self._encode_pool.shutdown(wait=False)
+        for sink in self.sinks():
+            sink.close()
+        logger.info(f"Pipeline arrêté pour la source {self.source}")
+
+    def _read_latest(self):
+        """Lit la frame la plus récente en jetant celles déjà en attente dans le tampon du pilote"""
+        if not self.drain_capture:
+            return self._cap.read()
+        drained = 0
+        for _ in range(self.MAX_DRAINED_FRAMES):
+            start = time.perf_counter()
+            if not self._cap.grab():
+                return False, None
+            if time.perf_counter() - start > self.BUFFERED_GRAB_S:
+                break  # grab bloquant : frame fraîche
+            drained += 1
+        if drained and self.pacer is not None:
+            self.pacer.record_drained(drained)
+        return self._cap.retrieve()
+
+    def _capture_loop(self):
+        while not self._stop_event.is_set():
+            start = time.perf_counter()
+            ret, frame = self._read_latest()
+            if not ret:
+                logger.warning(f"Fin du flux pour la source {self.source}")
+                self._stop_event.set()
+                for sink in self.sinks():
+                    sink.close()
+                break
+            self.stats['capture'].record(time.perf_counter() - start)
+            self._seq += 1
+            self.capture_queue.put((self._seq, frame, start))
+            if self.on_frame is not None:
+                self.on_frame()
+            if self.pacer is not None:
+                # Ne dort que pour le reste du budget de la frame
+                self.pacer.pace(start)
+
+    def _detect_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                seq, frame, captured_at = self.capture_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            if not self.should_detect():
+                self.propagate(seq, frame, captured_at)
+                continue
+
+            start = time.perf_counter()
+            trace = TRACER.begin(self.camera, seq)
+            if trace is not None:
+                trace.add("queue_wait", captured_at, start - captured_at)
+            try:
+                with self.detector_lock:
+                    processed_frame, tracks, dimensions_data = self.detector.process_frame(
+                        frame, self.state, draw=False)
+            except Exception as e:
+                hot_log.error("detect", "Erreur de détection: %s", e)
+                continue
+            finally:
+                TRACER.end(trace)
+            elapsed = time.perf_counter() - start
+            self.stats['detect'].record(elapsed)
+            if self.pacer is not None:
+                self.pacer.record_detection(elapsed)
+            self.publish_detection(seq, processed_frame, dimensions_data, captured_at, tracks)
+
+    @property
+    def camera(self):
+        """Nom de la caméra (source_id du StreamState) pour les traces"""
+        return self.state.source_id if self.state is not None else str(self.source)
+
+    def should_detect(self):
+        """La frame suivante passe-t-elle par la détection complète ?"""
+        return self.pacer is None or self.pacer.should_detect()
+
+    def propagate(self, seq, frame, captured_at):
+        """Frame sans détection : boxes propagées depuis la dernière détection"""
+        try:
+            processed_frame, tracks, _ = self.detector.propagate_frame(frame, self.state, draw=False)
+        except Exception as e:
+            hot_log.error("propagate", "Erreur de propagation: %s", e)
+            return
+        self.pacer.record_propagation()
+        self.publish_detection(seq, processed_frame, [], captured_at, tracks)
+
+    def publish_detection(self, seq, processed_frame, dimensions_data, captured_at, tracks=()):
+        """Transmet le résultat de détection d'une frame (non dessinée) à l'étape d'encodage"""
+        # Les dimensions ne sont émises qu'une fois par track : jamais écartées.
+        # seq relie chaque mesure à la frame où elle a été faite.
+        for record in dimensions_data:
+            record = dict(record, seq=seq)
+            if self.billing is not None:
+                try:
+                    stream_id = self.state.stream_id if self.state is not None else self.camera
+                    row = self.billing.record(self.camera, stream_id, record)
+                    record['parcel_id'] = row['parcel_id']
+                    record['billable_weight_kg'] = row['billable_weight_kg']
+                except Exception as e:
+                    hot_log.error("billing", "Enregistrement de facturation impossible: %s", e)
+            for sink in self.sinks():
+                sink.push_dimensions(record)
+        self.detect_queue.put((seq, processed_frame, captured_at, tracks))
+
+    def _encode_loop(self):
+        while not self._stop_event.is_set():
+            try:
+                seq, frame, captured_at, tracks = self.detect_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            now = time.perf_counter()
+            targets = [sink for sink in self.sinks() if sink.wants_frame(now)]
+            if not targets:
+                continue
+
+            # Un seul rendu + encodage par variante (dessin, qualité JPEG, largeur max) demandée
+            variants = {}
+            for sink in targets:
+                key = (getattr(sink, 'annotate', True), sink.jpeg_quality, getattr(sink, 'max_width', None))
+                variants.setdefault(key, []).append(sink)
+
+            # cv2.resize / imencode libèrent le GIL : les variantes sont encodées en parallèle
+            jobs = [(sinks, self._encode_pool.submit(encode_view, self.encoder, frame, tracks, *key))
+                    for key, sinks in variants.items()]
+            for sinks, job in jobs:
+                try:
+                    jpeg, scale, size, encode_s = job.result()
+                except Exception as e:
+                    hot_log.error("encode", "Erreur d'encodage: %s", e)
+                    continue
+                if jpeg is None:
+                    continue
+                self.stats['encode'].record(encode_s)
+                observe_stage("encode", encode_s)
+                packet = FramePacket(seq, jpeg, captured_at, tracks, scale, size, encode_s)
+                for sink in sinks:
+                    sink.push_frame(packet)
+
+    def record_sent(self, packet, send_started):
+        """Enregistre la latence d'envoi et la latence de bout en bout d'une frame"""
+        now = time.perf_counter()
+        self.stats['send'].record(now - send_started)
+        self.stats['end_to_end'].record(now - packet.captured_at)
+        observe_stage("send", now - send_started)
+        observe_stage("end_to_end", now - packet.captured_at)
+
+    def get_stats(self):
+        """Statistiques par étape + frames écartées par file"""
+        stats = {
+            'source': self.source,
+            'subscribers': len(self.sinks()),
+            'stages': {name: stats.snapshot() for name, stats in self.stats.items()},
+            'dropped': {
+                'capture': self.capture_queue.dropped,
+                'detect': self.detect_queue.dropped,
+            },
+        }
+        if self.pacer is not None:
+            stats['pacing'] = self.pacer.stats()
+        if self.state is not None and self.state.motion_gate is not None:
+            stats['motion_gate'] = self.state.motion_gate.stats()
+        if self.state is not None and self.state.scaler is not None:
+            stats['inference_scaling'] = self.state.scaler.stats()
+        stats['encoder'] = self.encoder.name
+        stats['clients'] = [sink.stats() for sink in self.sinks() if hasattr(sink, 'stats')]
+        return stats
@@ -0,0 +1,98 @@
+import cv2
+import numpy as np
+import torch
+
+# Normalisation ImageNet utilisée à l'entraînement du régresseur
+IMAGENET_MEAN = (0.485, 0.456, 0.406)
+IMAGENET_STD = (0.229, 0.224, 0.225)
+
+
+def resize_crop(image, dst):
+    """Redimensionne un crop BGR dans dst (H, W, 3) uint8, sans allocation"""
+    h, w = image.shape[:2]
+    height, width = dst.shape[:2]
+    # INTER_AREA se rapproche de l'antialiasing de PIL en réduction
+    interpolation = cv2.INTER_AREA if w > width or h > height else cv2.INTER_LINEAR
+    cv2.resize(image, (width, height), dst=dst, interpolation=interpolation)
+
+
+class BatchPreprocessor:
+    """
+    Prétraitement vectorisé d'un lot de crops BGR (numpy, tels que sortis du détecteur).
+    Chaque crop est redimensionné avec cv2 dans un tampon uint8 préalloué, puis le passage
+    BGR -> RGB, la mise à l'échelle [0, 1] et la normalisation sont faits en une seule passe
+    sur tout le lot, dans un tampon NCHW float32 réutilisé (épinglé si CUDA est disponible).
+    Équivalent à Resize((224, 224)) + ToTensor() + Normalize() de torchvision.
+    """
+
+    def __init__(self, size=(224, 224), max_batch=4, device=None, pin_memory=None,
+                 mean=IMAGENET_MEAN, std=IMAGENET_STD):
+        self.width, self.height = size
+        self.device = device or torch.device("cpu")
+        if pin_memory is None:
+            pin_memory = torch.cuda.is_available() and self.device.type == "cuda"
+        self.pin_memory = pin_memory
+
+        mean = torch.tensor(mean, dtype=torch.float32).view(1, 3, 1, 1)
+        std = torch.tensor(std, dtype=torch.float32).view(1, 3, 1, 1)
+        # (x / 255 - mean) / std == x * scale - offset
+        self._scale = 1.0 / (255.0 * std)
+        self._offset = mean / std
+
+        self.max_batch = 0
+        self._allocate(max_batch)
+
+    def _allocate(self, max_batch):
+        """(Ré)alloue les tampons pour max_batch images"""
+        self.max_batch = max_batch
+        self._staging = np.empty((max_batch, self.height, self.width, 3), dtype=np.uint8)
+        self._buffer = torch.empty((max_batch, 3, self.height, self.width), dtype=torch.float32,
+                                   pin_memory=self.pin_memory)
+
+    def resize_into(self, image, index):
+        """Redimensionne un crop BGR directement dans le tampon uint8"""
+        resize_crop(image, self._staging[index])
+
+    def __call__(self, images):
+        """Retourne un tenseur (N, 3, H, W) normalisé sur self.device"""
+        n = len(images)
+        if n > self.max_batch:
+            self._allocate(n)
+
+        for i, image in enumerate(images):
+            self.resize_into(image, i)
+        return self.normalize(self._staging[:n])
+
+    def normalize(self, staging):
+        """Tenseur (N, 3, H, W) normalisé à partir de crops BGR déjà redimensionnés (N, H, W, 3) uint8"""
+        n = len(staging)
+        if n > self.max_batch:
+            self._allocate(n)
+
+        # BGR -> RGB (flip des canaux), HWC -> CHW, puis normalisation en place
+        staging = torch.from_numpy(staging).permute(0, 3, 1, 2).flip(1)
+        batch = self._buffer[:n]
+        batch.copy_(staging)
+        batch.mul_(self._scale).sub_(self._offset)
+
+        return batch.to(self.device, non_blocking=self.pin_memory)
+
+    def normalize_crops(self, crops):
+        """
+        Comme normalize, pour des crops déjà redimensionnés (H, W, 3) qui ne sont pas contigus
+        entre eux (tampons d'un CropPool) : chaque crop est converti directement dans le tampon
+        float32, sans passer par le tampon uint8.
+        """
+        n = len(crops)
+        if n > self.max_batch:
+            self._allocate(n)
+
+        batch = self._buffer[:n]
+        for i, crop in enumerate(crops):
+            # BGR -> RGB canal par canal : copies strided, sans tenseur intermédiaire
+            crop = torch.from_numpy(crop)
+            for channel in range(3):
+                batch[i, channel].copy_(crop[:, :, 2 - channel])
+        batch.mul_(self._scale).sub_(self._offset)
+
+        return batch.to(self.device, non_blocking=self.pin_memory)
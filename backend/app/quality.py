@@ -0,0 +1,180 @@
+import cv2
+import numpy as np
+
+# Paramètres du score de qualité (YOLOv8Detector.calculate_view_quality, debug_quality.py, quality_report.py)
+FILL_THRESHOLD = 127
+CANNY_LOW, CANNY_HIGH = 50, 150
+HOUGH_THRESHOLD, HOUGH_MIN_LINE_LENGTH, HOUGH_MAX_LINE_GAP = 50, 30, 10
+MIN_ROI_SIZE = 10
+
+
+def composite_score(fill_ratio, edge_ratio, line_count):
+    """Score composite de qualité à partir des trois composantes"""
+    line_score = min(line_count / 10.0, 1.0)  # Normalisé
+    return min((fill_ratio * 0.4 + edge_ratio * 0.3 + line_score * 0.3) * 1.5, 1.0)
+
+
+def analyze(image, keep_lines=False):
+    """
+    Caractéristiques de qualité d'une image BGR ou en niveaux de gris (ROI de colis) :
+    taille, ratio d'aspect, remplissage (seuil), contours (Canny), lignes (HoughLinesP) et score.
+    Sans affichage : partagé par le détecteur, debug_quality.py et quality_report.py.
+    Retourne None si l'image est trop petite ; keep_lines ajoute les segments (N, 4) sous 'lines'.
+    """
+    if image.size == 0 or image.shape[0] < MIN_ROI_SIZE or image.shape[1] < MIN_ROI_SIZE:
+        return None
+
+    height, width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    fill_ratio = np.count_nonzero(gray > FILL_THRESHOLD) / gray.size
+
+    edges = cv2.Canny(gray, CANNY_LOW, CANNY_HIGH)
+    edge_ratio = np.count_nonzero(edges) / edges.size
+
+    lines = cv2.HoughLinesP(edges, 1, np.pi / 180, threshold=HOUGH_THRESHOLD,
+                            minLineLength=HOUGH_MIN_LINE_LENGTH, maxLineGap=HOUGH_MAX_LINE_GAP)
+    line_count = len(lines) if lines is not None else 0
+
+    features = {'width': width, 'height': height, 'aspect_ratio': width / height,
+                'fill_ratio': fill_ratio, 'edge_ratio': edge_ratio, 'line_count': line_count,
+                'quality_score': composite_score(fill_ratio, edge_ratio, line_count)}
+    if keep_lines:
+        features['lines'] = lines.reshape(-1, 4) if lines is not None else np.empty((0, 4), dtype=np.int32)
+    return features
+
+
+def view_quality(roi):
+    """
+    Score exact d'une ROI BGR : remplissage (seuil), contours (Canny) et lignes (HoughLinesP).
+    Retourne (score, composantes) ; (0.0, {}) si la ROI est trop petite.
+    """
+    features = analyze(roi)
+    if features is None:
+        return 0.0, {}
+    return features['quality_score'], {key: features[key] for key in
+                                       ('fill_ratio', 'edge_ratio', 'line_count', 'quality_score')}
+
+
+class FrameQualityMaps:
+    """
+    Images intégrales du masque de remplissage et des contours d'une frame entière,
+    calculées une fois (à résolution réduite) : le remplissage et la densité de contours
+    de n'importe quelle box s'obtiennent ensuite en O(1).
+    """
+
+    def __init__(self, frame, scale=0.5):
+        self.scale = scale
+        if scale != 1.0:
+            frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self._fill = cv2.integral((gray > FILL_THRESHOLD).astype(np.uint8))
+        self._edges = cv2.integral((cv2.Canny(gray, CANNY_LOW, CANNY_HIGH) > 0).astype(np.uint8))
+
+    def ratios(self, bboxes):
+        """Remplissage et densité de contours (N,) pour des boxes (N, 4) en coordonnées natives"""
+        height, width = self._fill.shape[0] - 1, self._fill.shape[1] - 1
+        boxes = np.round(bboxes * self.scale).astype(np.int64)
+        x1, x2 = np.clip(boxes[:, 0], 0, width), np.clip(boxes[:, 2], 0, width)
+        y1, y2 = np.clip(boxes[:, 1], 0, height), np.clip(boxes[:, 3], 0, height)
+        area = np.maximum((x2 - x1) * (y2 - y1), 1)
+
+        def box_sum(integral):
+            return integral[y2, x2] - integral[y1, x2] - integral[y2, x1] + integral[y1, x1]
+
+        return box_sum(self._fill) / area, box_sum(self._edges) / area
+
+
+class QualityScorer:
+    """
+    Score de qualité mis en cache par track :
+    - pas de calcul pour les tracks terminés (dimensions déjà envoyées)
+    - recalcul seulement si la box a bougé de plus de recompute_shift pixels
+      ou si le score a plus de refresh_frames frames
+    - criblage rapide (images intégrales, sans Hough) : le nombre de lignes ne peut ajouter
+      que 0.45 au plus au score. Remplissage et contours y sont mesurés sur la frame réduite
+      (screen_scale) alors que le score exact utilise le Canny pleine résolution : le score
+      estimé avec 10 lignes n'est donc pas une borne. Une box n'est écartée sans Hough que si
+      cette estimation reste sous min_quality - screen_margin (écart estimé / exact observé :
+      jusqu'à 0.07 sur le convoyeur synthétique, 0.2 avec un bruit capteur fort ; voir
+      benchmarks/bench_quality.py). L'estimation va dans table.quality_estimates et le score
+      vaut 0 (comme une ROI trop petite) : le classement et la pondération des vues ne lisent
+      que des scores exacts.
+    """
+
+    def __init__(self, min_quality=0.5, recompute_shift=15.0, refresh_frames=15, screen_scale=0.5,
+                 screen_margin=0.1):
+        self.min_quality = min_quality
+        self.screen_margin = screen_margin
+        self.recompute_shift = recompute_shift
+        self.refresh_frames = refresh_frames
+        self.screen_scale = screen_scale
+
+        self.boxes_scored = 0
+        self.boxes_screened = 0
+        self.hough_runs = 0
+        self.cache_hits = 0
+
+    def needs_update(self, table, slots, bboxes, pixel_scale=1.0):
+        """Masque des boxes dont le score doit être recalculé"""
+        shift = np.linalg.norm((table.quality_bboxes[slots] - bboxes).astype(np.float32), axis=1)
+        stale = (table.quality_frames[slots] < 0) | \
+                (table.frame_index - table.quality_frames[slots] >= self.refresh_frames) | \
+                (shift * pixel_scale > self.recompute_shift)
+        return stale & ~table.sent[slots]
+
+    def score(self, frame, table, slots, bboxes, exact_fn, pixel_scale=1.0):
+        """
+        Met à jour table.quality_scores pour les boxes de la frame et retourne
+        (scores (N,), {index: composantes} des boxes recalculées).
+        exact_fn(bbox, index) calcule le score exact d'une box (avec Hough).
+        pixel_scale : échelle à laquelle la qualité est évaluée (image vue par YOLO) ;
+        les seuils en pixels (déplacement, taille minimale) s'appliquent à cette échelle.
+        """
+        debug = {}
+        todo = np.flatnonzero(self.needs_update(table, slots, bboxes, pixel_scale)) if len(slots) else []
+        self.cache_hits += len(slots) - len(todo)
+        if len(todo):
+            widths = (bboxes[todo, 2] - bboxes[todo, 0]) * pixel_scale
+            heights = (bboxes[todo, 3] - bboxes[todo, 1]) * pixel_scale
+            maps = FrameQualityMaps(frame, self.screen_scale * pixel_scale)
+            fill, edges = maps.ratios(bboxes[todo])
+            # Estimations (frame réduite) du score sans aucune ligne / avec 10 lignes ou plus
+            lower = (fill * 0.4 + edges * 0.3) * 1.5
+            upper = np.minimum(lower + 0.45, 1.0)
+
+            for k, i in enumerate(todo.tolist()):
+                slot = slots[i]
+                estimate = float(upper[k])
+                if widths[k] < MIN_ROI_SIZE or heights[k] < MIN_ROI_SIZE:
+                    score, data, estimate = 0.0, {}, 0.0
+                elif upper[k] < self.min_quality - self.screen_margin:
+                    # Écartée : l'estimation sert seulement à cette décision
+                    score = 0.0
+                    data = {'fill_ratio': float(fill[k]), 'edge_ratio': float(edges[k]),
+                            'quality_estimate': estimate, 'quality_score': score, 'screened': True}
+                    self.boxes_screened += 1
+                elif lower[k] - self.screen_margin >= 1.0:
+                    # Score saturé sans les lignes, même avec la marge : exact sans Hough
+                    score, estimate = 1.0, 1.0
+                    data = {'fill_ratio': float(fill[k]), 'edge_ratio': float(edges[k]), 'quality_score': score}
+                else:
+                    score, data = exact_fn(bboxes[i].tolist(), i)
+                    estimate = score
+                    self.hough_runs += 1
+                table.quality_scores[slot] = score
+                table.quality_estimates[slot] = estimate
+                table.quality_bboxes[slot] = bboxes[i]
+                table.quality_frames[slot] = table.frame_index
+                debug[i] = data
+            self.boxes_scored += len(todo)
+
+        scores = table.quality_scores[slots] if len(slots) else np.empty(0, dtype=np.float32)
+        return scores, debug
+
+    def stats(self):
+        return {
+            'boxes_scored': self.boxes_scored,
+            'boxes_screened': self.boxes_screened,
+            'hough_runs': self.hough_runs,
+            'cache_hits': self.cache_hits,
+        }
@@ -0,0 +1,177 @@
+import argparse
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from batch_processor import IMAGE_EXTENSIONS, RecordWriter
+from quality import analyze
+
+# Une ligne par image : caractéristiques de quality.analyze (mêmes paramètres que le détecteur)
+FIELDS = ['source', 'status', 'width', 'height', 'aspect_ratio', 'fill_ratio', 'edge_ratio', 'line_count',
+          'quality_score']
+
+# Histogrammes du résumé : (borne basse, borne haute, nombre de classes) ; None = bornes des données
+HISTOGRAMS = {
+    'quality_score': (0.0, 1.0, 20),
+    'fill_ratio': (0.0, 1.0, 20),
+    'edge_ratio': (0.0, 1.0, 20),
+    'line_count': (0, 50, 25),
+    'aspect_ratio': None,
+}
+
+_grayscale = False
+
+
+def scan_images(inputs):
+    """Chemins des images des dossiers (récursivement) et fichiers donnés, dans un ordre stable"""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            for root, dirs, names in os.walk(path):
+                dirs.sort()
+                paths.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(IMAGE_EXTENSIONS))
+        elif path.lower().endswith(IMAGE_EXTENSIONS):
+            paths.append(path)
+    return paths
+
+
+def _init_worker(grayscale):
+    """Un seul thread OpenCV par processus : le parallélisme vient du pool"""
+    global _grayscale
+    cv2.setNumThreads(1)
+    _grayscale = grayscale
+
+
+def score_image(path, grayscale=False):
+    """
+    Ligne de rapport d'une image. Par défaut décodée en BGR puis convertie comme dans le détecteur.
+    En niveaux de gris, le JPEG est décodé directement en luminance (sans chrominance ni cvtColor) :
+    plus rapide, mais les pixels proches de FILL_THRESHOLD ou des seuils de Canny basculent
+    et le score peut s'écarter nettement (jusqu'à 0.3 sur des images synthétiques).
+    """
+    image = cv2.imread(path, cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR)
+    if image is None:
+        return {'source': path, 'status': 'unreadable'}
+    features = analyze(image)
+    if features is None:
+        return {'source': path, 'status': 'too_small', 'width': image.shape[1], 'height': image.shape[0]}
+    features.update(source=path, status='ok')
+    return features
+
+
+def score_chunk(paths):
+    return [score_image(path, _grayscale) for path in paths]
+
+
+def histogram(values, spec):
+    if spec is None:
+        spec = (float(values.min()), float(values.max()), 20) if len(values) else (0.0, 1.0, 20)
+    low, high, bins = spec
+    # Les valeurs au-delà de la borne haute comptent dans la dernière classe
+    counts, edges = np.histogram(np.clip(values, low, high), bins=bins, range=(low, high))
+    return {'edges': [round(float(e), 4) for e in edges], 'counts': counts.tolist()}
+
+
+def threshold_sweep(scores, thresholds):
+    """Part des images retenues (score >= seuil) pour chaque valeur candidate de MIN_QUALITY_SCORE"""
+    total = max(len(scores), 1)
+    return [{'threshold': round(float(t), 3), 'passed': int(np.count_nonzero(scores >= t)),
+             'pass_rate': round(np.count_nonzero(scores >= t) / total, 4)} for t in thresholds]
+
+
+def summarize(columns, counts, thresholds):
+    scores = columns['quality_score']
+    summary = {
+        'images': sum(counts.values()),
+        'status': counts,
+        'percentiles': {
+            name: {f"p{q}": round(float(np.percentile(values, q)), 4) for q in (1, 5, 25, 50, 75, 95, 99)}
+            for name, values in columns.items() if len(values)
+        },
+        'histograms': {name: histogram(columns[name], spec) for name, spec in HISTOGRAMS.items()},
+        'threshold_sweep': threshold_sweep(scores, thresholds),
+    }
+    return summary
+
+
+def print_summary(summary, min_quality):
+    print(f"{summary['images']} images: {summary['status']}")
+    scores = summary['histograms']['quality_score']
+    peak = max(scores['counts']) or 1
+    print("Distribution du score de qualité :")
+    for low, count in zip(scores['edges'], scores['counts']):
+        print(f"  {low:4.2f} {'#' * round(40 * count / peak):40s} {count}")
+    print("Seuil   retenues")
+    for row in summary['threshold_sweep']:
+        marker = "  <- MIN_QUALITY_SCORE" if abs(row['threshold'] - min_quality) < 1e-6 else ""
+        print(f"  {row['threshold']:4.2f}  {row['pass_rate']:7.1%}{marker}")
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Scores de qualité (quality.analyze) d'un jeu d'images : CSV / Parquet par image et résumé JSON")
+    parser.add_argument("inputs", nargs="+", help="Images ou dossiers (parcourus récursivement)")
+    parser.add_argument("--output", required=True,
+                        help="Préfixe de sortie (<préfixe>.csv ou .partNNNNN.parquet, et <préfixe>.summary.json)")
+    parser.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=256, help="Images par tâche envoyée à un processus")
+    parser.add_argument("--buffer-size", type=int, default=50000, help="Lignes tamponnées avant écriture")
+    parser.add_argument("--grayscale", action="store_true",
+                        help="Décodage JPEG direct en niveaux de gris : plus rapide, scores approchés")
+    parser.add_argument("--thresholds", type=float, nargs="+", default=list(np.round(np.arange(0.0, 1.0001, 0.05), 2)),
+                        help="Valeurs de MIN_QUALITY_SCORE balayées")
+    parser.add_argument("--min-quality", type=float, default=0.5, help="Seuil actuel, signalé dans le balayage")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    paths = scan_images(args.inputs)
+    if not paths:
+        print("Aucune image trouvée")
+        return
+    print(f"{len(paths)} images trouvées en {time.perf_counter() - start:.1f} s, {args.workers} processus")
+
+    directory = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(directory, exist_ok=True)
+    writer = RecordWriter(args.output, args.format, args.buffer_size, fields=FIELDS)
+    writer.restore(0)  # nouveau rapport : pas d'ajout à un rapport précédent
+
+    columns = {name: [] for name in ('quality_score', 'fill_ratio', 'edge_ratio', 'line_count', 'aspect_ratio')}
+    counts = {'ok': 0, 'unreadable': 0, 'too_small': 0}
+    chunks = [paths[i:i + args.chunk_size] for i in range(0, len(paths), args.chunk_size)]
+
+    start = time.perf_counter()
+    context = mp.get_context("spawn")
+    with context.Pool(args.workers, initializer=_init_worker, initargs=(args.grayscale,)) as pool:
+        for done, rows in enumerate(pool.imap_unordered(score_chunk, chunks), 1):
+            for row in rows:
+                counts[row['status']] += 1
+                if row['status'] == 'ok':
+                    for name, values in columns.items():
+                        values.append(row[name])
+                writer.write(row)
+            if done % 100 == 0:
+                scored = sum(counts.values())
+                print(f"{scored}/{len(paths)} images ({scored / (time.perf_counter() - start):.0f} images/s)")
+    writer.flush()
+    elapsed = time.perf_counter() - start
+
+    columns = {name: np.asarray(values, dtype=np.float64) for name, values in columns.items()}
+    summary = summarize(columns, counts, args.thresholds)
+    summary.update(elapsed_s=round(elapsed, 2), images_per_s=round(len(paths) / elapsed, 1),
+                   grayscale_decode=args.grayscale)
+    with open(f"{args.output}.summary.json", 'w') as f:
+        json.dump(summary, f, indent=4)
+
+    print_summary(summary, args.min_quality)
+    print(f"Terminé: {len(paths)} images en {elapsed:.1f} s ({len(paths) / elapsed:.0f} images/s)")
+
+
+if __name__ == "__main__":
+    main()
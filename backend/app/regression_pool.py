@@ -0,0 +1,303 @@
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import sys
+import threading
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from preprocessing import resize_crop
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _regression_worker(worker_id, spec, shm_name, slots_shape, tasks, results):
+    """
+    Processus de régression : charge le modèle une fois, puis normalise et infère les lots
+    dont les crops (déjà redimensionnés) sont lus directement dans la mémoire partagée.
+    """
+    import torch
+    from preprocessing import BatchPreprocessor
+    from dimension_service import load_backend
+
+    if spec['torch_threads']:
+        torch.set_num_threads(spec['torch_threads'])
+    device = torch.device("cpu")
+
+    # Artefact TorchScript / ONNX s'il est à jour, sinon timm + poids
+    backend, _, _ = load_backend(spec['model_path'], device, spec['backend'], spec['batch_size'],
+                                 spec['channels_last'], spec['calibration_batches'], spec['model'])
+    height, width = slots_shape[1:3]
+    preprocessor = BatchPreprocessor(size=(width, height), max_batch=spec['batch_size'], device=device)
+    # Préchauffage aux tailles de lot réelles avant de se déclarer prêt
+    for size in sorted({1, spec['batch_size']}):
+        backend(preprocessor.normalize(np.zeros((size, height, width, 3), dtype=np.uint8)))
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    slots = np.ndarray(slots_shape, dtype=np.uint8, buffer=shm.buf)
+    results.put(('ready', worker_id, os.getpid()))
+
+    try:
+        while True:
+            item = tasks.get()
+            if item is None:
+                break
+            kind, batch_id, payload = item
+            if kind == 'ping':
+                results.put(('pong', worker_id, batch_id))
+                continue
+            try:
+                outputs = backend(preprocessor.normalize(slots[payload]))
+                results.put(('ok', batch_id, np.asarray(outputs, dtype=np.float32)))
+            except Exception as e:
+                results.put(('error', batch_id, repr(e)))
+    finally:
+        del slots
+        shm.close()
+
+
+class _Worker:
+    """Processus de régression vu du parent : file de tâches, lots en cours, santé"""
+
+    def __init__(self, worker_id):
+        self.worker_id = worker_id
+        self.process = None
+        self.tasks = None
+        self.in_flight = {}  # batch_id -> lot
+        self.ready = False
+        self.last_pong = time.monotonic()
+        self.ping_sent = None
+        self.restarts = 0
+
+
+class _Batch:
+    def __init__(self, batch_id, slots, callback):
+        self.batch_id = batch_id
+        self.slots = slots
+        self.callback = callback
+        self.attempts = 0
+
+
+class RegressionProcessPool:
+    """
+    Régression des dimensions dans des processus séparés, hors du GIL du serveur.
+    - les crops sont redimensionnés par le parent directement dans des slots de mémoire
+      partagée (cv2 libère le GIL) ; seuls les indices de slots passent par les files
+    - chaque processus charge son propre modèle (CPU) et fait normalisation + inférence
+    - un thread de santé pingue les processus, redémarre ceux qui sont morts ou bloqués
+      et relance une fois les lots qu'ils avaient en cours
+    """
+
+    def __init__(self, model_path, workers=1, backend="eager", batch_size=4, channels_last=False,
+                 calibration_batches=None, model=None, size=(224, 224), torch_threads=None,
+                 slots_per_worker=None, health_interval=5.0, health_timeout=30.0, startup_timeout=300.0):
+        width, height = size
+        self.batch_size = batch_size
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.startup_timeout = startup_timeout
+        if torch_threads is None:
+            torch_threads = max(1, (os.cpu_count() or 1) // (workers + 1))
+        self.spec = {
+            'model_path': model_path,
+            'model': model,
+            'backend': backend,
+            'batch_size': batch_size,
+            'channels_last': channels_last,
+            'calibration_batches': calibration_batches,
+            'torch_threads': torch_threads,
+        }
+
+        # Deux lots en vol par processus : l'un est inféré pendant que l'autre est rempli
+        n_slots = workers * batch_size * (slots_per_worker or 2)
+        self.slots_shape = (n_slots, height, width, 3)
+        self._shm = shared_memory.SharedMemory(create=True, size=int(np.prod(self.slots_shape)))
+        self.slots = np.ndarray(self.slots_shape, dtype=np.uint8, buffer=self._shm.buf)
+        self._free_slots = list(range(n_slots))
+        self._slots_cond = threading.Condition()
+
+        self._context = mp.get_context("spawn")
+        self._results = self._context.Queue()
+        self._workers = [_Worker(i) for i in range(workers)]
+        self._lock = threading.Lock()
+        self._batch_ids = itertools.count()
+        self._closed = False
+        self.completed = 0
+        self.failed = 0
+
+        for worker in self._workers:
+            self._start_worker(worker)
+
+        self._collector = threading.Thread(target=self._collect_results, name="regression-results", daemon=True)
+        self._collector.start()
+        self._health = threading.Thread(target=self._health_loop, name="regression-health", daemon=True)
+        self._health.start()
+        logger.info(f"Pool de régression: {workers} processus x {torch_threads} threads, {n_slots} slots partagés")
+
+    def _start_worker(self, worker):
+        worker.tasks = self._context.Queue()
+        worker.ready = False
+        worker.ping_sent = None
+        worker.last_pong = time.monotonic()
+        worker.process = self._context.Process(
+            target=_regression_worker, name=f"regression-{worker.worker_id}", daemon=True,
+            args=(worker.worker_id, self.spec, self._shm.name, self.slots_shape, worker.tasks, self._results))
+        worker.process.start()
+
+    def _acquire_slots(self, count):
+        with self._slots_cond:
+            self._slots_cond.wait_for(lambda: len(self._free_slots) >= count or self._closed)
+            if self._closed:
+                raise RuntimeError("Pool de régression arrêté")
+            taken = self._free_slots[:count]
+            del self._free_slots[:count]
+            return taken
+
+    def _release_slots(self, slots):
+        with self._slots_cond:
+            self._free_slots.extend(slots)
+            self._slots_cond.notify_all()
+
+    def submit(self, images, callback):
+        """
+        Soumet un lot de crops BGR ; callback(outputs (N, 3), erreur) est appelé depuis le
+        thread de collecte. Bloque si tous les slots partagés sont occupés (contre-pression).
+        Un lot plus grand que le nombre de slots n'aurait jamais de place : ValueError.
+        """
+        if len(images) > self.slots_shape[0]:
+            raise ValueError(f"Lot de {len(images)} crops pour {self.slots_shape[0]} slots partagés")
+        slots = self._acquire_slots(len(images))
+        for slot, image in zip(slots, images):
+            resize_crop(image, self.slots[slot])
+        batch = _Batch(next(self._batch_ids), slots, callback)
+        self._dispatch(batch)
+        return batch.batch_id
+
+    def _dispatch(self, batch):
+        """Envoie le lot au processus prêt le moins chargé"""
+        batch.attempts += 1
+        with self._lock:
+            alive = [w for w in self._workers if w.process.is_alive()] or self._workers
+            worker = min(alive, key=lambda w: (not w.ready, len(w.in_flight)))
+            worker.in_flight[batch.batch_id] = batch
+            worker.tasks.put(('batch', batch.batch_id, batch.slots))
+
+    def _pop_batch(self, batch_id):
+        with self._lock:
+            for worker in self._workers:
+                batch = worker.in_flight.pop(batch_id, None)
+                if batch is not None:
+                    return batch
+        return None
+
+    def _finish(self, batch, outputs, error):
+        self._release_slots(batch.slots)
+        if error is None:
+            self.completed += 1
+        else:
+            self.failed += 1
+        try:
+            batch.callback(outputs, error)
+        except Exception as e:
+            logger.error(f"Erreur dans le rappel du lot {batch.batch_id}: {e}")
+
+    def _collect_results(self):
+        while not self._closed:
+            try:
+                kind, key, payload = self._results.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            except (EOFError, OSError):
+                break
+
+            if kind == 'ready':
+                self._workers[key].ready = True
+                self._workers[key].last_pong = time.monotonic()
+                logger.info(f"Processus de régression {key} prêt (pid {payload})")
+            elif kind == 'pong':
+                self._workers[key].last_pong = time.monotonic()
+                self._workers[key].ping_sent = None
+            else:
+                batch = self._pop_batch(key)
+                if batch is None:
+                    continue  # lot déjà relancé ailleurs après un redémarrage
+                if kind == 'ok':
+                    self._finish(batch, payload, None)
+                else:
+                    self._finish(batch, None, RuntimeError(payload))
+
+    def _health_loop(self):
+        while not self._closed:
+            time.sleep(self.health_interval)
+            for worker in self._workers:
+                self.check_worker(worker)
+
+    def check_worker(self, worker):
+        """Pingue un processus ; le redémarre s'il est mort ou ne répond plus"""
+        now = time.monotonic()
+        timeout = self.health_timeout if worker.ready else self.startup_timeout
+        if worker.process.is_alive():
+            if worker.ping_sent is None:
+                worker.ping_sent = now
+                worker.tasks.put(('ping', now, None))
+                return
+            if now - worker.last_pong < timeout:
+                return
+            logger.error(f"Processus de régression {worker.worker_id} ne répond plus, redémarrage")
+            worker.process.terminate()
+        else:
+            logger.error(f"Processus de régression {worker.worker_id} arrêté "
+                         f"(code {worker.process.exitcode}), redémarrage")
+        worker.process.join(timeout=5.0)
+
+        with self._lock:
+            orphans = list(worker.in_flight.values())
+            worker.in_flight.clear()
+            worker.restarts += 1
+            self._start_worker(worker)
+        # Chaque lot perdu est relancé une fois, puis échoue
+        for batch in orphans:
+            if batch.attempts < 2:
+                self._dispatch(batch)
+            else:
+                self._finish(batch, None, RuntimeError("Processus de régression perdu pendant le lot"))
+
+    def stats(self):
+        with self._lock:
+            workers = [{'pid': w.process.pid, 'alive': w.process.is_alive(), 'ready': w.ready,
+                        'in_flight': len(w.in_flight), 'restarts': w.restarts} for w in self._workers]
+        with self._slots_cond:
+            free = len(self._free_slots)
+        return {'workers': workers, 'free_slots': free, 'slots': self.slots_shape[0],
+                'completed': self.completed, 'failed': self.failed}
+
+    def close(self):
+        """Arrête les processus et libère la mémoire partagée"""
+        if self._closed:
+            return
+        self._closed = True
+        with self._slots_cond:
+            self._slots_cond.notify_all()
+        for worker in self._workers:
+            try:
+                worker.tasks.put(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5.0)
+            if worker.process.is_alive():
+                worker.process.terminate()
+        for worker in self._workers:
+            for batch in list(worker.in_flight.values()):
+                self._finish(batch, None, RuntimeError("Pool de régression arrêté"))
+            worker.in_flight.clear()
+        del self.slots
+        self._shm.close()
+        self._shm.unlink()
@@ -0,0 +1,102 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultStore:
+    """
+    Stockage thread-safe des résultats de dimensions, borné en taille et en durée.
+    - max_size : au-delà, le résultat le moins récemment utilisé est évincé (LRU)
+    - ttl : un résultat plus vieux que ttl secondes est évincé
+    - ack(key) : le consommateur signale que le résultat a été livré, il est supprimé
+    """
+
+    def __init__(self, max_size=1024, ttl=300.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._items = OrderedDict()  # clé -> (timestamp, résultat)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.acks = 0
+
+    def _expired(self, timestamp, now, max_age=None):
+        return now - timestamp > (self.ttl if max_age is None else max_age)
+
+    def put(self, key, result):
+        """Enregistre un résultat (horodaté dans result['timestamp'])"""
+        now = self._clock()
+        result['timestamp'] = now
+        with self._lock:
+            self._items[key] = (now, result)
+            self._items.move_to_end(key)
+            if len(self._items) > self.max_size:
+                self._purge_expired(now)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+                self.evictions += 1
+
+    def get(self, key):
+        """Résultat d'une clé (None si absent ou expiré)"""
+        now = self._clock()
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            if self._expired(item[0], now):
+                del self._items[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def __contains__(self, key):
+        now = self._clock()
+        with self._lock:
+            item = self._items.get(key)
+            return item is not None and not self._expired(item[0], now)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)
+
+    def ack(self, key):
+        """Le résultat a été livré : il peut être supprimé"""
+        with self._lock:
+            if self._items.pop(key, None) is not None:
+                self.acks += 1
+                return True
+            return False
+
+    def _purge_expired(self, now, max_age=None):
+        expired = [key for key, (timestamp, _) in self._items.items() if self._expired(timestamp, now, max_age)]
+        for key in expired:
+            del self._items[key]
+        self.expirations += len(expired)
+        return len(expired)
+
+    def cleanup(self, max_age=None):
+        """Supprime les résultats plus vieux que max_age (ttl par défaut)"""
+        with self._lock:
+            return self._purge_expired(self._clock(), max_age)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._items),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'acks': self.acks,
+            }
@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+# Configuration du logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class BackgroundInitializer:
+    """
+    Initialisation différée des modèles : build(step) tourne dans un thread dédié pendant que
+    le serveur répond déjà (/health, /ready). Chaque étape `with step("nom"):` est chronométrée
+    pour le détail du temps de démarrage (imports, poids, préchauffage...).
+    """
+
+    def __init__(self, build, name="models"):
+        self.build = build
+        self.name = name
+        self.status = "pending"  # pending -> loading -> ready | failed
+        self.error = None
+        self.steps = {}
+        self.current_step = None
+        self._started_at = None
+        self._finished_at = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    @contextmanager
+    def step(self, name):
+        self.current_step = name
+        start = time.perf_counter()
+        yield
+        # En cas d'exception, current_step garde l'étape en échec
+        self.steps[name] = time.perf_counter() - start
+        self.current_step = None
+        logger.info(f"Démarrage {self.name} - {name}: {self.steps[name]:.2f}s")
+
+    def start(self):
+        """Lance l'initialisation en arrière-plan (sans effet si elle est déjà lancée)"""
+        if self._thread is not None:
+            return
+        self.status = "loading"
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name=f"init-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self.build(self.step)
+            self.status = "ready"
+        except Exception as e:
+            self.status = "failed"
+            self.error = repr(e)
+            logger.error(f"Échec de l'initialisation {self.name} à l'étape {self.current_step}: {e}")
+        finally:
+            self._finished_at = time.perf_counter()
+            self._ready.set()
+
+    @property
+    def ready(self):
+        return self.status == "ready"
+
+    def wait(self, timeout=None):
+        """Attend la fin de l'initialisation ; retourne True si les modèles sont prêts"""
+        self._ready.wait(timeout)
+        return self.ready
+
+    def stats(self):
+        end = self._finished_at or time.perf_counter()
+        return {
+            'status': self.status,
+            'step': self.current_step,
+            'error': self.error,
+            'elapsed_s': round(end - self._started_at, 3) if self._started_at is not None else 0.0,
+            'steps_s': {name: round(t, 3) for name, t in self.steps.items()},
+        }
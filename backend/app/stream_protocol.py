@@ -0,0 +1,89 @@
+# Protocole binaire du flux /ws (?protocol=binary) : un seul message WebSocket binaire par frame,
+# contenant la frame JPEG brute (sans dessin, éventuellement réduite), les tracks de cette frame
+# et les dimensions validées depuis le message précédent, chacune avec le numéro de la frame
+# où elle a été mesurée. Tous les entiers / flottants sont little-endian.
+#
+#     en-tête   HEADER   magic "BV", version, type, seq, âge (ms), largeur, hauteur, échelle,
+#                        nb de tracks, nb de dimensions, taille du JPEG
+#     tracks    TRACK    id, x1, y1, x2, y2 (pixels de l'image envoyée), statut, qualité (0-255), stabilité
+#     dims      DIMENSION id, seq de mesure, longueur, largeur, hauteur (cm), confiance (-1 si absente)
+#     jpeg      octets JPEG (absent pour un message MSG_DIMENSIONS)
+
+import os
+import struct
+import sys
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from overlay import STATUS_CODES
+
+MAGIC = b"BV"
+VERSION = 1
+MSG_FRAME = 1
+MSG_DIMENSIONS = 2  # dimensions seules, sans frame prête
+
+HEADER = struct.Struct("<2sBBIfHHfHHI")
+TRACK = struct.Struct("<iHHHHBBH")
+DIMENSION = struct.Struct("<iIffff")
+
+STATUS_NAMES = {code: name for name, code in STATUS_CODES.items()}
+
+
+def _u16(value):
+    return int(min(max(value, 0), 0xFFFF))
+
+
+def pack_message(packet, dimensions, now):
+    """
+    Construit le message binaire d'une frame encodée (packet, ou None) et des dimensions
+    en attente. now : perf_counter() au moment de l'envoi (pour l'âge de la frame).
+    """
+    parts = []
+    if packet is not None:
+        scale = packet.scale
+        for obj in packet.tracks:
+            x, y, w, h = obj.to_tlwh()
+            quality = obj.quality if obj.quality is not None else 0.0
+            parts.append(TRACK.pack(int(obj.track_id), _u16(x * scale), _u16(y * scale),
+                                    _u16((x + w) * scale), _u16((y + h) * scale),
+                                    STATUS_CODES.get(obj.status, 0), int(min(max(quality, 0.0), 1.0) * 255),
+                                    _u16(obj.stable_count or 0)))
+    for record in dimensions:
+        parts.append(DIMENSION.pack(int(record['id']), int(record.get('seq', 0)), record['length_cm'],
+                                    record['width_cm'], record['height_cm'], record.get('confidence', -1.0)))
+
+    if packet is None:
+        header = HEADER.pack(MAGIC, VERSION, MSG_DIMENSIONS, 0, 0.0, 0, 0, 0.0, 0, len(dimensions), 0)
+        return b"".join([header] + parts)
+
+    width, height = packet.size
+    header = HEADER.pack(MAGIC, VERSION, MSG_FRAME, packet.seq, (now - packet.captured_at) * 1000.0,
+                         width, height, packet.scale, len(packet.tracks), len(dimensions), len(packet.jpeg_bytes))
+    return b"".join([header] + parts + [packet.jpeg_bytes])
+
+
+def unpack_message(data):
+    """Décode un message (côté client / tests) : dictionnaire avec tracks, dimensions et jpeg"""
+    magic, version, kind, seq, age_ms, width, height, scale, n_tracks, n_dims, jpeg_size = \
+        HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Message binaire inconnu")
+    offset = HEADER.size
+
+    tracks = []
+    for _ in range(n_tracks):
+        track_id, x1, y1, x2, y2, status, quality, stable = TRACK.unpack_from(data, offset)
+        offset += TRACK.size
+        tracks.append({'id': track_id, 'bbox': (x1, y1, x2, y2), 'status': STATUS_NAMES.get(status),
+                       'quality': quality / 255.0, 'stable': stable})
+
+    dimensions = []
+    for _ in range(n_dims):
+        track_id, measured_seq, length, width_cm, height_cm, confidence = DIMENSION.unpack_from(data, offset)
+        offset += DIMENSION.size
+        dimensions.append({'id': track_id, 'seq': measured_seq, 'length_cm': length, 'width_cm': width_cm,
+                           'height_cm': height_cm, 'confidence': confidence if confidence >= 0 else None})
+
+    return {
+        'type': kind, 'seq': seq, 'age_ms': age_ms, 'width': width, 'height': height, 'scale': scale,
+        'tracks': tracks, 'dimensions': dimensions, 'jpeg': data[offset:offset + jpeg_size],
+    }
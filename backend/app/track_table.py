@@ -0,0 +1,113 @@
+import numpy as np
+
+
+class TrackTable:
+    """
+    Table compacte de l'état par track, stockée dans des tableaux NumPy indexés par slot.
+    Un dictionnaire track_id -> slot donne l'accès ; les slots des tracks absents depuis
+    plus de max_missed_frames frames sont libérés et réutilisés, la mémoire reste donc
+    proportionnelle au nombre de tracks simultanés et non au nombre de colis vus.
+    """
+
+    def __init__(self, capacity=64, max_missed_frames=120):
+        self.max_missed_frames = max_missed_frames
+        self.frame_index = 0
+        self._slots = {}  # track_id -> slot
+        self._free = []
+        self.capacity = 0
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        """Agrandit les tableaux (copie de l'existant) et ajoute les nouveaux slots libres"""
+        old_capacity = self.capacity
+
+        def resized(array, shape, dtype, fill):
+            new = np.full(shape, fill, dtype=dtype)
+            if old_capacity:
+                new[:old_capacity] = array
+            return new
+
+        self.track_ids = resized(getattr(self, 'track_ids', None), capacity, np.int64, -1)
+        self.bboxes = resized(getattr(self, 'bboxes', None), (capacity, 4), np.int32, 0)
+        self.stable_counts = resized(getattr(self, 'stable_counts', None), capacity, np.int32, 0)
+        self.quality_scores = resized(getattr(self, 'quality_scores', None), capacity, np.float32, 0.0)
+        # Score estimé (avec 10 lignes) d'une box écartée par le criblage (score exact sinon) : diagnostic seulement
+        self.quality_estimates = resized(getattr(self, 'quality_estimates', None), capacity, np.float32, 0.0)
+        self.last_seen = resized(getattr(self, 'last_seen', None), capacity, np.int64, 0)
+        self.sent = resized(getattr(self, 'sent', None), capacity, np.bool_, False)
+        # Box et frame du dernier calcul de qualité (-1 : jamais calculé)
+        self.quality_bboxes = resized(getattr(self, 'quality_bboxes', None), (capacity, 4), np.int32, 0)
+        self.quality_frames = resized(getattr(self, 'quality_frames', None), capacity, np.int64, -1)
+
+        self._free.extend(range(capacity - 1, old_capacity - 1, -1))
+        self.capacity = capacity
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, track_id):
+        return track_id in self._slots
+
+    def slot(self, track_id):
+        return self._slots.get(track_id)
+
+    def _assign_slots(self, track_ids):
+        """Slots des track_ids (alloués si nouveaux) + masque des tracks nouveaux"""
+        slots = np.empty(len(track_ids), dtype=np.int64)
+        is_new = np.zeros(len(track_ids), dtype=np.bool_)
+        for i, track_id in enumerate(track_ids.tolist()):
+            slot = self._slots.get(track_id)
+            if slot is None:
+                if not self._free:
+                    self._grow(self.capacity * 2)
+                slot = self._free.pop()
+                self._slots[track_id] = slot
+                self.track_ids[slot] = track_id
+                self.stable_counts[slot] = 0
+                self.quality_scores[slot] = 0.0
+                self.quality_estimates[slot] = 0.0
+                self.sent[slot] = False
+                self.quality_frames[slot] = -1
+                is_new[i] = True
+            slots[i] = slot
+        return slots, is_new
+
+    def update(self, track_ids, bboxes, max_shift=25.0):
+        """
+        Enregistre les boxes (N, 4) d'une frame et met à jour la stabilité de tous
+        les tracks en une passe : un track est stable s'il existait déjà et que sa
+        box a bougé de moins de max_shift pixels (norme L2 sur x1, y1, x2, y2).
+        Retourne les slots des tracks dans l'ordre des entrées.
+        """
+        self.frame_index += 1
+        slots, is_new = self._assign_slots(np.asarray(track_ids, dtype=np.int64))
+        if len(slots) == 0:
+            return slots
+
+        shift = np.linalg.norm((self.bboxes[slots] - bboxes).astype(np.float32), axis=1)
+        stable = ~is_new & (shift < max_shift)
+        self.stable_counts[slots] = np.where(stable, self.stable_counts[slots] + 1, 1)
+        self.bboxes[slots] = bboxes
+        self.last_seen[slots] = self.frame_index
+        return slots
+
+    def evict(self):
+        """Libère les tracks non vus depuis max_missed_frames ; retourne leurs track_ids"""
+        stale = (self.track_ids >= 0) & (self.frame_index - self.last_seen > self.max_missed_frames)
+        if not stale.any():
+            return []
+
+        stale_slots = np.flatnonzero(stale)
+        evicted = self.track_ids[stale_slots].tolist()
+        for track_id in evicted:
+            del self._slots[track_id]
+        self.track_ids[stale_slots] = -1
+        self.sent[stale_slots] = False
+        self._free.extend(stale_slots.tolist())
+        return evicted
+
+    def nbytes(self):
+        """Mémoire occupée par les tableaux"""
+        return sum(a.nbytes for a in (self.track_ids, self.bboxes, self.stable_counts,
+                                       self.quality_scores, self.quality_estimates, self.last_seen, self.sent,
+                                       self.quality_bboxes, self.quality_frames))
@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SyntheticConveyor
+from bench_quality import visible_tracks
+from crop_pool import CropPool
+from debug_writer import DebugImageWriter
+from fusion import TrackViews
+from preprocessing import resize_crop
+
+
+class LegacyCropPath:
+    """Chemin des crops avant le pool : copie contiguë par soumission, copie par vue gardée, imwrite synchrone"""
+
+    def __init__(self, debug_dir, top_k):
+        self.debug_dir = debug_dir
+        self.top_k = top_k
+        self.staging = np.empty((1, 224, 224, 3), dtype=np.uint8)
+        self.views = {}
+
+    def process(self, frame, track_ids, boxes, frame_index):
+        for track_id, (x1, y1, x2, y2) in zip(track_ids.tolist(), boxes.tolist()):
+            roi = frame[y1:y2, x1:x2]
+            if frame_index % 30 == 0:
+                cv2.imwrite(os.path.join(self.debug_dir, f"roi_{track_id}.jpg"), roi)
+            # Ancien TrackViews.offer : copie du crop s'il entre dans les top_k du track
+            views = self.views.setdefault(track_id, [])
+            quality = float(x2 - x1)
+            if len(views) < self.top_k:
+                views.append((quality, roi.copy()))
+            elif quality > min(views, key=lambda v: v[0])[0]:
+                views.remove(min(views, key=lambda v: v[0]))
+                views.append((quality, roi.copy()))
+            crop = np.ascontiguousarray(roi)  # add_task
+            resize_crop(crop, self.staging[0])  # prétraitement du lot
+
+
+class PooledCropPath:
+    """Chemin actuel : vues de la frame, un seul redimensionnement dans un tampon réutilisé, debug asynchrone"""
+
+    def __init__(self, debug_dir, top_k):
+        self.pool = CropPool(capacity=64)
+        self.writer = DebugImageWriter(debug_dir, sample_every=30, max_per_second=None)
+        self.top_k = top_k
+        self.views = {}
+
+    def process(self, frame, track_ids, boxes, frame_index):
+        sampled = self.writer.sampled(frame_index)
+        for track_id, (x1, y1, x2, y2) in zip(track_ids.tolist(), boxes.tolist()):
+            roi = frame[y1:y2, x1:x2]
+            if sampled:
+                self.writer.submit(f"roi_{track_id}.jpg", roi)
+            self.views.setdefault(track_id, TrackViews(self.top_k)).offer(float(x2 - x1), roi)
+            crop = self.pool.put(roi)
+            crop.release()  # rendu après le prétraitement du lot
+
+
+def measure(path, frames):
+    """Temps par frame, octets alloués puis relâchés au pic (transitoires) et mémoire retenue"""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    transient, elapsed = [], 0.0
+    for index, (frame, track_ids, boxes) in enumerate(frames):
+        tracemalloc.reset_peak()
+        start_current = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        path.process(frame, track_ids, boxes, index)
+        elapsed += time.perf_counter() - t0
+        current, peak = tracemalloc.get_traced_memory()
+        transient.append(peak - start_current)
+    retained = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return {
+        'ms_per_frame': round(elapsed * 1000 / len(frames), 3),
+        'transient_kb_per_frame_mean': round(float(np.mean(transient)) / 1024, 1),
+        'transient_kb_per_frame_max': round(float(np.max(transient)) / 1024, 1),
+        'retained_kb': round(retained / 1024, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Allocations par frame du chemin des crops : avant / après le pool")
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--parcels", type=int, default=6)
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    conveyor = SyntheticConveyor(args.width, args.height, parcels=args.parcels, seed=args.seed)
+    ids = {}
+    frames = []
+    for frame in conveyor.frames(args.frames):
+        track_ids, boxes = visible_tracks(conveyor, ids)
+        frames.append((frame, track_ids, boxes))
+
+    with tempfile.TemporaryDirectory() as debug_dir:
+        legacy = measure(LegacyCropPath(debug_dir, args.top_k), frames)
+        pooled_path = PooledCropPath(debug_dir, args.top_k)
+        pooled = measure(pooled_path, frames)
+        pooled_path.writer.close()
+
+    print(json.dumps({
+        'frames': args.frames,
+        'boxes_per_frame': round(sum(len(b) for _, _, b in frames) / len(frames), 2),
+        'legacy': legacy,
+        'pooled': pooled,
+        'crop_pool': pooled_path.pool.stats(),
+        'debug_writer': pooled_path.writer.stats(),
+    }, indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SyntheticConveyor
+from crop_pool import CropPool
+from estimation_cache import CropSignature, EstimationCache
+
+
+def footage(args):
+    """
+    Frames synthétiques et, par frame, les colis visibles :
+    (identifiant réel du colis, dimensions réelles, box). Les identifiants de track sont
+    attribués ensuite, avec des changements d'ID simulés.
+    """
+    conveyor = SyntheticConveyor(args.width, args.height, parcels=args.parcels, seed=args.seed)
+    uids = iter(range(1 << 30))
+    for frame in conveyor.frames(args.frames):
+        visible = []
+        for p in conveyor.parcels:
+            x1, y1 = max(0, p['x']), max(0, p['y'])
+            x2, y2 = min(conveyor.width, p['x'] + p['w']), min(conveyor.height, p['y'] + p['h'])
+            if x2 - x1 > 4 and y2 - y1 > 4:
+                # Identifiant propre au colis (id() peut être réutilisé après le remplacement d'un colis)
+                visible.append((p.setdefault('uid', next(uids)), p['dims'], (x1, y1, x2, y2)))
+        yield frame, visible
+
+
+def submissions(args):
+    """
+    Crops envoyés au régresseur, comme le détecteur : un par track, une fois le track stable
+    depuis stable_frames frames. Un colis change d'ID (occlusion, main au-dessus) avec une
+    probabilité switch_rate par frame : le nouveau track est soumis à nouveau.
+    """
+    rng = np.random.default_rng(args.seed + 1)
+    pool = CropPool(capacity=8)
+    track_of, seen, submitted, next_track = {}, {}, set(), [0]
+
+    def new_track(parcel):
+        next_track[0] += 1
+        track_of[parcel] = next_track[0]
+        seen[next_track[0]] = 0
+
+    for frame, visible in footage(args):
+        for parcel, dims, (x1, y1, x2, y2) in visible:
+            if parcel not in track_of or rng.random() < args.switch_rate:
+                new_track(parcel)
+            track = track_of[parcel]
+            seen[track] += 1
+            if seen[track] >= args.stable_frames and track not in submitted:
+                submitted.add(track)
+                roi = frame[y1:y2, x1:x2]
+                if args.noise:
+                    # Bruit de capteur, tiré seulement sur les crops soumis
+                    noise = np.empty(roi.shape, dtype=np.int16)
+                    cv2.randn(noise, 0, args.noise)
+                    roi = cv2.add(roi, noise, dtype=cv2.CV_8U)
+                crop = pool.put(roi)
+                yield track, parcel, np.asarray(dims, dtype=np.float32), CropSignature.of(crop.array, roi.shape)
+                crop.release()
+
+
+def replay(items, max_distance, color_tolerance, size_tolerance, ttl):
+    """Rejoue les soumissions à travers un EstimationCache ; la sortie « brute » est la vérité terrain"""
+    cache = EstimationCache(max_size=256, ttl=ttl, max_distance=max_distance, color_tolerance=color_tolerance,
+                            size_tolerance=size_tolerance)
+    false_hits, errors = 0, []
+    start = time.perf_counter()
+    for track, parcel, dims, signature in items:
+        raw = cache.lookup(signature, owner=track)
+        if raw is None:
+            cache.put(signature, dims, owner=track)  # forward du régresseur
+            continue
+        error = float(np.abs(raw - dims).max())
+        errors.append(error)
+        if error > 1e-3:
+            false_hits += 1  # estimation d'un autre colis
+    elapsed = time.perf_counter() - start
+    stats = cache.stats()
+    return {
+        'max_distance': max_distance,
+        'hit_rate': stats['hit_rate'],
+        'forward_passes': stats['misses'],
+        'false_hits': false_hits,
+        'false_hit_max_error_cm': round(max(errors), 2) if false_hits else 0.0,
+        'lookup_us': round(elapsed * 1e6 / len(items), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Taux de succès du cache d'estimations sur des changements d'ID")
+    parser.add_argument("--frames", type=int, default=1500)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--parcels", type=int, default=4)
+    parser.add_argument("--switch-rate", type=float, default=0.02, help="Probabilité de changement d'ID par frame")
+    parser.add_argument("--stable-frames", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=3.0, help="Écart-type du bruit de capteur (niveaux de gris)")
+    parser.add_argument("--color-tolerance", type=float, default=12.0)
+    parser.add_argument("--size-tolerance", type=float, default=0.15)
+    parser.add_argument("--ttl", type=float, default=120.0)
+    parser.add_argument("--distances", type=int, nargs="+", default=[0, 2, 4, 6, 8, 10, 12])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    items = list(submissions(args))
+    hashing_ms = (time.perf_counter() - start) * 1000
+    parcels = len({parcel for _, parcel, _, _ in items})
+
+    results = {
+        'frames': args.frames,
+        'submissions_without_cache': len(items),
+        'distinct_parcels': parcels,
+        'switch_rate': args.switch_rate,
+        'sweep': [replay(items, d, args.color_tolerance, args.size_tolerance, args.ttl) for d in args.distances],
+    }
+    print(f"{len(items)} crops soumis pour {parcels} colis (génération + hash : {hashing_ms:.0f} ms)")
+    for row in results['sweep']:
+        print(f"distance <= {row['max_distance']:2d}  succès: {row['hit_rate']:.1%}  "
+              f"forwards: {row['forward_passes']:4d}  faux succès: {row['false_hits']}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
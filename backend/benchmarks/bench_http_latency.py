@@ -0,0 +1,184 @@
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic import APP_DIR, SyntheticConveyor
+from stand_in_models import build_detector
+
+# main.py s'importe comme le fait uvicorn (app.main)
+sys.path.append(os.path.join(APP_DIR, ".."))
+
+
+def blocking_route(main, video_path):
+    """Ancien /ws : lecture de la caméra et détection appelées directement dans la coroutine"""
+
+    async def blocking_ws(websocket):
+        await websocket.accept()
+        cap = cv2.VideoCapture(video_path)
+        state = main.detector.create_stream_state(f"blocking-{id(websocket)}")
+        try:
+            while True:
+                ret, frame = cap.read()
+                if not ret:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    continue
+                processed_frame, _, _ = main.detector.process_frame(frame, state)
+                _, buffer = cv2.imencode(".jpg", processed_frame)
+                await websocket.send_bytes(buffer.tobytes())
+        except Exception:
+            pass
+        finally:
+            cap.release()
+
+    return blocking_ws
+
+
+def start_server(port, video_path, cameras, real):
+    """Serveur main.app (uvicorn, dans un thread) avec les modèles de substitution et K caméras vidéo"""
+    import uvicorn
+    from app import main
+    from app.startup import BackgroundInitializer
+
+    def build(step):
+        from app.camera_registry import CameraRegistry
+        from app.async_api import AsyncDetector
+        with step("models"):
+            detector = build_detector(real=real)
+        registry = CameraRegistry(detector, {f"cam{i}": video_path for i in range(cameras)}, batched=True)
+        main.detector, main.dimension_service, main.camera_registry = detector, detector.dimension_service, registry
+        main.async_detector = AsyncDetector(detector, detector_lock=registry.detector_lock)
+
+    main.BILLING_BACKEND = None  # pas d'écriture dans le stockage de facturation réel
+    main.startup = BackgroundInitializer(build)
+    main.app.add_api_websocket_route("/ws_blocking", blocking_route(main, video_path))
+
+    server = uvicorn.Server(uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, name="bench-server", daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    if not main.startup.wait(120):
+        raise RuntimeError(f"Démarrage des modèles en échec: {main.startup.stats()}")
+    return server, thread
+
+
+def probe_latency(port, path, duration, interval):
+    """Latences (ms) de requêtes GET successives sur une connexion keep-alive"""
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        conn.request("GET", path)
+        conn.getresponse().read()
+        latencies.append((time.perf_counter() - start) * 1000.0)
+        time.sleep(interval)
+    conn.close()
+    return latencies
+
+
+async def consume(url, stop, counter):
+    """Client WebSocket : reçoit les frames jusqu'à la fin de la mesure"""
+    import websockets
+    async with websockets.connect(url, max_size=None) as ws:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(ws.recv(), 0.5)
+                counter[0] += 1
+            except asyncio.TimeoutError:
+                continue
+
+
+def run_clients(urls, stop, counters, ready):
+    async def main():
+        tasks = [asyncio.create_task(consume(url, stop, counter)) for url, counter in zip(urls, counters)]
+        ready.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    asyncio.run(main())
+
+
+def measure(port, mode, streams, args):
+    if mode == "async":
+        urls = [f"ws://127.0.0.1:{port}/ws?camera=cam{i}" for i in range(streams)]
+    else:
+        urls = [f"ws://127.0.0.1:{port}/ws_blocking" for _ in range(streams)]
+    stop, ready = threading.Event(), threading.Event()
+    counters = [[0] for _ in urls]
+    clients = threading.Thread(target=run_clients, args=(urls, stop, counters, ready), daemon=True)
+    clients.start()
+    ready.wait()
+    time.sleep(args.settle)  # démarrage des caméras
+    for counter in counters:
+        counter[0] = 0
+
+    latencies = probe_latency(port, args.path, args.duration, args.interval)
+    stop.set()
+    clients.join(timeout=10)
+    time.sleep(args.settle)  # arrêt des caméras (dernier abonné parti)
+
+    latencies = np.asarray(latencies)
+    return {
+        'mode': mode,
+        'streams': streams,
+        'requests': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+        'max_ms': round(float(latencies.max()), 2),
+        'fps_per_stream': [round(c[0] / args.duration, 1) for c in counters],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latence HTTP du serveur pendant que des flux /ws tournent")
+    parser.add_argument("--real", action="store_true", help="Vrais poids (modèles de substitution sinon)")
+    parser.add_argument("--streams", type=int, nargs="+", default=[0, 1, 2, 4])
+    parser.add_argument("--modes", nargs="+", default=["async", "blocking"], choices=["async", "blocking"])
+    parser.add_argument("--path", default="/health", help="Route HTTP mesurée")
+    parser.add_argument("--duration", type=float, default=10.0, help="Durée de mesure par palier (s)")
+    parser.add_argument("--interval", type=float, default=0.02, help="Pause entre deux requêtes (s)")
+    parser.add_argument("--settle", type=float, default=2.0)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    try:
+        import uvicorn  # noqa: F401
+        import websockets  # noqa: F401
+    except ImportError:
+        raise RuntimeError("Ce benchmark nécessite uvicorn et websockets (pip install 'uvicorn[standard]')")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = SyntheticConveyor(args.width, args.height, parcels=4).write_video(
+            os.path.join(tmp, "conveyor.mp4"), 600)
+        server, thread = start_server(args.port, video_path, max(args.streams), args.real)
+        for mode in args.modes:
+            for streams in args.streams:
+                if streams == 0 and mode != args.modes[0]:
+                    continue  # palier de référence déjà mesuré
+                row = measure(args.port, mode, streams, args)
+                results.append(row)
+                print(f"{mode:8s} K={streams}  {args.path} p50: {row['p50_ms']:7.2f} ms  "
+                      f"p99: {row['p99_ms']:7.2f} ms  max: {row['max_ms']:7.2f} ms  fps: {row['fps_per_stream']}")
+        server.should_exit = True
+        thread.join(timeout=10)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SyntheticConveyor
+from stand_in_models import build_detector
+
+
+def parse_mode(mode):
+    """native | downscale:<max_side> | tiles:<colonnes>x<lignes>[@<max_side>] -> paramètres d'InferenceScaler"""
+    if mode == "native":
+        return None
+    kind, _, value = mode.partition(":")
+    if kind == "downscale":
+        return {'max_side': int(value)}
+    if kind == "tiles":
+        grid, _, max_side = value.partition("@")
+        columns, rows = (int(v) for v in grid.split("x"))
+        return {'tiles': (columns, rows), 'max_side': int(max_side) if max_side else None}
+    raise ValueError(f"Mode inconnu: {mode}")
+
+
+def parse_resolution(value):
+    width, height = (int(v) for v in value.lower().split("x"))
+    return width, height
+
+
+def visible_parcels(conveyor):
+    """Colis entièrement dans la frame : box (x1, y1, x2, y2) et dimensions réelles (cm)"""
+    parcels = []
+    for p in conveyor.parcels:
+        if p['x'] >= 0 and p['x'] + p['w'] <= conveyor.width and p['y'] + p['h'] <= conveyor.height:
+            parcels.append(((p['x'], p['y'], p['x'] + p['w'], p['y'] + p['h']), p['dims']))
+    return parcels
+
+
+def iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def match(tracks, parcels, threshold=0.5):
+    """Track (x1, y1, x2, y2, id, ...) de meilleur IoU pour chaque colis : [(colis, track ou None, IoU)]"""
+    matches = []
+    for box, dims in parcels:
+        best, best_iou = None, threshold
+        for track in tracks:
+            overlap = iou(track[:4], box)
+            if overlap >= best_iou:
+                best, best_iou = track, overlap
+        matches.append(((box, dims), best, best_iou if best is not None else 0.0))
+    return matches
+
+
+def run(detector, resolution, mode, args):
+    """
+    FPS du détecteur (hors génération des frames) et erreurs, en coordonnées natives :
+    - boxes : rappel, IoU et erreur (cm) des côtés déduits de la box, à l'échelle connue du convoyeur
+      (320 cm sur la largeur, 240 cm sur la hauteur)
+    - dimensions : erreur absolue moyenne des estimations du régresseur (significative avec --real ;
+      le régresseur de substitution renvoie une valeur constante)
+    """
+    width, height = resolution
+    detector.inference_scaling = parse_mode(mode)
+    state = detector.create_stream_state(f"bench-{mode}")
+    conveyor = SyntheticConveyor(width, height, parcels=args.parcels, speed=max(1, args.speed * width // 1280),
+                                 seed=args.seed)
+    cm_per_px = np.array([320.0 / width, 240.0 / height])
+
+    detector.process_frame(conveyor.next_frame(), state, draw=False)  # préchauffage
+    latencies, ious, box_errors, dimension_errors = [], [], [], []
+    found = expected = 0
+    parcel_of = {}  # track_id -> dimensions réelles du colis associé
+    for _ in range(args.frames):
+        frame = conveyor.next_frame()
+        parcels = visible_parcels(conveyor)
+        start = time.perf_counter()
+        _, _, records = detector.process_frame(frame, state, draw=False)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+
+        for (box, dims), track, overlap in match(state.last_tracks.tolist(), parcels):
+            expected += 1
+            if track is None:
+                continue
+            found += 1
+            ious.append(overlap)
+            measured = np.array([track[2] - track[0], track[3] - track[1]]) * cm_per_px
+            box_errors.append(np.abs(measured - dims[:2]))
+            parcel_of[int(track[4])] = dims
+        for record in records + detector.drain_pending(state):
+            dims = parcel_of.get(record['id'])
+            if dims is not None:
+                estimate = (record['length_cm'], record['width_cm'], record['height_cm'])
+                dimension_errors.append(np.abs(np.subtract(estimate, dims)))
+
+    for record in detector.drain_pending(state, timeout=args.drain_timeout):
+        dims = parcel_of.get(record['id'])
+        if dims is not None:
+            estimate = (record['length_cm'], record['width_cm'], record['height_cm'])
+            dimension_errors.append(np.abs(np.subtract(estimate, dims)))
+
+    latencies = np.asarray(latencies)
+    box_errors = np.asarray(box_errors).reshape(-1, 2)
+    dimension_errors = np.asarray(dimension_errors).reshape(-1, 3)
+    result = {
+        'resolution': f"{width}x{height}",
+        'mode': mode,
+        'fps': round(1000.0 / latencies.mean(), 1),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2),
+        'p99_ms': round(float(np.percentile(latencies, 99)), 2),
+        'recall': round(found / expected, 3) if expected else None,
+        'mean_iou': round(float(np.mean(ious)), 3) if ious else None,
+        'box_error_cm': [round(float(v), 2) for v in box_errors.mean(axis=0)] if len(box_errors) else None,
+        'dimension_records': len(dimension_errors),
+        'dimension_error_cm': [round(float(v), 2) for v in dimension_errors.mean(axis=0)]
+        if len(dimension_errors) else None,
+    }
+    if state.scaler is not None:
+        result['scaler'] = state.scaler.stats()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="FPS et erreur des dimensions selon la résolution d'entrée et la résolution de détection")
+    parser.add_argument("--real", action="store_true", help="Vrais poids (modèles de substitution sinon)")
+    parser.add_argument("--resolutions", nargs="+", default=["1280x720", "1920x1080", "2560x1440", "3840x2160"])
+    parser.add_argument("--modes", nargs="+",
+                        default=["native", "downscale:1280", "downscale:1920", "tiles:2x2@1920"],
+                        help="native, downscale:<plus grand côté>, tiles:<colonnes>x<lignes>[@<plus grand côté>]")
+    parser.add_argument("--frames", type=int, default=150)
+    parser.add_argument("--parcels", type=int, default=3)
+    parser.add_argument("--speed", type=int, default=6, help="Pixels par frame à 1280 de large (proportionnel au-delà)")
+    parser.add_argument("--drain-timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    detector = build_detector(real=args.real)
+    results = []
+    for resolution in map(parse_resolution, args.resolutions):
+        for mode in args.modes:
+            row = run(detector, resolution, mode, args)
+            results.append(row)
+            print(f"{row['resolution']:>9s} {mode:16s} {row['fps']:7.1f} fps  p99: {row['p99_ms']:7.2f} ms  "
+                  f"rappel: {row['recall']}  IoU: {row['mean_iou']}  erreur box (cm): {row['box_error_cm']}  "
+                  f"erreur dimensions (cm): {row['dimension_error_cm']}")
+    detector.dimension_service.close()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
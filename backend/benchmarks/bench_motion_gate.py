@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SyntheticConveyor
+from stand_in_models import build_detector
+from motion_gate import InspectionZone, MotionGate
+
+
+def load_footage(video_path, count, args):
+    """Frames d'un enregistrement du tapis, ou convoyeur synthétique avec des périodes vides"""
+    if video_path:
+        frames = []
+        cap = cv2.VideoCapture(video_path)
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+        return frames
+    conveyor = SyntheticConveyor(args.width, args.height, parcels=args.parcels, idle_frames=args.idle_frames)
+    return list(conveyor.frames(count))
+
+
+def run(detector, frames, zone, gate):
+    """Passe toutes les frames dans le détecteur ; temps CPU du processus, temps réel et tracks vus"""
+    detector.inspection_zones = zone
+    detector.motion_gate = gate
+    state = detector.create_stream_state("bench")
+    detector.process_frame(frames[0], state, draw=False)  # préchauffage
+
+    track_ids, records = set(), 0
+    cpu_start, wall_start = time.process_time(), time.perf_counter()
+    for frame in frames:
+        _, tracks, dimensions = detector.process_frame(frame, state, draw=False)
+        track_ids.update(obj.track_id for obj in tracks)
+        records += len(dimensions)
+    cpu, wall = time.process_time() - cpu_start, time.perf_counter() - wall_start
+
+    result = {
+        'cpu_ms_per_frame': round(cpu * 1000 / len(frames), 3),
+        'wall_ms_per_frame': round(wall * 1000 / len(frames), 3),
+        'tracks_seen': len(track_ids),
+        'dimension_records': records,
+    }
+    if state.motion_gate is not None:
+        result['motion_gate'] = state.motion_gate.stats()
+    return result
+
+
+def gate_cost(frames, zone, options):
+    """Coût seul du filtre de mouvement (ms / frame)"""
+    zone = InspectionZone(zone) if zone else None
+    gate = MotionGate(**options)
+    start = time.perf_counter()
+    for frame in frames:
+        gate.should_detect(zone.crop(frame) if zone is not None else frame)
+    return round((time.perf_counter() - start) * 1000 / len(frames), 3)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Frames écartées et CPU économisé par le filtre de mouvement")
+    parser.add_argument("--video", help="Enregistrement du tapis (convoyeur synthétique sinon)")
+    parser.add_argument("--real", action="store_true", help="Vrais poids YOLO (modèles de substitution sinon)")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--parcels", type=int, default=3)
+    parser.add_argument("--idle-frames", type=int, default=300, help="Frames vides entre deux vagues (synthétique)")
+    parser.add_argument("--zone", type=float, nargs=4, metavar=("X1", "Y1", "X2", "Y2"),
+                        help="Zone d'inspection (pixels ou fractions)")
+    parser.add_argument("--pixel-threshold", type=int, default=25)
+    parser.add_argument("--min-changed", type=float, default=0.002)
+    parser.add_argument("--max-idle-frames", type=int, default=60)
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    frames = load_footage(args.video, args.frames, args)
+    options = {'pixel_threshold': args.pixel_threshold, 'min_changed': args.min_changed,
+               'max_idle_frames': args.max_idle_frames}
+    zone = tuple(args.zone) if args.zone else None
+
+    detector = build_detector(real=args.real)
+    baseline = run(detector, frames, None, None)
+    zoned = run(detector, frames, zone, None) if zone else None
+    gated = run(detector, frames, zone, options)
+
+    results = {
+        'frames': len(frames),
+        'source': args.video or f"synthétique ({args.idle_frames} frames vides par vague)",
+        'full_frame': baseline,
+        'zone_only': zoned,
+        'zone_and_gate': gated,
+        'gate_ms_per_frame': gate_cost(frames, zone, options),
+        'cpu_saved': round(1.0 - gated['cpu_ms_per_frame'] / baseline['cpu_ms_per_frame'], 3),
+    }
+    print(json.dumps(results, indent=4, ensure_ascii=False))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4, ensure_ascii=False)
+    detector.dimension_service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app"))
+from yolov8 import YOLOv8Detector
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app")
+
+
+def load_frames(video_path, count, size):
+    """Charge des frames d'une vidéo, ou génère des frames synthétiques"""
+    frames = []
+    if video_path:
+        cap = cv2.VideoCapture(video_path)
+        while len(frames) < count:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            frames.append(frame)
+        cap.release()
+    rng = np.random.default_rng(0)
+    while len(frames) < count:
+        frame = np.full((size[1], size[0], 3), 90, dtype=np.uint8)
+        x, y = rng.integers(0, size[0] // 2), rng.integers(0, size[1] // 2)
+        cv2.rectangle(frame, (x, y), (x + size[0] // 4, y + size[1] // 4), (40, 120, 200), -1)
+        frames.append(frame)
+    return frames
+
+
+def run_sequential(detector, states, frames):
+    """Une passe YOLO par frame et par flux"""
+    start = time.perf_counter()
+    for frame in frames:
+        for state in states:
+            detector.process_frame(frame, state)
+    return time.perf_counter() - start
+
+
+def run_batched(detector, states, frames):
+    """Une passe YOLO par lot de K frames (une par flux)"""
+    start = time.perf_counter()
+    for frame in frames:
+        detector.process_batch([frame] * len(states), states)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FPS agrégé du mode multi-flux en fonction du nombre de caméras K")
+    parser.add_argument("--model", default=os.path.join(APP_DIR, "../models/best.pt"))
+    parser.add_argument("--tracker", default=os.path.join(APP_DIR, "bytetrack.yaml"))
+    parser.add_argument("--video", help="Vidéo de test (frames synthétiques sinon)")
+    parser.add_argument("--max-streams", type=int, default=8)
+    parser.add_argument("--frames", type=int, default=50, help="Frames par flux")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    detector = YOLOv8Detector(args.model, args.tracker)
+    frames = load_frames(args.video, args.frames, (args.width, args.height))
+
+    # Préchauffage
+    detector.process_batch(frames[:1], [detector.create_stream_state("warmup")])
+
+    results = []
+    k = 1
+    while k <= args.max_streams:
+        sequential = run_sequential(detector, [detector.create_stream_state(f"seq{k}_{i}") for i in range(k)], frames)
+        batched = run_batched(detector, [detector.create_stream_state(f"batch{k}_{i}") for i in range(k)], frames)
+        total = k * len(frames)
+        row = {
+            'streams': k,
+            'sequential_fps': round(total / sequential, 2),
+            'batched_fps': round(total / batched, 2),
+            'speedup': round(sequential / batched, 2),
+        }
+        results.append(row)
+        print(f"K={k:2d}  séquentiel: {row['sequential_fps']:7.2f} FPS  "
+              f"batch: {row['batched_fps']:7.2f} FPS  x{row['speedup']:.2f}")
+        k *= 2
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import argparse
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image
+from torchvision import transforms
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app"))
+from preprocessing import BatchPreprocessor, IMAGENET_MEAN, IMAGENET_STD
+
+
+def legacy_preprocess(images, transform, device):
+    """Ancien chemin : cvtColor + PIL + transform torchvision image par image, puis torch.cat"""
+    tensors = []
+    for image in images:
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        tensors.append(transform(Image.fromarray(image_rgb)).unsqueeze(0).to(device))
+    return torch.cat(tensors, dim=0)
+
+
+def make_crops(count, rng):
+    """Crops BGR de tailles variées, comme ceux du détecteur"""
+    crops = []
+    for _ in range(count):
+        h, w = rng.integers(80, 480), rng.integers(80, 640)
+        crop = rng.integers(0, 255, size=(h, w, 3), dtype=np.uint8)
+        # Des crops non contigus, comme les slices de frame
+        frame = np.zeros((h + 20, w + 20, 3), dtype=np.uint8)
+        frame[10:10 + h, 10:10 + w] = crop
+        crops.append(frame[10:10 + h, 10:10 + w])
+    return crops
+
+
+def time_per_batch(fn, batches, repeats):
+    start = time.perf_counter()
+    for _ in range(repeats):
+        for batch in batches:
+            fn(batch)
+    return (time.perf_counter() - start) * 1000.0 / (repeats * len(batches))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Temps de prétraitement par lot : torchvision/PIL vs BatchPreprocessor")
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--batches", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    rng = np.random.default_rng(0)
+    batches = [make_crops(args.batch_size, rng) for _ in range(args.batches)]
+
+    transform = transforms.Compose([
+        transforms.Resize((224, 224)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=list(IMAGENET_MEAN), std=list(IMAGENET_STD)),
+    ])
+    preprocessor = BatchPreprocessor(size=(224, 224), max_batch=args.batch_size, device=device)
+
+    # Écart numérique avec le transform actuel
+    max_diff, mean_diff = 0.0, 0.0
+    for batch in batches:
+        reference = legacy_preprocess(batch, transform, device)
+        candidate = preprocessor(batch)
+        diff = (reference - candidate).abs()
+        max_diff = max(max_diff, diff.max().item())
+        mean_diff += diff.mean().item() / len(batches)
+
+    legacy_ms = time_per_batch(lambda b: legacy_preprocess(b, transform, device), batches, args.repeats)
+    batched_ms = time_per_batch(preprocessor, batches, args.repeats)
+
+    print(f"Device: {device}, lot de {args.batch_size} crops")
+    print(f"torchvision/PIL   : {legacy_ms:8.3f} ms/lot")
+    print(f"BatchPreprocessor : {batched_ms:8.3f} ms/lot  (x{legacy_ms / batched_ms:.2f})")
+    print(f"Écart absolu (espace normalisé) : max={max_diff:.4f}, moyen={mean_diff:.5f}")
+
+
+if __name__ == "__main__":
+    main()
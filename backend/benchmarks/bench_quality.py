@@ -0,0 +1,102 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SyntheticConveyor
+from quality import QualityScorer, view_quality
+from track_table import TrackTable
+
+
+def visible_tracks(conveyor, ids):
+    """Identifiants stables et boxes (x1, y1, x2, y2) des colis visibles"""
+    track_ids, boxes = [], []
+    for p in conveyor.parcels:
+        x1, y1 = max(0, p['x']), max(0, p['y'])
+        x2, y2 = min(conveyor.width, p['x'] + p['w']), min(conveyor.height, p['y'] + p['h'])
+        if x2 - x1 > 4 and y2 - y1 > 4:
+            track_ids.append(ids.setdefault(id(p), len(ids) + 1))
+            boxes.append((x1, y1, x2, y2))
+    return np.asarray(track_ids, dtype=np.int64), np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score de qualité : calcul exact à chaque frame vs QualityScorer")
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--parcels", type=int, default=6)
+    parser.add_argument("--min-quality", type=float, default=0.5)
+    parser.add_argument("--screen-margin", type=float, default=0.1,
+                        help="Marge du criblage (QualityScorer.screen_margin)")
+    parser.add_argument("--sent-after", type=int, default=20,
+                        help="Frames au-dessus du seuil avant que le track soit considéré terminé")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    conveyor = SyntheticConveyor(args.width, args.height, parcels=args.parcels, seed=args.seed)
+    table = TrackTable()
+    scorer = QualityScorer(min_quality=args.min_quality, screen_margin=args.screen_margin)
+    ids, streaks = {}, {}
+    exact_time = cached_time = 0.0
+    diffs, kept_diffs, agree, compared = [], [], 0, 0
+    screened = screened_passing = 0
+    estimate_errors = []  # score exact - estimation du criblage (avec 10 lignes), boxes écartées
+
+    for frame in conveyor.frames(args.frames):
+        track_ids, boxes = visible_tracks(conveyor, ids)
+        slots = table.update(track_ids, boxes)
+        table.evict()
+
+        # Référence : score exact de chaque box à chaque frame (comportement précédent)
+        t0 = time.perf_counter()
+        exact = np.array([view_quality(frame[y1:y2, x1:x2])[0] for x1, y1, x2, y2 in boxes.tolist()])
+        exact_time += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        scores, debug = scorer.score(frame, table, slots, boxes,
+                                 lambda bbox, i: view_quality(frame[bbox[1]:bbox[3], bbox[0]:bbox[2]]))
+        cached_time += time.perf_counter() - t0
+
+        # Seules les décisions des tracks encore actifs comptent (les autres sont ignorés par le détecteur)
+        active = ~table.sent[slots]
+        diffs.extend(np.abs(scores[active] - exact[active]).tolist())
+        # Boxes retenues (non écartées par le criblage) : leur score doit être le score exact
+        kept = active & (scores >= args.min_quality)
+        kept_diffs.extend(np.abs(scores[kept] - exact[kept]).tolist())
+        # Criblage : une box écartée dont le score exact passe le seuil ne serait jamais mesurée
+        for i, data in debug.items():
+            if data.get('screened'):
+                screened += 1
+                screened_passing += int(exact[i] >= args.min_quality)
+                estimate_errors.append(exact[i] - data['quality_estimate'])
+        agree += int(np.count_nonzero((scores[active] >= args.min_quality) == (exact[active] >= args.min_quality)))
+        compared += int(np.count_nonzero(active))
+
+        above = exact >= args.min_quality
+        for track_id, slot, ok in zip(track_ids.tolist(), slots.tolist(), above.tolist()):
+            streaks[track_id] = streaks.get(track_id, 0) + 1 if ok else 0
+            table.sent[slot] |= streaks[track_id] >= args.sent_after
+
+    results = {
+        'frames': args.frames,
+        'exact_ms_per_frame': round(exact_time * 1000 / args.frames, 3),
+        'cached_ms_per_frame': round(cached_time * 1000 / args.frames, 3),
+        'speedup': round(exact_time / cached_time, 2) if cached_time else None,
+        'score_mean_abs_diff': round(float(np.mean(diffs)), 4) if diffs else 0.0,
+        'kept_score_max_abs_diff': round(float(np.max(kept_diffs)), 4) if kept_diffs else 0.0,
+        'screened_boxes': screened,
+        'screened_but_passing': screened_passing,
+        'screen_estimate_max_error': round(float(np.max(estimate_errors)), 4) if estimate_errors else None,
+        'decision_agreement': round(agree / compared, 4) if compared else 1.0,
+        'scorer': scorer.stats(),
+    }
+    print(json.dumps(results, indent=4))
+
+
+if __name__ == "__main__":
+    main()
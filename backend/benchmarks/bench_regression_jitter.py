@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SyntheticConveyor, APP_DIR
+from quality import FrameQualityMaps
+from dimension_service import DimensionEstimationService, percentile
+
+
+def frame_loop(service, args):
+    """
+    Boucle de frames cadencée à args.fps (travail NumPy/cv2 + Python comme le détecteur),
+    qui soumet des crops au service. Retourne les intervalles entre frames et le temps de travail.
+    """
+    conveyor = SyntheticConveyor(args.width, args.height, parcels=args.parcels, seed=0)
+    period = 1.0 / args.fps
+    intervals, work, futures = [], [], []
+    next_tick = time.perf_counter()
+    last = None
+
+    for index in range(args.frames):
+        start = time.perf_counter()
+        if last is not None:
+            intervals.append((start - last) * 1000.0)
+        last = start
+
+        frame = conveyor.next_frame()
+        boxes, _ = conveyor.ground_truth()
+        boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+        FrameQualityMaps(frame).ratios(boxes)
+        # Comptabilité Python par track, comme dans process_tracks
+        bookkeeping = {i: (x1, y1, x2 - x1, y2 - y1) for i, (x1, y1, x2, y2) in enumerate(boxes.tolist())}
+        if index % args.crop_every == 0:
+            for i, (x1, y1, w, h) in bookkeeping.items():
+                futures.append(service.add_task(("jitter", index, i), frame[y1:y1 + h, x1:x1 + w]))
+        work.append((time.perf_counter() - start) * 1000.0)
+
+        next_tick += period
+        delay = next_tick - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            next_tick = time.perf_counter()
+
+    for future in futures:
+        try:
+            future.result(timeout=120)
+        except Exception:
+            pass
+    return intervals, work
+
+
+def summarize(values, target=None):
+    summary = {
+        'p50_ms': round(percentile(values, 50), 2),
+        'p99_ms': round(percentile(values, 99), 2),
+        'max_ms': round(max(values), 2) if values else 0.0,
+    }
+    if target is not None:
+        deviation = np.abs(np.asarray(values) - target)
+        summary['jitter_std_ms'] = round(float(np.std(values)), 2)
+        summary['late_frames'] = int(np.count_nonzero(deviation > target * 0.5))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gigue de la boucle de frames : régression en thread vs en processus")
+    parser.add_argument("--real-models", action="store_true", help="ConvNeXtV2 réel (modèle de substitution sinon)")
+    parser.add_argument("--model-path", default=os.path.join(APP_DIR, "../models/model_dimensions.pt"))
+    parser.add_argument("--workers", type=int, nargs="+", default=[0, 1],
+                        help="Nombre de processus de régression à comparer (0 = thread)")
+    parser.add_argument("--backend", default="eager")
+    parser.add_argument("--fps", type=float, default=30.0)
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--crop-every", type=int, default=5, help="Frames entre deux soumissions de crops")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--parcels", type=int, default=4)
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    results = []
+    for workers in args.workers:
+        model = None
+        if not args.real_models:
+            from stand_in_models import StandInRegressor
+            model = StandInRegressor()
+        service = DimensionEstimationService(args.model_path, backend=args.backend, model=model, workers=workers)
+        # Attendre que les processus aient chargé leur modèle avant de mesurer
+        service.predict([np.zeros((64, 64, 3), dtype=np.uint8)], timeout=600)
+
+        intervals, work = frame_loop(service, args)
+        row = {
+            'workers': workers,
+            'frame_interval': summarize(intervals, 1000.0 / args.fps),
+            'frame_work': summarize(work),
+            'batcher': service.get_metrics(),
+        }
+        service.close()
+        results.append(row)
+        print(f"workers={workers}: intervalle p99={row['frame_interval']['p99_ms']} ms, "
+              f"gigue={row['frame_interval']['jitter_std_ms']} ms, travail p99={row['frame_work']['p99_ms']} ms")
+
+    output = json.dumps(results, indent=4, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app")
+DEFAULT_DIMENSION_MODEL = os.path.join(APP_DIR, "../models/model_dimensions.pt")
+DEFAULT_YOLO_MODEL = os.path.join(APP_DIR, "../models/best.pt")
+
+
+def timed(timings, name, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    timings[name] = round(time.perf_counter() - start, 3)
+    return result
+
+
+def child(args):
+    """Démarrage complet dans un interpréteur neuf : imports, poids, préchauffage"""
+    timings = {}
+    start = time.perf_counter()
+    torch = timed(timings, 'import_torch', __import__, 'torch')
+    timed(timings, 'import_timm', __import__, 'timm')
+    if not args.skip_yolo:
+        timed(timings, 'import_ultralytics', __import__, 'ultralytics')
+    sys.path.append(APP_DIR)
+    dimension_service = timed(timings, 'import_app', __import__, 'dimension_service')
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    service = dimension_service.DimensionEstimationService(
+        args.model, batch_size=args.batch_size, backend=args.backend, warmup=False,
+        calibration_path=os.path.join(args.tmp_dir, "calibration_factors.json"))
+    timings['dimension_weights'] = round(service.startup_times['weights'], 3)
+    timings['dimension_backend'] = round(service.startup_times['backend'], 3)
+    service.warmup()
+    timings['dimension_warmup'] = round(service.startup_times['warmup'], 3)
+
+    if not args.skip_yolo:
+        from yolov8 import YOLOv8Detector
+        detector = timed(timings, 'yolo_weights', YOLOv8Detector, args.yolo_model, dimension_service=service)
+        timings['yolo_warmup'] = round(detector.warmup(batch_sizes=(1, args.cameras)), 3)
+
+    timings['total'] = round(time.perf_counter() - start, 3)
+    timings['device'] = device.type
+    print(json.dumps(timings))
+
+
+def run(args, backend):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--backend", backend,
+               "--model", args.model, "--yolo-model", args.yolo_model, "--batch-size", str(args.batch_size),
+               "--cameras", str(args.cameras), "--tmp-dir", args.tmp_dir]
+    if args.skip_yolo:
+        command.append("--skip-yolo")
+    start = time.perf_counter()
+    output = subprocess.run(command, capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if output.returncode != 0:
+        print(f"{backend:12s} échec: {output.stderr.strip().splitlines()[-1:]}")
+        return None
+    timings = json.loads(output.stdout.strip().splitlines()[-1])
+    timings['wall'] = round(wall, 3)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Temps de démarrage du backend : imports, chargement des poids et préchauffage")
+    parser.add_argument("--backends", nargs="+", default=["eager", "torchscript", "onnx"])
+    parser.add_argument("--runs", type=int, default=2,
+                        help="Démarrages par backend (le premier crée l'artefact TorchScript / ONNX s'il manque)")
+    parser.add_argument("--model", default=DEFAULT_DIMENSION_MODEL)
+    parser.add_argument("--yolo-model", default=DEFAULT_YOLO_MODEL)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--cameras", type=int, default=1, help="Taille de lot YOLO du préchauffage (mode batched)")
+    parser.add_argument("--skip-yolo", action="store_true")
+    parser.add_argument("--tmp-dir", default="/tmp")
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--backend", default="eager", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    results = []
+    for backend in args.backends:
+        for run_index in range(args.runs):
+            timings = run(args, backend)
+            if timings is None:
+                break
+            timings.update(backend=backend, run=run_index + 1)
+            results.append(timings)
+            imports = sum(v for k, v in timings.items() if k.startswith('import_'))
+            weights = timings['dimension_weights'] + timings['dimension_backend'] + timings.get('yolo_weights', 0.0)
+            warmup = timings['dimension_warmup'] + timings.get('yolo_warmup', 0.0)
+            print(f"{backend:12s} #{run_index + 1}  imports={imports:6.2f}s  poids={weights:6.2f}s  "
+                  f"préchauffage={warmup:6.2f}s  total={timings['total']:6.2f}s  (processus {timings['wall']:.2f}s)")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
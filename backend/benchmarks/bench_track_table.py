@@ -0,0 +1,56 @@
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app"))
+from track_table import TrackTable
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Test d'endurance de la TrackTable : millions de tracks synthétiques")
+    parser.add_argument("--tracks", type=int, default=2_000_000, help="Nombre total de tracks (colis) à simuler")
+    parser.add_argument("--active", type=int, default=12, help="Tracks visibles simultanément")
+    parser.add_argument("--lifetime", type=int, default=60, help="Frames de présence d'un track")
+    parser.add_argument("--max-missed", type=int, default=120)
+    parser.add_argument("--report-every", type=int, default=200_000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    table = TrackTable(max_missed_frames=args.max_missed)
+    tracemalloc.start()
+
+    # Les tracks arrivent en continu : un nouveau track toutes les lifetime/active frames
+    frames = args.tracks * args.lifetime // args.active
+    arrival_period = args.lifetime / args.active
+    next_report = args.report_every
+    start = time.perf_counter()
+    update_time = 0.0
+
+    for frame_index in range(frames):
+        newest = int(frame_index / arrival_period)
+        track_ids = np.arange(max(0, newest - args.active + 1), newest + 1, dtype=np.int64)
+        offsets = (frame_index - track_ids * arrival_period).astype(np.int32)
+        bboxes = np.stack([offsets * 4, np.full_like(offsets, 100), offsets * 4 + 200, np.full_like(offsets, 300)], axis=1)
+        bboxes += rng.integers(-2, 3, size=bboxes.shape, dtype=np.int32)
+
+        t0 = time.perf_counter()
+        table.update(track_ids, bboxes)
+        table.evict()
+        update_time += time.perf_counter() - t0
+
+        if newest >= next_report:
+            current, peak = tracemalloc.get_traced_memory()
+            print(f"{newest:>10,d} tracks vus  actifs={len(table):4d}  capacité={table.capacity:5d}  "
+                  f"tableaux={table.nbytes() / 1024:7.1f} Kio  python={current / 1024:8.1f} Kio (pic {peak / 1024:.1f})  "
+                  f"{update_time * 1e6 / (frame_index + 1):6.1f} µs/frame")
+            next_report += args.report_every
+
+    print(f"Terminé en {time.perf_counter() - start:.1f} s ({frames:,d} frames)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic import SyntheticConveyor
+from stand_in_models import build_detector
+from dimension_service import percentile
+from stream_protocol import pack_message
+
+
+class StageTimer:
+    """Latences (ms) d'une étape, alimentées depuis n'importe quel thread"""
+
+    def __init__(self):
+        self.samples = []
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.samples.append(seconds * 1000.0)
+
+    def summary(self):
+        with self._lock:
+            samples = list(self.samples)
+        if not samples:
+            return {'count': 0}
+        return {
+            'count': len(samples),
+            'mean_ms': round(sum(samples) / len(samples), 3),
+            'p50_ms': round(percentile(samples, 50), 3),
+            'p99_ms': round(percentile(samples, 99), 3),
+            'total_ms': round(sum(samples), 1),
+        }
+
+
+def timed(fn, timer):
+    """Enveloppe une fonction / un objet appelable pour chronométrer chaque appel"""
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            timer.add(time.perf_counter() - start)
+    return wrapper
+
+
+def rss_mb():
+    """Mémoire résidente actuelle du processus (Mo)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def instrument(detector):
+    """Chronomètre chaque étape du détecteur sans modifier son code"""
+    stages = {name: StageTimer() for name in ('detect', 'track', 'quality', 'crop', 'preprocess', 'regress', 'encode')}
+    service = detector.dimension_service
+    detector.model.predict = timed(detector.model.predict, stages['detect'])
+    detector.update_tracker = timed(detector.update_tracker, stages['track'])
+    detector.calculate_view_quality = timed(detector.calculate_view_quality, stages['quality'])
+    service.add_task = timed(service.add_task, stages['crop'])
+    service.preprocessor = timed(service.preprocessor, stages['preprocess'])
+    backend = service.backend
+    service.backend = timed(backend, stages['regress'])
+    service.backend.name = backend.name
+    service.backend.device = backend.device
+    return stages
+
+
+def bench_detector(detector, stages, args):
+    """YOLOv8Detector.process_frame + encodage JPEG sur la vidéo synthétique"""
+    conveyor = SyntheticConveyor(args.width, args.height, parcels=args.parcels, seed=args.seed)
+    service = detector.dimension_service
+    queue_depths = []
+    frame_times = StageTimer()
+    rss_start = rss_mb()
+    dimensions = 0
+
+    for frame in conveyor.frames(args.warmup):
+        detector.process_frame(frame)
+
+    start = time.perf_counter()
+    for frame in conveyor.frames(args.frames):
+        t0 = time.perf_counter()
+        processed_frame, _, dimensions_data = detector.process_frame(frame)
+        t1 = time.perf_counter()
+        cv2.imencode('.jpg', processed_frame, [int(cv2.IMWRITE_JPEG_QUALITY), 70])
+        stages['encode'].add(time.perf_counter() - t1)
+        frame_times.add(t1 - t0)
+        dimensions += len(dimensions_data)
+        queue_depths.append(service.task_queue.qsize())
+    elapsed = time.perf_counter() - start
+
+    return {
+        'frames': args.frames,
+        'fps': round(args.frames / elapsed, 2),
+        'frame': frame_times.summary(),
+        'stages': {name: timer.summary() for name, timer in stages.items()},
+        'dimensions_emitted': dimensions,
+        'queue_depth_max': max(queue_depths) if queue_depths else 0,
+        'queue_depth_mean': round(float(np.mean(queue_depths)), 2) if queue_depths else 0.0,
+        'rss_mb_start': round(rss_start, 1),
+        'rss_mb_end': round(rss_mb(), 1),
+    }
+
+
+def bench_dimension_service(service, args):
+    """Débit et latence du micro-batcher sous une rafale de crops"""
+    rng = np.random.default_rng(args.seed)
+    crops = [rng.integers(0, 255, size=(int(rng.integers(80, 300)), int(rng.integers(80, 300)), 3), dtype=np.uint8)
+             for _ in range(32)]
+    latencies = StageTimer()
+    depth = []
+
+    start = time.perf_counter()
+    futures = []
+    for i in range(args.tasks):
+        submitted = time.perf_counter()
+        future = service.add_task(("bench", i), crops[i % len(crops)])
+        future.add_done_callback(lambda f, s=submitted: latencies.add(time.perf_counter() - s))
+        futures.append(future)
+        depth.append(service.task_queue.qsize())
+        if args.task_interval:
+            time.sleep(args.task_interval)
+    for future in futures:
+        future.result(timeout=60)
+    elapsed = time.perf_counter() - start
+    for i in range(args.tasks):
+        service.ack_result(("bench", i))
+
+    return {
+        'tasks': args.tasks,
+        'throughput_per_s': round(args.tasks / elapsed, 2),
+        'latency': latencies.summary(),
+        'queue_depth_max': max(depth) if depth else 0,
+        'batcher': service.get_metrics(),
+    }
+
+
+async def _consume(subscriber, camera, duration, counters):
+    """Abonné WebSocket simulé : consomme les frames comme le ferait /ws"""
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline and not subscriber.closed:
+        packet = await subscriber.next_frame(timeout=0.5)
+        dimensions = subscriber.drain_dimensions()
+        if packet is None:
+            continue
+        send_started = time.perf_counter()
+        if subscriber.protocol == "binary":
+            payload = pack_message(packet, dimensions, send_started)
+        else:
+            payload = packet.jpeg_bytes
+        counters['bytes'] += len(payload)
+        await asyncio.sleep(0)  # point de suspension équivalent à un send non bloquant
+        subscriber.record_sent(len(payload), packet, time.perf_counter() - send_started)
+        camera.pipeline.record_sent(packet, send_started)
+        counters['frames'] += 1
+
+
+async def _bench_ws(detector, video_path, args):
+    from camera_registry import CameraRegistry, Subscriber
+
+    loop = asyncio.get_running_loop()
+    registry = CameraRegistry(detector, {"bench": video_path}, batched=True)
+    subscribers, counters, camera = [], [], None
+    for i in range(args.subscribers):
+        protocol = args.ws_protocol if args.ws_protocol != "mixed" else ("json", "binary")[i % 2]
+        subscriber = Subscriber(loop, jpeg_quality=70 if i % 2 == 0 else 50, protocol=protocol,
+                                max_width=args.ws_width if protocol == "binary" else None)
+        camera = await loop.run_in_executor(None, registry.subscribe, "bench", subscriber)
+        subscribers.append(subscriber)
+        counters.append({'frames': 0, 'bytes': 0})
+
+    await asyncio.gather(*[_consume(s, camera, args.duration, c) for s, c in zip(subscribers, counters)])
+    stats = registry.get_stats()
+    for subscriber in subscribers:
+        await loop.run_in_executor(None, registry.unsubscribe, "bench", subscriber)
+
+    return {
+        'subscribers': args.subscribers,
+        'fps_per_subscriber': [round(c['frames'] / args.duration, 2) for c in counters],
+        'mbps_per_subscriber': [round(c['bytes'] * 8 / args.duration / 1e6, 2) for c in counters],
+        'dropped_per_subscriber': [s.dropped for s in subscribers],
+        'clients': [s.stats() for s in subscribers],
+        'pipeline': stats,
+    }
+
+
+def bench_ws(detector, args):
+    """Chemin /ws : CameraRegistry -> pipeline -> abonnés, alimenté par une vidéo synthétique"""
+    with tempfile.TemporaryDirectory() as tmp:
+        video_path = SyntheticConveyor(args.width, args.height, parcels=args.parcels, seed=args.seed) \
+            .write_video(os.path.join(tmp, "conveyor.mp4"), int(args.duration * 30) + 60)
+        return asyncio.run(_bench_ws(detector, video_path, args))
+
+
+def compare(results, baseline_path, tolerance):
+    """Signale les régressions de FPS / latence par rapport à un fichier de résultats précédent"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    checks = [
+        ('detector.fps', lambda r: r['detector']['fps'], True),
+        ('detector.frame.p50_ms', lambda r: r['detector']['frame']['p50_ms'], False),
+        ('dimension_service.throughput_per_s', lambda r: r['dimension_service']['throughput_per_s'], True),
+        ('dimension_service.latency.p99_ms', lambda r: r['dimension_service']['latency']['p99_ms'], False),
+    ]
+    for name, get, higher_is_better in checks:
+        try:
+            old, new = get(baseline), get(results)
+        except (KeyError, TypeError):
+            continue
+        change = (new - old) / old if old else 0.0
+        if (higher_is_better and change < -tolerance) or (not higher_is_better and change > tolerance):
+            regressions.append({'metric': name, 'baseline': old, 'current': new, 'change': round(change, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de bout en bout sans caméra ni GPU")
+    parser.add_argument("--real-models", action="store_true",
+                        help="Utiliser les vrais poids YOLO/ConvNeXt (modèles de substitution sinon)")
+    parser.add_argument("--suites", nargs="+", default=["detector", "dimension_service", "ws"],
+                        choices=["detector", "dimension_service", "ws"])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--parcels", type=int, default=3)
+    parser.add_argument("--tasks", type=int, default=200, help="Crops soumis au service de dimensions")
+    parser.add_argument("--task-interval", type=float, default=0.0)
+    parser.add_argument("--subscribers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=10.0, help="Durée du benchmark /ws (s)")
+    parser.add_argument("--ws-protocol", choices=["json", "binary", "mixed"], default="json",
+                        help="Protocole des abonnés simulés (mixed : alterné)")
+    parser.add_argument("--ws-width", type=int, help="Largeur max des frames des abonnés binaires")
+    parser.add_argument("--multi-view", action="store_true", help="Estimation multi-vues (fusion des meilleurs crops)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    parser.add_argument("--baseline", help="Résultats précédents à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Écart toléré avant de signaler une régression")
+    args = parser.parse_args()
+
+    detector = build_detector(real=args.real_models, fusion=args.multi_view)
+    results = {
+        'config': dict(vars(args), python=platform.python_version(), machine=platform.machine(),
+                       cpus=os.cpu_count()),
+    }
+
+    if "detector" in args.suites:
+        stages = instrument(detector)
+        results['detector'] = bench_detector(detector, stages, args)
+        print(f"[detector] {results['detector']['fps']} FPS, frame p50={results['detector']['frame']['p50_ms']} ms")
+    if "dimension_service" in args.suites:
+        results['dimension_service'] = bench_dimension_service(detector.dimension_service, args)
+        print(f"[dimension_service] {results['dimension_service']['throughput_per_s']} crops/s, "
+              f"p99={results['dimension_service']['latency'].get('p99_ms')} ms")
+    if "ws" in args.suites:
+        results['ws'] = bench_ws(detector, args)
+        print(f"[ws] FPS par abonné: {results['ws']['fps_per_subscriber']}")
+
+    if args.baseline:
+        results['regressions'] = compare(results, args.baseline, args.tolerance)
+        for r in results['regressions']:
+            print(f"RÉGRESSION {r['metric']}: {r['baseline']} -> {r['current']} ({r['change']:+.1%})")
+
+    output = json.dumps(results, indent=4, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.baseline and results['regressions']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+import torch
+import torch.nn as nn
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from synthetic import APP_DIR
+
+DEFAULT_MODEL_PATH = os.path.join(APP_DIR, "../models/best.pt")
+DEFAULT_TRACKER_CONFIG = os.path.join(APP_DIR, "bytetrack.yaml")
+
+
+class _StandInResult:
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+class StandInYOLO:
+    """
+    Détecteur de substitution : seuillage + contours sur la frame (quelques ms sur CPU).
+    Même interface que YOLO.predict() pour le détecteur, sans poids ni GPU.
+    """
+
+    def __init__(self, min_area=400):
+        self.min_area = min_area
+        from ultralytics.engine.results import Boxes
+        self._boxes_cls = Boxes
+
+    def _detect(self, frame):
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        _, mask = cv2.threshold(gray, 85, 255, cv2.THRESH_BINARY)
+        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, np.ones((7, 7), np.uint8))
+        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        rows = []
+        for contour in contours:
+            x, y, w, h = cv2.boundingRect(contour)
+            if w * h >= self.min_area:
+                rows.append([x, y, x + w, y + h, 0.9, 0.0])
+        data = torch.tensor(rows, dtype=torch.float32).reshape(-1, 6)
+        return _StandInResult(self._boxes_cls(data, frame.shape[:2]))
+
+    def predict(self, source, conf=0.5, iou=0.4, verbose=False, **kwargs):
+        frames = source if isinstance(source, list) else [source]
+        return [self._detect(frame) for frame in frames]
+
+
+class StandInRegressor(nn.Module):
+    """Petit CNN de substitution au ConvNeXtV2 : même entrée (N, 3, 224, 224), même sortie (N, 3)"""
+
+    def __init__(self):
+        super().__init__()
+        self.features = nn.Sequential(
+            nn.Conv2d(3, 16, 5, stride=4), nn.ReLU(),
+            nn.Conv2d(16, 32, 3, stride=2), nn.ReLU(),
+            nn.AdaptiveAvgPool2d(1), nn.Flatten(),
+        )
+        self.fc = nn.Linear(32, 3)
+        nn.init.zeros_(self.fc.weight)
+        with torch.no_grad():
+            self.fc.bias.copy_(torch.tensor([90.0, 70.0, 30.0]))
+
+    def forward(self, x):
+        return self.fc(self.features(x))
+
+
+def build_detector(real=False, model_path=DEFAULT_MODEL_PATH, tracker_config=DEFAULT_TRACKER_CONFIG, fusion=None,
+                   **service_kwargs):
+    """YOLOv8Detector avec les vrais poids, ou avec les modèles de substitution"""
+    from yolov8 import YOLOv8Detector
+    from dimension_service import DimensionEstimationService
+
+    if real:
+        dimension_service = None
+        if service_kwargs:
+            dimension_service = DimensionEstimationService(
+                os.path.join(APP_DIR, "../models/model_dimensions.pt"), **service_kwargs)
+        return YOLOv8Detector(model_path, tracker_config, dimension_service=dimension_service, fusion=fusion)
+
+    service = DimensionEstimationService(None, model=StandInRegressor(), **service_kwargs)
+    return YOLOv8Detector(model_path, tracker_config, model=StandInYOLO(), dimension_service=service, fusion=fusion)
@@ -0,0 +1,85 @@
+import os
+import sys
+
+import cv2
+import numpy as np
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app")
+sys.path.append(APP_DIR)
+
+
+class SyntheticConveyor:
+    """
+    Vidéo synthétique d'un convoyeur : des colis texturés traversent la frame de gauche à droite.
+    Chaque colis a des dimensions réelles (cm) connues, pour mesurer l'erreur d'estimation.
+    """
+
+    def __init__(self, width=640, height=480, parcels=3, speed=6, seed=0, idle_frames=0):
+        self.width = width
+        self.height = height
+        self.speed = speed
+        self.idle_frames = idle_frames  # frames vides entre deux vagues de colis
+        self.rng = np.random.default_rng(seed)
+        self.parcels = [self._new_parcel(i * width // max(parcels, 1)) for i in range(parcels)]
+        self.frame_index = 0
+        self._belt = self._make_belt()
+
+    def _make_belt(self):
+        belt = np.full((self.height, self.width, 3), 70, dtype=np.uint8)
+        noise = self.rng.integers(0, 12, size=belt.shape, dtype=np.uint8)
+        belt = cv2.add(belt, noise)
+        for y in range(0, self.height, 40):
+            cv2.line(belt, (0, y), (self.width, y), (60, 60, 60), 1)
+        return belt
+
+    def _new_parcel(self, x):
+        length_cm, width_cm, height_cm = self.rng.uniform(15, 80), self.rng.uniform(10, 60), self.rng.uniform(5, 50)
+        w = int(length_cm * self.width / 320)
+        h = int(width_cm * self.height / 240)
+        y = int(self.rng.integers(0, max(1, self.height - h)))
+        color = tuple(int(c) for c in self.rng.integers(90, 200, size=3))
+        return {'x': x - w, 'y': y, 'w': w, 'h': h, 'color': color,
+                'dims': (length_cm, width_cm, height_cm)}
+
+    def ground_truth(self):
+        """Boxes (x1, y1, x2, y2) visibles et dimensions réelles associées"""
+        boxes, dims = [], []
+        for p in self.parcels:
+            x1, y1 = max(0, p['x']), max(0, p['y'])
+            x2, y2 = min(self.width, p['x'] + p['w']), min(self.height, p['y'] + p['h'])
+            if x2 - x1 > 4 and y2 - y1 > 4:
+                boxes.append((x1, y1, x2, y2))
+                dims.append(p['dims'])
+        return boxes, dims
+
+    def next_frame(self):
+        self.frame_index += 1
+        frame = self._belt.copy()
+        cycle = self.width // self.speed + self.idle_frames
+        idle = self.idle_frames and (self.frame_index % cycle) >= cycle - self.idle_frames
+
+        for i, p in enumerate(self.parcels):
+            p['x'] += self.speed
+            if p['x'] > self.width:
+                self.parcels[i] = p = self._new_parcel(0)
+            if idle:
+                continue
+            x1, y1, x2, y2 = p['x'], p['y'], p['x'] + p['w'], p['y'] + p['h']
+            cv2.rectangle(frame, (x1, y1), (x2, y2), p['color'], -1)
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (30, 30, 30), 2)
+            # Ruban adhésif et étiquette : des lignes pour la détection de contours
+            cv2.line(frame, ((x1 + x2) // 2, y1), ((x1 + x2) // 2, y2), (220, 220, 200), 3)
+            cv2.rectangle(frame, (x1 + 5, y1 + 5), (x1 + p['w'] // 3, y1 + p['h'] // 4), (240, 240, 240), -1)
+        return frame
+
+    def frames(self, count):
+        for _ in range(count):
+            yield self.next_frame()
+
+    def write_video(self, path, count, fps=30):
+        """Écrit count frames dans un fichier vidéo (pour les benchmarks passant par cv2.VideoCapture)"""
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (self.width, self.height))
+        for frame in self.frames(count):
+            writer.write(frame)
+        writer.release()
+        return path
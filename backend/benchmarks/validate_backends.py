@@ -0,0 +1,134 @@
+import argparse
+import copy
+import csv
+import json
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app"))
+from dimension_service import ConvNeXtV2Regressor, percentile
+from inference_backends import BACKENDS, create_backend
+from preprocessing import BatchPreprocessor
+
+APP_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "../app")
+AXES = ('length_cm', 'width_cm', 'height_cm')
+
+
+def load_dataset(images_dir, labels_path, limit):
+    """Images BGR du jeu de validation + dimensions réelles (CSV: image,length_cm,width_cm,height_cm)"""
+    labels = {}
+    if labels_path:
+        with open(labels_path, newline='') as f:
+            for row in csv.DictReader(f):
+                name = row.get('image') or row.get('filename')
+                labels[name] = [float(row[axis]) for axis in AXES]
+
+    names = sorted(n for n in os.listdir(images_dir) if n.lower().endswith(('.jpg', '.jpeg', '.png')))
+    if labels:
+        names = [n for n in names if n in labels]
+    names = names[:limit] if limit else names
+
+    images, targets = [], []
+    for name in names:
+        image = cv2.imread(os.path.join(images_dir, name))
+        if image is None:
+            continue
+        images.append(image)
+        targets.append(labels.get(name))
+    return images, targets
+
+
+def predict(backend, batches):
+    return np.concatenate([backend(batch) for batch in batches], axis=0)
+
+
+def measure(backend, batches, single, repeats):
+    """Débit (images/s) sur les lots et latence (ms) d'une image seule"""
+    backend(batches[0])  # préchauffage
+    start = time.perf_counter()
+    count = 0
+    for _ in range(repeats):
+        for batch in batches:
+            backend(batch)
+            count += batch.shape[0]
+    throughput = count / (time.perf_counter() - start)
+
+    latencies = []
+    for _ in range(max(repeats * 10, 20)):
+        start = time.perf_counter()
+        backend(single)
+        latencies.append((time.perf_counter() - start) * 1000.0)
+    return throughput, percentile(latencies, 50), percentile(latencies, 99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare les backends d'inférence du régresseur de dimensions")
+    parser.add_argument("images_dir", help="Dossier d'images du jeu de validation (held-out)")
+    parser.add_argument("--labels", help="CSV des dimensions réelles (image,length_cm,width_cm,height_cm)")
+    parser.add_argument("--model", default=os.path.join(APP_DIR, "../models/model_dimensions.pt"))
+    parser.add_argument("--backends", nargs="+", default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--channels-last", action="store_true")
+    parser.add_argument("--output", help="Fichier JSON de résultats")
+    args = parser.parse_args()
+
+    device = torch.device("cpu")
+    model = ConvNeXtV2Regressor()
+    model.load_state_dict(torch.load(args.model, map_location=device))
+    model.eval()
+
+    images, targets = load_dataset(args.images_dir, args.labels, args.limit)
+    if not images:
+        print("Aucune image trouvée")
+        return
+
+    preprocessor = BatchPreprocessor(size=(224, 224), max_batch=args.batch_size, device=device)
+    batches = [preprocessor(images[i:i + args.batch_size]).clone() for i in range(0, len(images), args.batch_size)]
+    single = batches[0][:1].clone()
+    has_labels = all(t is not None for t in targets)
+    truth = np.array(targets, dtype=np.float32) if has_labels else None
+
+    reference = predict(create_backend("eager", copy.deepcopy(model), device), batches)
+
+    results = []
+    for name in args.backends:
+        try:
+            backend = create_backend(name, copy.deepcopy(model), device, model_path=args.model,
+                                     batch_size=args.batch_size, channels_last=args.channels_last,
+                                     calibration_batches=batches[:16])
+        except Exception as e:
+            print(f"{name:18s} indisponible: {e}")
+            continue
+
+        predictions = predict(backend, batches)
+        delta = np.abs(predictions - reference)
+        throughput, p50, p99 = measure(backend, batches, single, args.repeats)
+        row = {
+            'backend': name,
+            'delta_vs_fp32_cm_mean': round(float(delta.mean()), 3),
+            'delta_vs_fp32_cm_max': round(float(delta.max()), 3),
+            'delta_vs_fp32_cm_per_axis': [round(float(v), 3) for v in delta.mean(axis=0)],
+            'mae_vs_truth_cm': round(float(np.abs(predictions - truth).mean()), 3) if has_labels else None,
+            'throughput_img_s': round(throughput, 2),
+            'latency_p50_ms': round(p50, 2),
+            'latency_p99_ms': round(p99, 2),
+        }
+        results.append(row)
+        print(f"{name:18s} Δfp32 moyen={row['delta_vs_fp32_cm_mean']:6.3f} cm  max={row['delta_vs_fp32_cm_max']:6.3f} cm  "
+              f"MAE={row['mae_vs_truth_cm']}  {row['throughput_img_s']:7.2f} img/s  "
+              f"p50={row['latency_p50_ms']:.1f} ms  p99={row['latency_p99_ms']:.1f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()